@@ -0,0 +1,5 @@
+from utils.images import track_renditions
+from .models import CustomUser
+
+
+track_renditions(CustomUser, 'profile_image', ('thumb',))
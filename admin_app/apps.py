@@ -4,6 +4,10 @@ from django.apps import AppConfig
 class AdminAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "admin_app"
+    default = True
+
+    def ready(self):
+        import admin_app.signals
 
 
 class CouponsConfig(AppConfig):
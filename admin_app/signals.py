@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from utils.images import track_renditions
+from .models import Banner, Coupon, UserCoupon
+from .utils import bump_coupon_version
+
+
+track_renditions(Banner, 'image', ('card', 'zoom'))
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+@receiver(post_save, sender=UserCoupon)
+@receiver(post_delete, sender=UserCoupon)
+def coupon_changed(sender, instance, **kwargs):
+    # which coupons a basket qualifies for
+    transaction.on_commit(bump_coupon_version)
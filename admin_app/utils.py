@@ -2,6 +2,7 @@ from .models import Coupon
 from accounts.models import generate_referrer_code
 from decimal import Decimal 
 from django.utils import timezone
+from utils.cache import get_version, bump_version
 
 
 def reward_referrer(referrer_user):
@@ -18,3 +19,19 @@ def reward_referrer(referrer_user):
         expires_at=timezone.now() + timezone.timedelta(days=30),
     )
     return coupon
+
+
+# ----------------------------
+#   COUPON VERSION
+# ----------------------------
+
+# bumped whenever a coupon is edited or used, retires cached basket snapshots
+COUPON_VERSION_KEY = 'admin_app:coupon_version'
+
+
+def coupon_version():
+    return get_version(COUPON_VERSION_KEY)
+
+
+def bump_coupon_version():
+    bump_version(COUPON_VERSION_KEY)
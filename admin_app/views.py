@@ -73,13 +73,13 @@ def admin_dashboard(request):
     # Top Selling Products 
 
     products_page = request.GET.get('products_page', 1)
-    top_products_queryset = Product.objects.annotate(
-        total_quantity_sold=Sum('variants__orderitems__quantity'),
-        total_revenue=Sum(F('variants__orderitems__quantity') * F('variants__orderitems__price_at_purchase')),
-        order_count=Count('variants__orderitems__id', distinct=True)
-    ).filter(
-        total_quantity_sold__isnull=False
-    ).order_by('-total_quantity_sold')
+    top_products_queryset = Product.objects.filter(
+        sales_stats__units_sold__gt=0
+    ).annotate(
+        total_quantity_sold=F('sales_stats__units_sold'),
+        total_revenue=F('sales_stats__revenue'),
+        order_count=F('sales_stats__order_count')
+    ).select_related('category').order_by('-total_quantity_sold', 'id')
 
     products_paginator = Paginator(top_products_queryset, 10)
     top_products = products_paginator.get_page(products_page)
@@ -88,13 +88,13 @@ def admin_dashboard(request):
     # Top Selling Categories (Paginated)
 
     categories_page = request.GET.get('categories_page', 1)
-    top_categories_queryset = Category.objects.annotate(
-        total_quantity_sold=Sum('products__variants__orderitems__quantity'),
-        total_revenue=Sum(F('products__variants__orderitems__quantity') * F('products__variants__orderitems__price_at_purchase')),
-        order_count=Count('products__variants__orderitems__id', distinct=True)
-    ).filter(
-        total_quantity_sold__isnull=False
-    ).order_by('-total_quantity_sold')
+    top_categories_queryset = Category.objects.filter(
+        sales_stats__units_sold__gt=0
+    ).annotate(
+        total_quantity_sold=F('sales_stats__units_sold'),
+        total_revenue=F('sales_stats__revenue'),
+        order_count=F('sales_stats__order_count')
+    ).order_by('-total_quantity_sold', 'id')
 
     categories_paginator = Paginator(top_categories_queryset, 10)
     top_categories = categories_paginator.get_page(categories_page)
@@ -233,7 +233,7 @@ def admin_user(request):
         users = users.filter(is_active=False)
 
     #pagination
-    page_obj = get_pagination(request, users, per_page=5)
+    page_obj = get_pagination(request, users, per_page=5, cached_count=True)
 
 
     context = {
@@ -381,9 +381,7 @@ def sales_report(request):
 
 
   
-    paginator = Paginator(orders, 10)
-    page_number = request.GET.get('page')
-    orders = paginator.get_page(page_number)
+    orders = get_pagination(request, orders, per_page=10, cached_count=True)
 
     context = {
         'orders': orders,
@@ -13,11 +13,13 @@ class Basket(models.Model):
 
     @property
     def total_price(self):
-        return sum(item.subtotal for item in self.items.all())
+        from .utils import get_basket_snapshot
+        return get_basket_snapshot(self.user_id)['subtotal']
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        from .utils import get_basket_snapshot
+        return get_basket_snapshot(self.user_id)['item_count']
 
 class BasketItem(models.Model):
     basket = models.ForeignKey(Basket, on_delete=models.CASCADE, related_name="items")
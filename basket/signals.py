@@ -0,0 +1,29 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Basket, BasketItem
+from .utils import GUEST_BASKET_SESSION_KEY, basket_owner_id, bump_basket_version, merge_guest_basket
+
+
+def _schedule_version_bump(user_id):
+    if user_id is not None:
+        transaction.on_commit(lambda: bump_basket_version(user_id))
+
+
+@receiver(post_save, sender=BasketItem)
+@receiver(post_delete, sender=BasketItem)
+def basket_item_changed(sender, instance, **kwargs):
+    _schedule_version_bump(basket_owner_id(instance))
+
+
+@receiver(post_delete, sender=Basket)
+def basket_deleted(sender, instance, **kwargs):
+    _schedule_version_bump(instance.user_id)
+
+
+@receiver(user_logged_in)
+def guest_basket_login(sender, request, user, **kwargs):
+    # login() keeps the session data of an anonymous visitor
+    if request is not None and GUEST_BASKET_SESSION_KEY in request.session:
+        merge_guest_basket(user, request.session)
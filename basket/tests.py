@@ -1,3 +1,85 @@
+from decimal import Decimal
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from accounts.models import CustomUser
+from category.models import Category
+from products.models import Product, ProductVariant
+from .models import Basket, BasketItem
+from .utils import GUEST_BASKET_SESSION_KEY, get_guest_basket, merge_guest_basket
 
 # Create your tests here.
+
+
+class BasketAddTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email='buyer@example.com', full_name='Buyer', password='pw', is_active=True)
+        category = Category.objects.create(name='Protein')
+        product = Product.objects.create(name='Whey', description='desc', category=category)
+        cls.variant = ProductVariant.objects.create(
+            product=product, price=Decimal('100'), stock=5, max_quantity_per_order=3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def add(self, quantity):
+        return self.client.post(
+            reverse('basket_add'), {'variant_id': self.variant.id, 'quantity': quantity},
+            headers={'x-requested-with': 'XMLHttpRequest'}).json()
+
+    def quantities(self):
+        return list(BasketItem.objects.values_list('quantity', flat=True))
+
+    def test_adds_up_on_one_line(self):
+        self.assertTrue(self.add(1)['success'])
+        self.assertTrue(self.add(2)['success'])
+        self.assertEqual(self.quantities(), [3])
+
+    def test_new_line_over_the_per_order_limit(self):
+        self.assertEqual(self.add(4), {'success': False, 'error': 'Max 3 allowed.'})
+        self.assertEqual(self.quantities(), [])
+
+    def test_new_line_over_the_stock(self):
+        self.assertEqual(
+            self.add(6), {'success': False, 'error': 'Only 5 items available in stock.'})
+        self.assertEqual(self.quantities(), [])
+
+    def test_increment_over_the_per_order_limit(self):
+        self.add(2)
+        self.assertEqual(self.add(2), {'success': False, 'error': 'Max 3 allowed.'})
+        self.assertEqual(self.quantities(), [2])
+
+
+class GuestBasketTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email='buyer@example.com', full_name='Buyer', password='pw', is_active=True)
+        category = Category.objects.create(name='Protein')
+        product = Product.objects.create(name='Whey', description='desc', category=category)
+        cls.variant = ProductVariant.objects.create(
+            product=product, price=Decimal('100'), stock=5, max_quantity_per_order=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_guest_add_over_the_per_order_limit(self):
+        response = self.client.post(
+            reverse('basket_add'), {'variant_id': self.variant.id, 'quantity': 4},
+            headers={'x-requested-with': 'XMLHttpRequest'})
+
+        self.assertEqual(response.json(), {'success': False, 'error': 'Max 3 allowed.'})
+        self.assertEqual(get_guest_basket(self.client.session), {})
+
+    def test_merge_caps_at_the_per_order_limit(self):
+        basket = Basket.objects.create(user=self.user)
+        BasketItem.objects.create(basket=basket, variant=self.variant, quantity=2)
+
+        merge_guest_basket(self.user, {GUEST_BASKET_SESSION_KEY: {str(self.variant.id): 2}})
+
+        self.assertEqual(list(BasketItem.objects.values_list('quantity', flat=True)), [3])
@@ -0,0 +1,382 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils import timezone
+from utils.cache import get_version, bump_version
+
+
+# ----------------------------
+#   BASKET PRICING SNAPSHOT
+# ----------------------------
+
+# bumped on every item add/update/remove, the timeout only bounds stale entries
+BASKET_SNAPSHOT_SECONDS = 30 * 60
+
+
+def _basket_version_key(user_id):
+    return f"basket:version:{user_id}"
+
+
+def basket_version(user_id):
+    return get_version(_basket_version_key(user_id))
+
+
+def bump_basket_version(user_id):
+    bump_version(_basket_version_key(user_id))
+
+
+def basket_owner_id(item):
+    """
+    User id of a BasketItem's basket, looked up at most once per instance.
+    """
+    from .models import Basket, BasketItem
+
+    if '_basket_owner_id' not in item.__dict__:
+        # the basket is usually loaded already (get_or_create, basket.items)
+        if BasketItem.basket.is_cached(item):
+            user_id = item.basket.user_id
+        else:
+            user_id = Basket.objects.filter(
+                pk=item.basket_id).values_list('user_id', flat=True).first()
+        item.__dict__['_basket_owner_id'] = user_id
+    return item.__dict__['_basket_owner_id']
+
+
+def load_basket_items(user_id):
+    """
+    A user's basket items with everything the basket and checkout pages show,
+    their variants priced in SQL by ProductVariant.objects.with_pricing().
+    """
+    from products.models import ProductVariant
+    from .models import BasketItem
+
+    variants = ProductVariant.objects.with_pricing().select_related(
+        'product__category', 'product__primary_image', 'flavor', 'weight')
+
+    return list(
+        BasketItem.objects.filter(basket__user_id=user_id)
+        .prefetch_related(Prefetch('variant', queryset=variants))
+        .order_by('id'))
+
+
+def _line_totals(line):
+    for total, unit in (('line_total', 'price'), ('line_original', 'original_price'),
+                        ('line_save', 'save_price')):
+        line[total] = line[unit] * line['quantity']
+    return line
+
+
+def _price_line(item, info):
+    return _line_totals({
+        'variant_id': item.variant_id,
+        'product_id': item.variant.product_id,
+        'quantity': item.quantity,
+        'stock': item.variant.stock,
+        'price': info['price'],
+        'original_price': info['original_price'],
+        'save_price': info['save_price'],
+        'discount_percent': info['discount_percent'],
+        'offer_name': info['offer_name'],
+    })
+
+
+def _quantities(items):
+    return {item.id: item.quantity for item in items}
+
+
+def build_basket_snapshot(user_id, items=None):
+    """
+    Price a basket in one pass:
+      lines            - item id -> quantity, stock, unit prices and line totals
+      subtotal         - what the items cost after offers
+      original_total   - what they would cost without offers
+      savings          - the difference
+      item_count       - units in the basket
+      quantities       - item id -> quantity
+      coupons          - codes of running coupons the user can still apply
+                         to this subtotal
+      coupon_minimums  - code -> minimum amount of every running coupon the
+                         user hasn't used, to re-check eligibility
+      product_versions - product id -> version the prices were read at
+
+    Pass the already loaded load_basket_items() to save the query, or the
+    guest_basket_items() of an anonymous visitor with user_id None.
+    """
+    from admin_app.models import Coupon, UserCoupon
+    from offers.utils import get_discount_info_for_variants
+    from products.utils import product_versions
+
+    if items is None:
+        items = load_basket_items(user_id)
+
+    discount_infos = get_discount_info_for_variants(item.variant for item in items)
+
+    lines = {}
+    subtotal = original_total = Decimal('0')
+    for item in items:
+        line = _price_line(item, discount_infos[item.variant_id])
+        lines[item.id] = line
+        subtotal += line['line_total']
+        original_total += line['line_original']
+
+    coupon_minimums = {}
+    if items and user_id is not None:
+        today = timezone.now().date()
+        used = UserCoupon.objects.filter(user_id=user_id, coupon=OuterRef('pk'))
+        coupon_minimums = dict(
+            Coupon.objects.filter(is_active=True, valid_from__lte=today, valid_to__gte=today)
+            .exclude(Exists(used))
+            .values_list('code', 'minimum_amount'))
+
+    snapshot = {
+        'lines': lines,
+        'subtotal': subtotal,
+        'original_total': original_total,
+        'quantities': _quantities(items),
+        'coupon_minimums': coupon_minimums,
+        'product_versions': product_versions({line['product_id'] for line in lines.values()}),
+    }
+    _update_totals(snapshot)
+    return snapshot
+
+
+def _update_totals(snapshot):
+    """
+    Fill in the figures derived from subtotal, original_total and lines.
+    """
+    snapshot['savings'] = snapshot['original_total'] - snapshot['subtotal']
+    snapshot['item_count'] = sum(line['quantity'] for line in snapshot['lines'].values())
+    snapshot['coupons'] = [
+        code for code, minimum in snapshot['coupon_minimums'].items()
+        if minimum <= snapshot['subtotal']]
+
+
+def _snapshot_suffix():
+    """
+    The parts of the snapshot key shared by every basket: offers, coupons
+    and the day (coupon validity).
+    """
+    from admin_app.utils import coupon_version
+    from products.utils import pricing_version
+
+    return f"{pricing_version()}:{coupon_version()}:{timezone.now().date()}"
+
+
+def _snapshot_key(user_id, version, suffix):
+    return f"basket:snapshot:{user_id}:{version}:{suffix}"
+
+
+def get_basket_snapshot(user_id, items=None):
+    """
+    The user's basket snapshot, reused until an item, an offer, a coupon or
+    one of the products in it changes. Loaded items that disagree with the
+    cached snapshot (written meanwhile) are priced afresh.
+    """
+    from products.utils import product_versions
+
+    key = _snapshot_key(user_id, basket_version(user_id), _snapshot_suffix())
+
+    snapshot = cache.get(key)
+    if (snapshot is not None
+            and product_versions(snapshot['product_versions']) == snapshot['product_versions']
+            and (items is None or _quantities(items) == snapshot['quantities'])):
+        return snapshot
+
+    snapshot = build_basket_snapshot(user_id, items)
+    cache.set(key, snapshot, BASKET_SNAPSHOT_SECONDS)
+    return snapshot
+
+
+def apply_basket_snapshot(items, snapshot):
+    """
+    Attach the snapshot prices to loaded basket items for the templates:
+    variant.discount_info, discounted_subtotal, original_subtotal,
+    save_subtotal and total_each_price.
+    """
+    for item in items:
+        line = snapshot['lines'][item.id]
+        item.variant.discount_info = {
+            key: line[key] for key in (
+                'price', 'original_price', 'save_price', 'discount_percent', 'offer_name')}
+        item.discounted_subtotal = line['line_total']
+        item.original_subtotal = line['line_original']
+        item.save_subtotal = line['line_save']
+        item.total_each_price = item.variant.price * item.quantity
+    return items
+
+
+def _cached_snapshot(user_id):
+    """
+    (version, key suffix, cached snapshot or None) of a user's basket as it
+    is right now, before a write.
+    """
+    version = basket_version(user_id)
+    suffix = _snapshot_suffix()
+    return version, suffix, cache.get(_snapshot_key(user_id, version, suffix))
+
+
+def _carry_over(user_id, version, suffix, snapshot, item, line, delta):
+    """
+    Store `snapshot` with `line` set for `item` and the totals moved by
+    `delta` units of it under the basket version the write is about to
+    create.
+    """
+    from products.utils import product_versions
+
+    snapshot = dict(
+        snapshot,
+        lines={**snapshot['lines'], item.id: line},
+        quantities={**snapshot['quantities'], item.id: line['quantity']},
+        subtotal=snapshot['subtotal'] + line['price'] * delta,
+        original_total=snapshot['original_total'] + line['original_price'] * delta,
+    )
+    if line['product_id'] not in snapshot['product_versions']:
+        snapshot['product_versions'] = {
+            **snapshot['product_versions'], **product_versions([line['product_id']])}
+    _update_totals(snapshot)
+
+    def carry_over():
+        # runs after the item signal bumped the version, unless someone
+        # else wrote to the basket or offers/coupons changed meanwhile
+        if basket_version(user_id) == version + 1 and _snapshot_suffix() == suffix:
+            cache.set(_snapshot_key(user_id, version + 1, suffix), snapshot, BASKET_SNAPSHOT_SECONDS)
+
+    transaction.on_commit(carry_over)
+
+
+def set_line_quantity(item, quantity):
+    """
+    Save a new quantity for a basket line. When the basket's snapshot is
+    cached, it is carried over to the next basket version adjusted by this
+    line's delta, instead of being rebuilt from every item.
+
+    Call it inside the transaction that locked the item row.
+    """
+    delta = quantity - item.quantity
+    if not delta:
+        return
+
+    user_id = basket_owner_id(item)
+    version, suffix, snapshot = _cached_snapshot(user_id)
+
+    item.quantity = quantity
+    item.save(update_fields=['quantity'])
+
+    line = snapshot and snapshot['lines'].get(item.id)
+    if line and line['quantity'] == quantity - delta:
+        line = _line_totals(dict(line, quantity=quantity))
+        _carry_over(user_id, version, suffix, snapshot, item, line, delta)
+
+
+def add_basket_line(item):
+    """
+    Insert a new basket line and, when the basket's snapshot is cached, add
+    the priced line to it rather than rebuilding it. The item's variant
+    should come from ProductVariant.objects.with_pricing(), so pricing needs
+    no query.
+    """
+    from offers.utils import get_discount_info_for_variants
+
+    user_id = basket_owner_id(item)
+    version, suffix, snapshot = _cached_snapshot(user_id)
+
+    item.save()
+
+    # an empty basket's snapshot has no coupons to go by
+    if snapshot is not None and snapshot['lines']:
+        info = get_discount_info_for_variants([item.variant])[item.variant_id]
+        line = _price_line(item, info)
+        _carry_over(user_id, version, suffix, snapshot, item, line, item.quantity)
+
+
+# ----------------------------
+#   GUEST BASKET
+# ----------------------------
+
+# {variant id: quantity} of an anonymous visitor, kept in the session until login
+GUEST_BASKET_SESSION_KEY = 'guest_basket'
+
+
+def get_guest_basket(session):
+    return {int(variant_id): quantity
+            for variant_id, quantity in session.get(GUEST_BASKET_SESSION_KEY, {}).items()}
+
+
+def save_guest_basket(session, basket):
+    if basket:
+        session[GUEST_BASKET_SESSION_KEY] = {
+            str(variant_id): quantity for variant_id, quantity in basket.items()}
+    else:
+        session.pop(GUEST_BASKET_SESSION_KEY, None)
+
+
+def guest_basket_items(session):
+    """
+    Unsaved BasketItems for the guest basket, loaded like load_basket_items().
+    Their id is the variant id, which is how the guest basket endpoints
+    address a line.
+    """
+    from products.models import ProductVariant
+    from .models import BasketItem
+
+    basket = get_guest_basket(session)
+    if not basket:
+        return []
+
+    variants = (
+        ProductVariant.objects.with_pricing().filter(id__in=basket)
+        .select_related('product__category', 'product__primary_image', 'flavor', 'weight')
+        .order_by('id'))
+    return [BasketItem(id=variant.id, variant=variant, quantity=basket[variant.id])
+            for variant in variants]
+
+
+def merge_guest_basket(user, session):
+    """
+    Move the guest basket into the user's Basket when they log in, with one
+    bulk update and one bulk insert. Quantities of lines already in the
+    basket add up, capped at the stock and the variant's per-order limit.
+    """
+    from home.utils import invalidate_header_counts
+    from products.models import ProductVariant
+    from wishlist.models import WishlistItem
+    from .models import Basket, BasketItem
+
+    guest = get_guest_basket(session)
+    save_guest_basket(session, {})
+    if not guest:
+        return
+
+    with transaction.atomic():
+        basket, _ = Basket.objects.get_or_create(user=user)
+        limits = {
+            variant_id: min(stock, max_quantity)
+            for variant_id, stock, max_quantity in ProductVariant.objects.filter(
+                id__in=guest).values_list('id', 'stock', 'max_quantity_per_order')}
+        existing = {
+            item.variant_id: item
+            for item in BasketItem.objects.filter(basket=basket, variant_id__in=limits)}
+
+        changed, created = [], []
+        for variant_id, quantity in guest.items():
+            if variant_id not in limits:
+                continue
+            item = existing.get(variant_id)
+            current = item.quantity if item else 0
+            quantity = max(min(current + quantity, limits[variant_id]), current)
+            if item is None and quantity > 0:
+                created.append(BasketItem(basket=basket, variant_id=variant_id, quantity=quantity))
+            elif item is not None and quantity != current:
+                item.quantity = quantity
+                changed.append(item)
+
+        BasketItem.objects.bulk_update(changed, ['quantity'])
+        BasketItem.objects.bulk_create(created)
+
+        # as when adding while logged in
+        WishlistItem.objects.filter(wishlist__user=user, variant_id__in=limits).delete()
+
+        # bulk writes skip the item signals
+        transaction.on_commit(lambda: bump_basket_version(user.pk))
+        transaction.on_commit(lambda: invalidate_header_counts(user.pk))
@@ -4,14 +4,19 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from .models import Basket, BasketItem
 from .forms import BasketAddForm
 from products.models import ProductVariant
+from products.templatetags.image_tags import rendition
 from django.views import View
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseBadRequest
 import json
+from django.db import transaction
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from wishlist.models import WishlistItem
 from user_profile.models import Address
-from offers.utils import get_best_offer_for_product, get_discount_info_for_variant
+from offers.utils import get_best_offer_for_product
+from .utils import (
+    load_basket_items, get_basket_snapshot, build_basket_snapshot, apply_basket_snapshot,
+    set_line_quantity, add_basket_line, get_guest_basket, save_guest_basket, guest_basket_items)
 
 
 # Create your views here.
@@ -25,17 +30,15 @@ class BasketAddView(View):
         form = BasketAddForm(request.POST)
         is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
 
-        if not request.user.is_authenticated:
-            if is_ajax:
-                return JsonResponse({"success":False, "login_required":True})
-            messages.warning(request, "Please log in to add items to your basket.")
-            return redirect("account_login") 
-
         if form.is_valid():
             variant_id = form.cleaned_data["variant_id"]
             quantity = form.cleaned_data["quantity"]
 
-            variant = get_object_or_404(ProductVariant, id=variant_id)
+            # one query for everything the checks, the pricing and the reply need
+            variant = get_object_or_404(
+                ProductVariant.objects.with_pricing().select_related(
+                    'product__category', 'product__primary_image', 'flavor', 'weight'),
+                id=variant_id)
             product = variant.product
 
             # Prevent unlisted or blocked products
@@ -46,43 +49,37 @@ class BasketAddView(View):
                 messages.error(request, "This product cannot be added to the basket.")
                 return redirect("detail_product",id=product.id)
 
-            # Remove from wishlist if exists
-            WishlistItem.objects.filter(wishlist__user=request.user, variant=variant).delete()
+            # guests get a session basket, merged into a real one at login
+            if not request.user.is_authenticated:
+                return self.add_for_guest(request, variant, quantity, is_ajax)
 
-            basket, _ = Basket.objects.get_or_create(user=request.user)
-            item, created = BasketItem.objects.get_or_create(
-                basket=basket,
-                variant=variant,
-                defaults={"quantity": quantity},
-            )
-
-            if not created:
-                new_quantity = item.quantity + quantity
-                if new_quantity > variant.stock:
+            # upsert the line with the basket row locked, so two first adds of
+            # a variant can't both insert one; the cached basket snapshot
+            # follows along instead of repricing every line
+            with transaction.atomic():
+                basket, _ = Basket.objects.get_or_create(user=request.user)
+                basket = Basket.objects.select_for_update().get(pk=basket.pk)
+                item = BasketItem.objects.filter(basket=basket, variant=variant).first()
 
+                error = quantity_limit_error(variant, (item.quantity if item else 0) + quantity)
+                if error:
                     if is_ajax:
-                        return JsonResponse({"success":False, "error": f"Only {variant.stock} items available in stock."})
-                    messages.error(request, f"Only {variant.stock} items available in stock.")
+                        return JsonResponse({"success":False, "error": error})
+                    messages.error(request, error)
                     return redirect("detail_product", id=product.id)
 
-                item.quantity = new_quantity
-                item.save()
+                if item is None:
+                    add_basket_line(BasketItem(basket=basket, variant=variant, quantity=quantity))
+                else:
+                    item.basket = basket
+                    set_line_quantity(item, item.quantity + quantity)
+
+                # Remove from wishlist if exists
+                WishlistItem.objects.filter(wishlist__user=request.user, variant=variant).delete()
 
             if is_ajax:
-                return JsonResponse({
-                    "success": True,
-                    "product": product.name,
-                    "variant": str(variant),
-                    "quantity": quantity,
-                    "subtotal": basket.total_price, 
-                    "basket_count": basket.items.count(),
-                    "image": (
-                        (variant.product.images.filter(is_primary=True).first() or variant.product.images.first()).image.url
-                        if variant.product.images.exists()
-                        else ""
-                    ),
-
-                })
+                snapshot = get_basket_snapshot(request.user.id)
+                return added_to_basket_response(variant, quantity, snapshot['subtotal'], len(snapshot['lines']))
 
             messages.success(request, f"{product.name} ({variant}) added to your basket!")
             return redirect("basket_view") 
@@ -93,13 +90,77 @@ class BasketAddView(View):
         messages.error(request, "Invalid data. Please try again.")
         return HttpResponseBadRequest("Form validation failed.")
 
+    def add_for_guest(self, request, variant, quantity, is_ajax):
+        """
+        Same rules as for a logged in user, without touching the basket tables.
+        """
+        product = variant.product
+        guest_basket = get_guest_basket(request.session)
+
+        new_quantity = guest_basket.get(variant.id, 0) + quantity
+        error = quantity_limit_error(variant, new_quantity)
+        if error:
+            if is_ajax:
+                return JsonResponse({"success":False, "error": error})
+            messages.error(request, error)
+            return redirect("detail_product", id=product.id)
+
+        guest_basket[variant.id] = new_quantity
+        save_guest_basket(request.session, guest_basket)
+
+        if is_ajax:
+            snapshot = build_basket_snapshot(None, guest_basket_items(request.session))
+            return added_to_basket_response(variant, quantity, snapshot['subtotal'], len(guest_basket))
+
+        messages.success(request, f"{product.name} ({variant}) added to your basket!")
+        return redirect("basket_view")
+
+
+def quantity_limit_error(variant, quantity):
+    """
+    Why a basket line can't hold this many of the variant, or None.
+    """
+    if quantity > variant.stock:
+        return f"Only {variant.stock} items available in stock."
+    if quantity > variant.max_quantity_per_order:
+        return f"Max {variant.max_quantity_per_order} allowed."
+    return None
+
 
-class BasketRemoveView(LoginRequiredMixin, View):
+def added_to_basket_response(variant, quantity, subtotal, basket_count):
+    """
+    JSON reply to an AJAX add, from the already loaded variant (product and
+    primary image selected with it) and the basket summary.
+    """
+    product = variant.product
+    return JsonResponse({
+        "success": True,
+        "product": product.name,
+        "variant": str(variant),
+        "quantity": quantity,
+        "subtotal": subtotal,
+        "basket_count": basket_count,
+        "image": (
+            rendition(product.primary_image.image, 'thumb')
+            if product.primary_image
+            else ""
+        ),
+    })
+
+
+class BasketRemoveView(View):
     """
     remove items from the basket
     """
 
     def post(self, request, variant_id, *args, **kwargs):
+        if not request.user.is_authenticated:
+            guest_basket = get_guest_basket(request.session)
+            guest_basket.pop(variant_id, None)
+            save_guest_basket(request.session, guest_basket)
+            messages.success(request, "Item removed from the basket.")
+            return redirect(request.META.get('HTTP_REFERER', '/'))
+
         basket = get_object_or_404(Basket, user=request.user)
         item = get_object_or_404(BasketItem, basket=basket, variant_id=variant_id)
         
@@ -120,7 +181,7 @@ class BasketRemoveView(LoginRequiredMixin, View):
 
 
 #Basket datails view all items
-class BasketDetailView(LoginRequiredMixin, View):
+class BasketDetailView(View):
     """
     list items in the basket
     """
@@ -129,23 +190,23 @@ class BasketDetailView(LoginRequiredMixin, View):
         if request.user.is_authenticated:
             # basket= get_object_or_404(Basket, user=request.user)
             basket, created = Basket.objects.get_or_create(user=request.user)
-            items = basket.items.select_related('variant', 'variant__product').all()
+            items = load_basket_items(request.user.id)
+            snapshot = get_basket_snapshot(request.user.id, items)
+            apply_basket_snapshot(items, snapshot)
 
-            for item in items:
-                item.variant.discount_info = get_discount_info_for_variant(item.variant)
-                item.discounted_subtotal = item.variant.discount_info['price'] * item.quantity
-                item.original_subtotal = item.variant.discount_info['original_price'] * item.quantity
-                item.save_subtotal = item.variant.discount_info['save_price'] * item.quantity
-                item.total_each_price = item.price * item.quantity
-
-            total_price = sum(item.discounted_subtotal for item in items)
+            total_price = snapshot['subtotal']
 
         else:
+            # a guest basket lives in the session
             basket = None
-            items = []
-            total_price = 0
-
-        default_address = Address.objects.filter(user=request.user, is_default=True).first()
+            items = guest_basket_items(request.session)
+            snapshot = build_basket_snapshot(None, items)
+            apply_basket_snapshot(items, snapshot)
+            total_price = snapshot['subtotal']
+
+        default_address = (
+            Address.objects.filter(user=request.user, is_default=True).first()
+            if request.user.is_authenticated else None)
         context = {
             "basket": basket if request.user.is_authenticated else None,
             "items" : items,
@@ -184,53 +245,45 @@ class BasketUpdateView(LoginRequiredMixin, View):
             item.quantity -= 1
             item.save()
         
-        data = {
-            'quantity' : item.quantity,
-            'subtotal' : item.subtotal,
-            'total' : item.basket.total_price,
-        }
         return redirect('basket_view')
-        # return JsonResponse(data)
 
 
-@login_required
 @require_POST
 def basket_update_item(request, item_id):
     """
     to update the items in the basket
+    (for guests item_id is the variant id of a session basket line)
     """
 
     try:
         data = json.loads(request.body)
         action = data.get("action")  
 
-
-        item = BasketItem.objects.get(id=item_id, basket__user=request.user)
-
-        # ✅ Update quantity safely
-        if action == "increase" and item.quantity < item.variant.stock:
-            item.quantity += 1
-        elif action == "decrease" and item.quantity > 1:
-            item.quantity -= 1
-        item.save()
-
-        # ✅ Reapply discount info for consistent logic
-        discount_info = get_discount_info_for_variant(item.variant)
-        discounted_price = discount_info["price"]
-        original_price = discount_info.get("original_price", discounted_price)
-        discount_percent = discount_info.get("discount_percent", 0)
-        save_amount = discount_info.get("save_amount", 0)
-
-        # ✅ Calculate subtotals using the discounted price
-        discounted_subtotal = discounted_price * item.quantity
-        original_subtotal = original_price * item.quantity
-        save_subtotal = save_amount * item.quantity
-
-        # ✅ Calculate basket total with discounts applied
-        basket_items = BasketItem.objects.filter(basket__user=request.user)
-        basket_total = sum(
-            get_discount_info_for_variant(i.variant)["price"] * i.quantity for i in basket_items
-        )
+        if not request.user.is_authenticated:
+            return update_guest_item(request, item_id, action)
+
+
+        # ✅ Update quantity safely, the row stays locked until the new quantity is saved
+        with transaction.atomic():
+            item = BasketItem.objects.select_for_update(of=('self',)).select_related(
+                'basket', 'variant').get(id=item_id, basket__user=request.user)
+
+            quantity = item.quantity
+            if action == "increase" and quantity < item.variant.stock:
+                quantity += 1
+            elif action == "decrease" and quantity > 1:
+                quantity -= 1
+            set_line_quantity(item, quantity)
+
+        # ✅ Line and basket totals, adjusted by this line's change instead of repricing the basket
+        snapshot = get_basket_snapshot(request.user.id)
+        line = snapshot['lines'][item.id]
+        basket_total = snapshot['subtotal']
+        discounted_price = line['price']
+        discount_percent = line['discount_percent']
+        discounted_subtotal = line['line_total']
+        original_subtotal = line['line_original']
+        save_subtotal = line['line_save']
 
         return JsonResponse({
             "success": True,
@@ -247,4 +300,37 @@ def basket_update_item(request, item_id):
     except BasketItem.DoesNotExist:
         return JsonResponse({"success": False, "error": "Item not found"})
     except Exception as e:
-        return JsonResponse({"success": False, "error": str(e)})
\ No newline at end of file
+        return JsonResponse({"success": False, "error": str(e)})
+
+def update_guest_item(request, variant_id, action):
+    """
+    basket_update_item for a session basket, answering the same JSON.
+    """
+    guest_basket = get_guest_basket(request.session)
+    items = guest_basket_items(request.session)
+    item = next((item for item in items if item.id == variant_id), None)
+    if item is None:
+        return JsonResponse({"success": False, "error": "Item not found"})
+
+    if action == "increase" and not quantity_limit_error(item.variant, item.quantity + 1):
+        item.quantity += 1
+    elif action == "decrease" and item.quantity > 1:
+        item.quantity -= 1
+    guest_basket[variant_id] = item.quantity
+    save_guest_basket(request.session, guest_basket)
+
+    snapshot = build_basket_snapshot(None, items)
+    line = snapshot['lines'][item.id]
+
+    return JsonResponse({
+        "success": True,
+        "new_quantity": item.quantity,
+        "item_id": item.id,
+        "basket_total": float(snapshot['subtotal']),
+        "item_total": float(line['line_total']),
+        "per_piece_price": float(line['price']),
+        "original_subtotal": float(line['line_original']),
+        "save_subtotal": float(line['line_save']),
+        "discount_percent": line['discount_percent'],
+        "stock": item.variant.stock,
+    })
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    Category = apps.get_model("category", "Category")
+
+    # one read, the tree is walked in memory
+    parents = dict(Category.objects.values_list("id", "parent_id"))
+    paths = {}
+
+    def path_of(category_id):
+        if category_id not in paths:
+            parent_id = parents[category_id]
+            prefix = path_of(parent_id) if parent_id else ""
+            paths[category_id] = f"{prefix}{category_id}/"
+        return paths[category_id]
+
+    categories = list(Category.objects.only("id"))
+    for category in categories:
+        category.path = path_of(category.id)
+    Category.objects.bulk_update(categories, ["path"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0008_category_promo_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.utils.text import slugify
 
 # Create your models here.
@@ -17,6 +19,9 @@ class Category(models.Model):
     # discount_percentage = models.PositiveIntegerField(default=0)
     discount = models.DecimalField(default=0,max_digits=5, decimal_places=2, blank=True, null=True, help_text = "Discount (eg: 10.50 for 10.5%)")
 
+    # ids from the root down to this category, eg "3/12/", kept current by save()
+    path = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+
     #for readability
 
     def save(self, *args, **kwargs):
@@ -30,7 +35,37 @@ class Category(models.Model):
                     counter += 1
             else:
                 self.slug = "category"
-        super().save(*args, **kwargs)
+        # one transaction, so on_commit hooks see the final paths
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._update_path()
+
+    def _update_path(self):
+        """
+        Recompute the materialized path and, after a move, rewrite the paths
+        of the whole subtree with a single UPDATE.
+        """
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.filter(
+                pk=self.parent_id).values_list('path', flat=True).get()
+        new_path = f"{parent_path}{self.pk}/"
+        old_path = self.path
+
+        if new_path == old_path:
+            return
+
+        Category.objects.filter(pk=self.pk).update(path=new_path)
+        if old_path:
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)))
+        self.path = new_path
+
+    def ancestor_ids(self):
+        """
+        ids from the root down to the parent, read from the path.
+        """
+        return [int(part) for part in self.path.split('/')[:-2]]
 
     #changes how it display in the admin side-bar
     class Meta:
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from products.utils import bump_product_versions
+from utils.images import track_renditions
+from .models import Category
+from .utils import invalidate_category_tree, subtree_ids
+
+
+@receiver(post_init, sender=Category)
+def remember_parent(sender, instance, **kwargs):
+    instance._loaded_parent_id = instance.__dict__.get('parent_id')
+
+
+def _refresh_tree(moved_category_id=None):
+    from offers.utils import invalidate_offer_index, refresh_effective_prices
+    from products.models import Product
+
+    invalidate_category_tree()
+    # category offers are inherited down the tree
+    invalidate_offer_index()
+
+    if moved_category_id is not None:
+        refresh_effective_prices(
+            Product.objects.filter(category_id__in=subtree_ids([moved_category_id]))
+            .values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    moved = not created and instance.parent_id != instance._loaded_parent_id
+    instance._loaded_parent_id = instance.parent_id
+    transaction.on_commit(lambda: _refresh_tree(instance.pk if moved else None))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    transaction.on_commit(_refresh_tree)
+
+
+def _promo_renditions_ready(category_id):
+    # bestseller cards show the category promo image
+    bump_product_versions(Category.objects.get(pk=category_id).products.values_list('id', flat=True))
+
+
+track_renditions(Category, 'image', ('thumb', 'card'))
+track_renditions(Category, 'promo_image', ('card', 'zoom'),
+                 on_ready=_promo_renditions_ready)
@@ -0,0 +1,115 @@
+import threading
+from utils.cache import get_version, bump_version
+
+
+# ----------------------------
+#   CATEGORY TREE
+# ----------------------------
+
+# bumped whenever a category changes
+CATEGORY_TREE_VERSION_KEY = 'category:tree_version'
+
+_category_tree = None
+_category_tree_lock = threading.Lock()
+
+
+class CategoryTree:
+    """
+    In-process copy of every category, with parent/child links resolved
+    from the materialized paths. Built from one query and shared by all
+    requests until a category changes.
+
+    The Category instances are shared too, treat them as read only.
+    """
+
+    def __init__(self, categories, version):
+        self.version = version
+        self.categories = categories
+        self.by_id = {category.id: category for category in categories}
+        self.by_name = {category.name.lower(): category for category in categories}
+
+        self.children = {}
+        for category in categories:
+            self.children.setdefault(category.parent_id, []).append(category)
+
+        self._subtrees = {}
+
+    @property
+    def roots(self):
+        return self.children.get(None, [])
+
+    def get(self, category_id):
+        return self.by_id.get(category_id)
+
+    def find(self, name):
+        return self.by_name.get(name.strip().lower())
+
+    def ancestors(self, category_id):
+        """
+        Categories from the root down to the parent of category_id.
+        """
+        category = self.by_id.get(category_id)
+        if category is None:
+            return []
+        return [self.by_id[i] for i in category.ancestor_ids() if i in self.by_id]
+
+    def subtree_ids(self, category_id):
+        """
+        category_id and the ids of every category below it.
+        """
+        if category_id not in self._subtrees:
+            category = self.by_id.get(category_id)
+            if category is None:
+                return set()
+            self._subtrees[category_id] = {
+                other.id for other in self.categories
+                if other.path.startswith(category.path)}
+        return self._subtrees[category_id]
+
+
+def build_category_tree(version=None):
+    from .models import Category
+
+    return CategoryTree(list(Category.objects.order_by('id')), version)
+
+
+def get_category_tree():
+    """
+    Return the category tree, rebuilding it when a category changed in
+    this or another process.
+    """
+    global _category_tree
+
+    version = get_version(CATEGORY_TREE_VERSION_KEY)
+
+    tree = _category_tree
+    if tree is not None and tree.version == version:
+        return tree
+
+    with _category_tree_lock:
+        tree = _category_tree
+        if tree is None or tree.version != version:
+            tree = build_category_tree(version)
+            _category_tree = tree
+    return tree
+
+
+def invalidate_category_tree():
+    """
+    Drop the tree here and tell other processes to rebuild theirs.
+    """
+    global _category_tree
+
+    _category_tree = None
+    bump_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def subtree_ids(category_ids):
+    """
+    The given category ids plus all their descendants.
+    """
+    tree = get_category_tree()
+    ids = set()
+    for category_id in category_ids:
+        ids |= tree.subtree_ids(category_id)
+    return ids
@@ -5,14 +5,11 @@ from django.views.decorators.cache import cache_control, never_cache
 from django.utils import timezone
 from utils.pagination import get_pagination
 from .models import Category
+from .utils import get_category_tree
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.text import slugify
 from django.urls import reverse
 
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
-
 # Create your views here.
 
 # @login_required
@@ -94,14 +91,7 @@ def add_category(request):
       }
       return render(request, 'add_category.html', context)
 
-    if image:
-      img = Image.open(image)
-      img = img.convert('RGB')
-      img = img.resize((300, 300), Image.Resampling.LANCZOS)
-      img_io =BytesIO()
-      img.save(img_io, format='JPEG', quality=90)
-      image = ContentFile(img_io.getvalue(), name=image.name)
-    
+    # resized copies are made off the request by utils.images
     parent = None
     if parent_id:
       #checking for unique name and slug
@@ -175,8 +165,8 @@ def edit_category(request, category_id):
     if parent_id:
       try:
         parent = Category.objects.get(id=parent_id)
-        if parent.id == category.id:
-          messages.error(request, "A category cannot be its own parent.")
+        if parent.id in get_category_tree().subtree_ids(category.id):
+          messages.error(request, "A category cannot be its own parent or sit below itself.")
           return redirect('edit_category', category_id=category.id)
       except Category.DoesNotExist:
         messages.error(request, "The selected parent category does not exist.")
@@ -1,18 +1,21 @@
-from category.models import Category
-from basket.models import Basket, BasketItem
-from wishlist.models import Wishlist, WishlistItem
+from django.utils.functional import SimpleLazyObject
+from category.utils import get_category_tree
+from basket.utils import get_guest_basket
+from .utils import get_header_counts
 
 def footer_product_links(request):
     """fetching the categories from the db and clickable link is been made for 
-    at footer so that it is available everywhere the footer is """
+    at footer so that it is available everywhere the footer is.
+    Lazy, read from the cached category tree only if a template uses it"""
 
-    try:
-        links = Category.objects.values_list('name', flat=True)
+    def links():
+        # top level categories, each linking to the listing filtered by it
+        try:
+            return [category for category in get_category_tree().roots if category.is_active]
+        except Exception:
+            return []
 
-    except Exception:
-        links=[]
-    
-    return {'product_link': links}
+    return {'product_link': SimpleLazyObject(links)}
 
 
 
@@ -49,28 +52,27 @@ def footer_product_links(request):
 def wishlist_basket_item_counts(request):
     """
     Fetch count of wishlist and basket items and return for display on the header.
+    Both values are lazy: nothing is read (not even the user) unless a
+    template prints them, and then from the per-user cached counts.
     """
-    
-    wishlist_count = 0
-    basket_count = 0
 
-    # Check safely if user exists and is authenticated
-    user = getattr(request, 'user', None)
-    
-    if user and user.is_authenticated:
-        try:
-            wishlist = user.wishlist
-            wishlist_count = wishlist.items.count()
-        except Exception:
-            wishlist_count = 0
+    def counts():
+        # Check safely if user exists and is authenticated
+        user = getattr(request, 'user', None)
+        if user and user.is_authenticated:
+            try:
+                return get_header_counts(user.pk)
+            except Exception:
+                pass
+            return {'wishlist': 0, 'basket': 0}
+        # guests only have a session basket
+        session = getattr(request, 'session', None)
+        guest_basket = get_guest_basket(session) if session is not None else {}
+        return {'wishlist': 0, 'basket': sum(guest_basket.values())}
 
-        try:
-            basket = user.basket
-            basket_count = sum(item.quantity for item in basket.items.all())
-        except Exception:
-            basket_count = 0
+    header_counts = SimpleLazyObject(counts)
 
     return {
-        'wishlist_count': wishlist_count,
-        'basket_count': basket_count,
+        'wishlist_count': SimpleLazyObject(lambda: header_counts['wishlist']),
+        'basket_count': SimpleLazyObject(lambda: header_counts['basket']),
     }
@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from basket.models import Basket, BasketItem
+from basket.utils import basket_owner_id
+from wishlist.models import Wishlist, WishlistItem
+from .utils import invalidate_header_counts
+
+
+def _schedule_invalidation(user_id):
+    if user_id is not None:
+        transaction.on_commit(lambda: invalidate_header_counts(user_id))
+
+
+@receiver(post_save, sender=BasketItem)
+@receiver(post_delete, sender=BasketItem)
+def basket_item_changed(sender, instance, **kwargs):
+    _schedule_invalidation(basket_owner_id(instance))
+
+
+@receiver(post_save, sender=WishlistItem)
+@receiver(post_delete, sender=WishlistItem)
+def wishlist_item_changed(sender, instance, **kwargs):
+    if WishlistItem.wishlist.is_cached(instance):
+        user_id = instance.wishlist.user_id
+    else:
+        user_id = Wishlist.objects.filter(
+            pk=instance.wishlist_id).values_list('user_id', flat=True).first()
+    _schedule_invalidation(user_id)
+
+
+@receiver(post_delete, sender=Basket)
+@receiver(post_delete, sender=Wishlist)
+def container_deleted(sender, instance, **kwargs):
+    _schedule_invalidation(instance.user_id)
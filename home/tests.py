@@ -1,3 +1,25 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from category.models import Category
 
 # Create your tests here.
+
+
+class FooterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_footer_links_the_top_level_categories(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            protein = Category.objects.create(name='Protein')
+            Category.objects.create(name='Whey', parent=protein)
+            Category.objects.create(name='Retired', is_active=False)
+
+        response = self.client.get(reverse('about_us'))
+
+        self.assertContains(
+            response, f'<a href="{reverse("list_products")}?category={protein.id}">Protein</a>', html=True)
+        self.assertNotContains(response, 'Whey</a>')
+        self.assertNotContains(response, 'Retired</a>')
@@ -7,6 +7,7 @@ urlpatterns = [
     path("", views.home_view, name='home'),
     path("products_list", views.list_products, name="list_products"),
     path("product_detail/<int:id>/", views.detail_product, name="detail_product"),
+    path("product_detail/<int:id>/variants/", views.product_variants, name="product_variants"),
     path('search_suggestions/', views.search_suggestions, name='search_suggestions'),
     path('about_us/', views.about_us, name='about_us'),
     path('contact_us/', views.contact_us, name='contact_us'),
@@ -0,0 +1,37 @@
+from django.core.cache import cache
+
+
+# ----------------------------
+#   HEADER COUNTS
+# ----------------------------
+
+# dropped on every basket/wishlist write, the timeout only bounds stale entries
+HEADER_COUNTS_SECONDS = 24 * 60 * 60
+
+
+def _header_counts_key(user_id):
+    return f"home:header_counts:{user_id}"
+
+
+def get_header_counts(user_id):
+    """
+    {'wishlist': items in the wishlist, 'basket': units in the basket}
+    for the header badges, cached per user.
+    """
+    from basket.utils import get_basket_snapshot
+    from wishlist.models import WishlistItem
+
+    key = _header_counts_key(user_id)
+    counts = cache.get(key)
+    if counts is None:
+        counts = {
+            'wishlist': WishlistItem.objects.filter(wishlist__user_id=user_id).count(),
+            # shared with the basket and checkout pages
+            'basket': get_basket_snapshot(user_id)['item_count'],
+        }
+        cache.set(key, counts, HEADER_COUNTS_SECONDS)
+    return counts
+
+
+def invalidate_header_counts(user_id):
+    cache.delete(_header_counts_key(user_id))
@@ -5,11 +5,16 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import cache_control, never_cache
 from products.models import Product, ProductVariant
-from category.models import Category
+from category.utils import get_category_tree
 from wishlist.models import Wishlist, WishlistItem
-from django.db.models import Q, Sum, Min, Max, Value, F, Case, When, DecimalField, OuterRef, Subquery
+from django.db.models import Q, Sum, Min, Max, Value, F, Case, When, DecimalField, OuterRef, Subquery, Prefetch
 from offers.models import Offer
-from offers.utils import get_best_offer_for_product, get_discount_info_for_variant
+from offers.utils import get_best_offer_for_product, get_discount_info_for_variant, get_discount_info_for_variants
+from products.utils import (
+    render_product_cards, get_featured_products, get_best_selling_products,
+    get_variant_matrix, select_variant)
+from products.search import search_products, get_suggestion_index
+from products.facets import parse_facet_filters, get_facets, apply_facet_filters
 from collections import OrderedDict
 from django.http import JsonResponse
 from decimal import Decimal, InvalidOperation
@@ -21,10 +26,15 @@ from reviews.models import Review
 from reviews.forms import ReviewForm
 from orders.models import OrderItem
 from django.db.models import Avg
+from django.core.cache import cache
+from hashlib import md5
 
 # from django.utils import timezone
 # Create your views here.
 
+# live search answers are shared between visitors for a short while
+SUGGESTION_CACHE_SECONDS = 30
+
 
 
 def home_view(request):
@@ -36,36 +46,21 @@ def home_view(request):
 
     # If category is selected, show filtered products (not random)
     if category_selected:
+        # products of subcategories are shown under their parent too
+        tree = get_category_tree()
+        category = tree.find(category_selected)
         products = Product.objects.filter(
             is_listed=True,
-            category__name__iexact=category_selected
-        ).prefetch_related("variants")
+            category_id__in=tree.subtree_ids(category.id) if category else [],
+        ).with_first_variant().select_related('primary_image')
     else:
         # Only show 4 random products when no category is selected
-        products = Product.objects.filter(
-            is_listed=True
-        ).prefetch_related("variants").order_by('?')[:4]
-
-    best_selling_products = (
-        Product.objects.filter(
-            is_listed=True,
-            variants__stock__gt=0) .annotate(
-            total_sold=Coalesce(
-                Sum("variants__orderitems__quantity"),
-                Value(0))) .filter(
-                    total_sold__gt=0) .order_by('-total_sold') .prefetch_related(
-                        'images',
-                        'variants')[
-                            :4])
-
-    for product in products:
-        product.best_offer = get_best_offer_for_product(product)
-        variants = list(product.variants.all())
+        products = get_featured_products(4)
 
-        for variant in variants:
-            variant.discount_info = get_discount_info_for_variant(variant)
+    products = render_product_cards(products, 'includes/product_card_home.html')
 
-        product.display_variant = variants[0] if variants else None
+    best_selling_products = render_product_cards(
+        get_best_selling_products(4), 'includes/bestseller_card_home.html')
 
     wishlist_variant_ids = []
     if request.user.is_authenticated:
@@ -74,7 +69,7 @@ def home_view(request):
             wishlist_variant_ids = wishlist.items.values_list(
                 'variant_id', flat=True)
 
-    categories = Category.objects.all()
+    categories = get_category_tree().categories
 
     category_pills = ['WHEY PROTEIN', 'ISOLATE', 'VITAMINS', 'CREATINE']
 
@@ -117,63 +112,17 @@ def list_products(request):
     return products list page
     """
 
-    products = Product.objects.filter(
-        is_listed=True).prefetch_related("variants")
+    products = Product.objects.filter(is_listed=True)
 
     # search
     search_query = request.GET.get("search")
 
     if search_query:
-        products = products.filter(Q(name__icontains=search_query) | Q(
-            description__icontains=search_query))
+        products = search_products(products, search_query)
 
-    # filter by category
     category_id = request.GET.get("category")
 
-    if category_id:
-        products = products.filter(category_id=category_id)
-
-    # Get current time for checking active offers
-    now = timezone.now()
-
-    # Subquery to get the best product offer discount
-    product_offer_discount = Offer.objects.filter(
-        products=OuterRef('pk'),
-        offer_type='product',
-        active=True,
-        start_date__lte=now,
-        end_date__gte=now
-    ).order_by('-discount_percent').values('discount_percent')[:1]
-
-    # Subquery to get the best category offer discount
-    category_offer_discount = Offer.objects.filter(
-        categories=OuterRef('category'),
-        offer_type='category',
-        active=True,
-        start_date__lte=now,
-        end_date__gte=now
-    ).order_by('-discount_percent').values('discount_percent')[:1]
-
-    # Annotate products with min/max prices and discounted prices
-    products = products.annotate(
-        min_variant_price=Min("variants__price"),
-        max_variant_price=Max("variants__price"),
-        product_discount=Subquery(product_offer_discount),
-        category_discount=Subquery(category_offer_discount),
-        # Calculate the best discount (product offer takes priority over
-        # category offer)
-        best_discount=Case(
-            When(product_discount__isnull=False, then=F('product_discount')),
-            When(category_discount__isnull=False, then=F('category_discount')),
-            default=Value(0),
-            output_field=DecimalField()
-        ),
-        # Calculate minimum price after discount
-        min_discounted_price=F('min_variant_price') *
-        (100 - F('best_discount')) / 100
-    )
-
-    # filter by price (using discounted price)
+    # filter by price (using the stored offer-adjusted price)
     min_price = request.GET.get("min_price")
     max_price = request.GET.get("max_price")
 
@@ -186,7 +135,7 @@ def list_products(request):
                                  extra_tags='mini_price_not_negative')
             else:
                 products = products.filter(
-                    min_discounted_price__gte=min_price_decimal)
+                    min_effective_price__gte=min_price_decimal)
 
         if max_price:
             max_price_decimal = Decimal(max_price)
@@ -196,7 +145,7 @@ def list_products(request):
                                  extra_tags='maxi_price_not_negative')
             else:
                 products = products.filter(
-                    min_discounted_price__lte=max_price_decimal)
+                    min_effective_price__lte=max_price_decimal)
 
     except (InvalidOperation, ValueError):
         messages.warning(
@@ -204,13 +153,19 @@ def list_products(request):
             "Price filter must contain valid positive numbers only.",
             extra_tags='positive_numbers_only')
 
+    # facets (category, flavor, weight, price band, stock) are counted over
+    # the results so far, then applied
+    facet_filters = parse_facet_filters(request.GET)
+    facets = get_facets(products, facet_filters)
+    products = apply_facet_filters(products, facet_filters)
+
     # sorting
     sort_option = request.GET.get("sort")
 
     if sort_option == "price_low":
-        products = products.order_by("min_discounted_price")
+        products = products.order_by("min_effective_price")
     elif sort_option == "price_high":
-        products = products.order_by("-min_discounted_price")
+        products = products.order_by("-min_effective_price")
     elif sort_option == "az":
         products = products.order_by("name")
     elif sort_option == "za":
@@ -228,16 +183,9 @@ def list_products(request):
                 wishlist.items.values_list(
                     'variant_id', flat=True))
 
-    for product in products:
-        product.best_offer = get_best_offer_for_product(product)
-
-        available_variants = product.variants.filter(stock__gt=0)
-        if available_variants.exists():
-            cheapest_variant = available_variants.order_by('price').first()
-            discount_info = get_discount_info_for_variant(cheapest_variant)
-            product.display_variant = discount_info
-        else:
-            product.display_variant = None
+    products = render_product_cards(
+        products.with_first_variant().select_related('primary_image'),
+        'includes/product_card_listing.html')
 
     today = timezone.now().date() 
     active_coupon = Coupon.objects.filter(
@@ -266,7 +214,7 @@ def list_products(request):
     
     new_product_id = new_variant.product.id if new_variant else None
 
-    categories = Category.objects.all()
+    categories = get_category_tree().categories
 
     context = {
         'products': products,
@@ -279,6 +227,8 @@ def list_products(request):
         'sort_option': sort_option,
         'coupon_data': coupon_data,
         'new_product_id': new_product_id,
+        'facets': facets,
+        'facet_filters': facet_filters,
     }
     return render(request, "product_listing.html", context)
 
@@ -289,36 +239,18 @@ def detail_product(request, id):
     """
     try:
         single_product = get_object_or_404(
-            Product.objects.prefetch_related('variants').annotate(
-                total_stock=Sum('variants__stock')), id=id, is_listed=True)
+            Product.objects.select_related('primary_image'), id=id, is_listed=True)
 
-        variants = single_product.variants.all().order_by('weight')
+        variant_matrix = get_variant_matrix(single_product.id)
 
-        if not variants.exists():
+        if not variant_matrix['variants']:
             messages.warning(
                 request, "No variants available for this product.")
             return redirect('list_products')
 
-        # Apply discount info just like home view
-        for variant in variants:
-            variant.discount_info = get_discount_info_for_variant(variant)
-
         # Apply best product-level offer
         best_offer = get_best_offer_for_product(single_product)
 
-        # Update each variant’s price after considering best offer
-        for variant in variants:
-            base_price = variant.discount_info['price']
-            if best_offer:
-                variant.offer_price = variant.discount_info['price']
-            else:
-                variant.offer_price = base_price
-
-        # Handle unique weights & flavors
-
-        unique_weights = {}
-        unique_flavors = {}
-
         today = timezone.now().date() 
         active_coupon = Coupon.objects.filter(
             is_active=True,
@@ -336,94 +268,22 @@ def detail_product(request, id):
 
             }
 
-        for variant in variants:
-            if variant.weight and variant.weight not in unique_weights:
-                unique_weights[variant.weight] = {
-                    'available': variant.stock > 0,
-                    'variant_id': variant.id,
-                    'price': variant.offer_price,
-                    'original_price': variant.discount_info.get('original_price'),
-                    'save_amount': variant.discount_info.get('save_amount'),
-                    'stock': variant.stock,
-                }
-
-            if variant.flavor and variant.flavor not in unique_flavors:
-                unique_flavors[variant.flavor] = {
-                    'available': variant.stock > 0,
-                    'variant_id': variant.id,
-                    'price': variant.offer_price,
-                    'original_price': variant.discount_info.get('original_price'),
-                    'save_amount': variant.discount_info.get('save_amount'),
-                    'stock': variant.stock,
-                }
-
-        selected_weight = request.GET.get('weight')
-        selected_flavor = request.GET.get('flavor')
-        selected_variant = None
-
-        for variant in variants:
-
-            flavor_name = getattr(variant.flavor, "flavor", None)
-            weight_name = getattr(variant.weight, "weight", None)
-
-            if (not selected_flavor or (flavor_name and flavor_name.lower() == selected_flavor.lower())) and (
-                    not selected_weight or (weight_name and weight_name.lower() == selected_weight.lower())):
-                selected_variant = variant
-                break
-
-        if not selected_variant:
-            selected_variant = variants.first()
-
-        for variant in variants:
-            weight_match = (
-                not selected_weight or variant.weight == selected_weight)
-            flavor_match = (
-                not selected_flavor or variant.flavor == selected_flavor)
-            if weight_match and flavor_match:
-                selected_variant = variant
-                break
-
-        if not selected_variant:
-            selected_variant = variants.first()
+        selected_variant = select_variant(
+            variant_matrix,
+            flavor=request.GET.get('flavor'),
+            weight=request.GET.get('weight'))
 
         selected_variant_info = {
-            'id': selected_variant.id,
-            'price': selected_variant.offer_price,
-            'original_price': selected_variant.discount_info.get('original_price'),
-            'save_amount': selected_variant.discount_info.get('save_amount'),
-            'weight': selected_variant.weight,
-            'flavor': selected_variant.flavor,
-            'stock': selected_variant.stock,
-            'has_discount': bool(
-                selected_variant.discount_info.get(
-                    'save_amount',
-                    0) > 0),
+            **selected_variant,
+            'has_discount': Decimal(selected_variant['save_amount']) > 0,
         }
 
-        variants_by_weight = [
-            v for v in variants if v.weight == selected_variant.weight]
-        variants_by_flavor = [
-            v for v in variants if v.flavor == selected_variant.flavor]
-
-        available_flavors = OrderedDict()
-        for variant in variants:
-            if variant.flavor and variant.flavor.flavor not in available_flavors:
-                available_flavors[variant.flavor.flavor] = {
-                    'variant_id': variant.id,
-                    'available': any(v.stock > 0 for v in variants if v.flavor == variant.flavor),
-                    'weight': variant.weight,
-                    'flavor_obj': variant.flavor,  # keep object if needed
-                }
-
-        available_weights = OrderedDict()
-        for variant in variants:
-            if variant.weight and variant.weight not in available_weights:
-                available_weights[variant.weight] = {
-                    'variant_id': variant.id,
-                    'available': variant.stock > 0,
-                    'weight_obj': variant.weight,  # keep object if needed
-                    'flavor': variant.flavor,
-                }
+        available_flavors = OrderedDict(
+            (name, {'available': available})
+            for name, available in variant_matrix['flavors'].items())
+        available_weights = OrderedDict(
+            (name, {'available': available})
+            for name, available in variant_matrix['weights'].items())
 
     except Exception as e:
         raise e
@@ -436,17 +296,8 @@ def detail_product(request, id):
                 wishlist.items.values_list(
                     'variant_id', flat=True))
 
-    best_selling_products = (
-        Product.objects.filter(
-            is_listed=True,
-            variants__stock__gt=0) .annotate(
-            total_sold=Coalesce(
-                Sum("variants__orderitems__quantity"),
-                Value(0))) .filter(
-                    total_sold__gt=0) .order_by('-total_sold') .prefetch_related(
-                        'images',
-                        'variants')[
-                            :4])
+    best_selling_products = render_product_cards(
+        get_best_selling_products(4), 'includes/bestseller_card_detail.html')
 
     # review logic
 
@@ -465,7 +316,7 @@ def detail_product(request, id):
     if request.user.is_authenticated:
         purchased = OrderItem.objects.filter(
             order__user = request.user,
-            variant = selected_variant,
+            variant_id = selected_variant['id'],
             status = 'delivered',
             is_cancelled = False,
             is_returned = False,
@@ -473,14 +324,12 @@ def detail_product(request, id):
 
     context = {
         "product": single_product,
-        "variants": variants,
+        "variant_matrix": variant_matrix,
         "selected_variant": selected_variant,
         "selected_variant_info": selected_variant_info,
         'best_selling_products': best_selling_products,
-        "unique_flavors": unique_flavors,
-        "unique_weights": unique_weights,
-        "available_flavors": available_flavors if available_flavors else unique_flavors,
-        "available_weights": available_weights if available_weights else unique_weights,
+        "available_flavors": available_flavors,
+        "available_weights": available_weights,
         "best_offer": best_offer,
         "wishlist_variant_ids": wishlist_variant_ids,
         'coupon_data': coupon_data,
@@ -496,18 +345,39 @@ def detail_product(request, id):
     return render(request, "product_detail.html", context)
 
 
+def product_variants(request, id):
+    """
+    JSON variant matrix of a product, so the detail page can switch flavor
+    and size without a reload. ?flavor=&weight= picks the `selected` entry.
+    """
+
+    variant_matrix = get_variant_matrix(id)
+    if not variant_matrix['is_listed']:
+        return JsonResponse({'error': 'Product not found.'}, status=404)
+
+    selected = select_variant(
+        variant_matrix,
+        flavor=request.GET.get('flavor'),
+        weight=request.GET.get('weight'))
+
+    return JsonResponse({**variant_matrix, 'selected': selected})
+
+
 def search_suggestions(request):
     """
     Handle AJAX live seacrh requests and return product name sugesstions.
     """
 
-    query = request.GET.get('q', '')
+    query = " ".join(request.GET.get('q', '').lower().split())[:100]
     suggestions = []
 
     if query:
-        products = Product.objects.filter(name__icontains=query)[:5]
-        suggestions = [{'id': p.id, 'name': p.name,
-                        'url': p.get_absolute_url()} for p in products]
+        index = get_suggestion_index()
+        cache_key = f"suggestions:{index.version}:{md5(query.encode()).hexdigest()}"
+        suggestions = cache.get(cache_key)
+        if suggestions is None:
+            suggestions = index.suggest(query)
+            cache.set(cache_key, suggestions, SUGGESTION_CACHE_SECONDS)
 
     return JsonResponse({'suggestions': suggestions})
 
@@ -526,8 +396,5 @@ def contact_us(request):
 
 
 def footer(request):
-    product_link = ['Whey', 'Isolate', 'Vitamins', 'Creatine']
-    context = {
-        'product_link': product_link,
-    }
-    return render(request, 'includes/footer_layout.html', context)
+    # product_link comes from home.context_processors.footer_product_links
+    return render(request, 'includes/footer_layout.html')
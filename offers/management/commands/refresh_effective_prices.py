@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from offers.utils import invalidate_offer_index, refresh_effective_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored effective prices of every variant. Offers that "
+        "start or end on schedule are picked up by the first request after "
+        "the boundary; run this nightly from cron as a backstop, and after "
+        "editing offers or prices outside the app (raw SQL, fixtures)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Number of variants read and written per batch.')
+
+    def handle(self, *args, **options):
+        invalidate_offer_index()
+        changed = refresh_effective_prices(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated effective prices of {changed} variant(s)."))
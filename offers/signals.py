@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from category.utils import subtree_ids
+from products.models import Product
+from .models import Offer
+from .utils import invalidate_offer_index, refresh_effective_prices
+
+
+def _offer_product_ids(offer):
+    """
+    ids of every product an offer applies to, directly or via its categories
+    and their subcategories
+    """
+    product_ids = set(offer.products.values_list('id', flat=True))
+    category_ids = subtree_ids(offer.categories.values_list('id', flat=True))
+    product_ids.update(
+        Product.objects.filter(category_id__in=category_ids)
+        .values_list('id', flat=True))
+    return product_ids
+
+
+def _schedule_refresh(product_ids):
+    def refresh():
+        invalidate_offer_index()
+        if product_ids:
+            refresh_effective_prices(product_ids)
+
+    # wait for the surrounding transaction so a rebuild never sees half a change
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=Offer)
+def offer_saved(sender, instance, **kwargs):
+    _schedule_refresh(_offer_product_ids(instance))
+
+
+@receiver(pre_delete, sender=Offer)
+def offer_deleting(sender, instance, **kwargs):
+    # the M2M rows are gone once the offer is deleted, remember them now
+    instance._affected_product_ids = _offer_product_ids(instance)
+
+
+@receiver(post_delete, sender=Offer)
+def offer_deleted(sender, instance, **kwargs):
+    _schedule_refresh(getattr(instance, '_affected_product_ids', set()))
+
+
+@receiver(m2m_changed, sender=Offer.products.through)
+def offer_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_product_ids = (
+            {instance.pk} if reverse
+            else set(instance.products.values_list('id', flat=True)))
+    elif action == 'post_clear':
+        _schedule_refresh(getattr(instance, '_cleared_product_ids', set()))
+    elif action in ('post_add', 'post_remove'):
+        _schedule_refresh({instance.pk} if reverse else set(pk_set))
+
+
+@receiver(m2m_changed, sender=Offer.categories.through)
+def offer_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        category_ids = (
+            {instance.pk} if reverse
+            else set(instance.categories.values_list('id', flat=True)))
+        instance._cleared_product_ids = set(
+            Product.objects.filter(category_id__in=subtree_ids(category_ids))
+            .values_list('id', flat=True))
+    elif action == 'post_clear':
+        _schedule_refresh(getattr(instance, '_cleared_product_ids', set()))
+    elif action in ('post_add', 'post_remove'):
+        category_ids = {instance.pk} if reverse else set(pk_set)
+        _schedule_refresh(set(
+            Product.objects.filter(category_id__in=subtree_ids(category_ids))
+            .values_list('id', flat=True)))
@@ -1,3 +1,145 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from accounts.models import CustomUser
+from basket.models import Basket, BasketItem
+from basket.utils import load_basket_items, build_basket_snapshot
+from category.models import Category
+from products.facets import catalog_version
+from products.models import Product, ProductVariant
+from .models import Offer
+from .utils import refresh_effective_prices, get_discount_info_for_variants, get_offer_index
 
 # Create your tests here.
+
+
+class RefreshEffectivePricesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Protein')
+        self.product = Product.objects.create(name='Whey', description='desc', category=category)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap = ProductVariant.objects.create(product=self.product, price=Decimal('100'), stock=1)
+            self.dear = ProductVariant.objects.create(product=self.product, price=Decimal('200'), stock=1)
+
+    def min_price(self):
+        self.product.refresh_from_db()
+        return self.product.min_effective_price
+
+    def test_nothing_changed_writes_nothing(self):
+        version = catalog_version()
+        Product.objects.filter(id=self.product.id).update(min_effective_price=Decimal('1'))
+
+        self.assertEqual(refresh_effective_prices([self.product.id]), 0)
+
+        # neither the minimum nor the facet counts were touched
+        self.assertEqual(self.min_price(), Decimal('1'))
+        self.assertEqual(catalog_version(), version)
+
+    def test_price_change(self):
+        self.assertEqual(self.min_price(), Decimal('100'))
+        version = catalog_version()
+        ProductVariant.objects.filter(id=self.cheap.id).update(price=Decimal('300'))
+
+        self.assertEqual(refresh_effective_prices([self.product.id]), 1)
+
+        self.assertEqual(self.min_price(), Decimal('200'))
+        self.assertGreater(catalog_version(), version)
+
+    def test_deleted_variant(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap.delete()
+        self.assertEqual(self.min_price(), Decimal('200'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dear.delete()
+        self.assertIsNone(self.min_price())
+
+
+class SqlPricingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Protein')
+        self.product = Product.objects.create(name='Whey', description='desc', category=self.category)
+        self.variant = ProductVariant.objects.create(product=self.product, price=Decimal('200'), stock=5)
+
+    def offer(self, offer_type, name, percent):
+        with self.captureOnCommitCallbacks(execute=True):
+            offer = Offer.objects.create(
+                name=name, offer_type=offer_type, discount_percent=Decimal(percent))
+            if offer_type == 'product':
+                offer.products.add(self.product)
+            else:
+                offer.categories.add(self.category)
+        return offer
+
+    def priced(self):
+        variant = ProductVariant.objects.with_pricing().get(pk=self.variant.pk)
+        return get_discount_info_for_variants([variant])[variant.pk]
+
+    def test_offer_name_is_the_offer_that_set_the_price(self):
+        self.offer('product', 'small deal', 10)
+        self.offer('category', 'big sale', 25)
+
+        info = self.priced()
+        self.assertEqual((info['price'], info['offer_name']), (Decimal('150.00'), 'Big Sale'))
+
+    def test_product_offer_wins_a_tie(self):
+        self.offer('category', 'category sale', 10)
+        self.offer('product', 'product deal', 10)
+
+        self.assertEqual(self.priced()['offer_name'], 'Product Deal')
+
+    def test_matches_the_offer_index(self):
+        self.offer('product', 'small deal', 10)
+        self.offer('category', 'big sale', 25)
+
+        variant = ProductVariant.objects.select_related('product').get(pk=self.variant.pk)
+        info = get_discount_info_for_variants([variant])[variant.pk]
+        self.assertEqual(self.priced(), info)
+
+    def test_basket_prices_in_sql(self):
+        self.offer('category', 'big sale', 25)
+        user = CustomUser.objects.create_user(
+            email='buyer@example.com', full_name='Buyer', password='pw', is_active=True)
+        basket = Basket.objects.create(user=user)
+        BasketItem.objects.create(basket=basket, variant=self.variant, quantity=2)
+
+        items = load_basket_items(user.id)
+        self.assertTrue(hasattr(items[0].variant, 'best_discount'))
+
+        line = build_basket_snapshot(user.id, items)['lines'][items[0].id]
+        self.assertEqual((line['line_total'], line['offer_name']), (Decimal('300.00'), 'Big Sale'))
+
+
+class OfferBoundaryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Protein')
+        self.product = Product.objects.create(name='Whey', description='desc', category=category)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.create(product=self.product, price=Decimal('100'), stock=1)
+            offer = Offer.objects.create(
+                name='flash sale', offer_type='product', discount_percent=Decimal('50'),
+                end_date=timezone.now() + timedelta(hours=1))
+            offer.products.add(self.product)
+
+    def min_price(self):
+        self.product.refresh_from_db()
+        return self.product.min_effective_price
+
+    def test_stored_prices_follow_an_offer_ending(self):
+        get_offer_index()
+        self.assertEqual(self.min_price(), Decimal('50'))
+
+        later = timezone.now() + timedelta(hours=2)
+        with patch('django.utils.timezone.now', return_value=later):
+            get_offer_index()
+
+        self.assertEqual(self.min_price(), Decimal('100'))
@@ -1,47 +1,200 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from django.utils import timezone
-from decimal import Decimal
-from django.db.models import Q
+from decimal import Decimal, ROUND_HALF_UP
+from django.db.models import Q, F, Value, OuterRef, Subquery, CharField, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.core.cache import cache
+from utils.cache import get_version, bump_version
 
 
-def get_best_offer_for_product(product):
+# ----------------------------
+#   ACTIVE OFFER INDEX
+# ----------------------------
+
+# bumped whenever an offer changes
+OFFER_INDEX_VERSION_KEY = 'offers:index_version'
+
+# one process refreshes the stored prices when a boundary passes, see
+# _boundary_passed
+BOUNDARY_REFRESH_SECONDS = 10 * 60
+
+_offer_index = None
+_offer_index_lock = threading.Lock()
+
+
+class ActiveOfferIndex:
+    """
+    In-process map of product_id -> best product offer and
+    category_id -> best category offer for the offers valid right now.
+    Category offers also cover every subcategory below them.
+
+    The index is only good until `expires_at`, the next start_date/end_date
+    boundary of any known offer, after which it has to be rebuilt.
+    """
+
+    def __init__(self, by_product, by_category, expires_at, version):
+        self.by_product = by_product
+        self.by_category = by_category
+        self.expires_at = expires_at
+        self.version = version
+
+    def is_fresh(self, now, version):
+        if version != self.version:
+            return False
+        return self.expires_at is None or now < self.expires_at
+
+    def best_offer_for(self, product_id, category_id):
+        product_offer = self.by_product.get(product_id)
+        category_offer = self.by_category.get(category_id)
+
+        # product offers win ties, same as max() over product + category offers
+        if product_offer and category_offer:
+            if category_offer.discount_percent > product_offer.discount_percent:
+                return category_offer
+            return product_offer
+        return product_offer or category_offer
+
+
+def _keep_best(index, key, offer):
+    current = index.get(key)
+    if current is None or offer.discount_percent > current.discount_percent:
+        index[key] = offer
+
+
+def build_offer_index(version=None):
+    """
+    Load every active, not yet expired offer together with its product and
+    category links (three queries) and index the ones valid right now.
+    """
+    from category.utils import subtree_ids
     from .models import Offer
 
     now = timezone.now()
 
-    product_offers = Offer.objects.filter(
-        offer_type='product',
-        products=product,
-        active=True,
-        start_date__lte=now).filter(
-        Q(
-            end_date__gte=now) | Q(
-                end_date__isnull=True))
+    offers = list(
+        Offer.objects.filter(active=True, discount_percent__isnull=False)
+        .filter(Q(end_date__gte=now) | Q(end_date__isnull=True))
+    )
+    offer_ids = [offer.id for offer in offers]
 
-    category_offers = Offer.objects.filter(
-        offer_type='category',
-        categories=product.category,
-        active=True,
-        start_date__lte=now).filter(
-        Q(
-            end_date__gte=now) | Q(
-                end_date__isnull=True))
+    product_links = Offer.products.through.objects.filter(
+        offer_id__in=offer_ids).values_list('offer_id', 'product_id')
+    category_links = Offer.categories.through.objects.filter(
+        offer_id__in=offer_ids).values_list('offer_id', 'category_id')
+
+    products_by_offer = {}
+    for offer_id, product_id in product_links:
+        products_by_offer.setdefault(offer_id, []).append(product_id)
+
+    categories_by_offer = {}
+    for offer_id, category_id in category_links:
+        categories_by_offer.setdefault(offer_id, []).append(category_id)
 
-    all_offers = list(product_offers) + list(category_offers)
+    by_product = {}
+    by_category = {}
+    boundaries = []
 
-    if not all_offers:
-        
-        return None
+    # offers come newest first (Meta.ordering), so the newest wins a tie
+    for offer in offers:
+        if offer.start_date > now:
+            # not started yet, only its start matters for expiry
+            boundaries.append(offer.start_date)
+            continue
 
-    # Ensure discount_percent is valid
-    valid_offers = [o for o in all_offers if o.discount_percent is not None]
+        if offer.end_date is not None:
+            boundaries.append(offer.end_date)
 
-    if not valid_offers:
-       
-        return None
+        if offer.offer_type == 'product':
+            for product_id in products_by_offer.get(offer.id, []):
+                _keep_best(by_product, product_id, offer)
+        elif offer.offer_type == 'category':
+            for category_id in subtree_ids(categories_by_offer.get(offer.id, [])):
+                _keep_best(by_category, category_id, offer)
 
-    best_offer = max(valid_offers, key=lambda o: o.discount_percent)
-  
-    return best_offer
+    expires_at = min(boundaries) if boundaries else None
+
+    return ActiveOfferIndex(by_product, by_category, expires_at, version)
+
+
+def get_offer_index():
+    """
+    Return the current offer index, rebuilding it when an offer changed
+    (in this or another process) or a start/end boundary has passed.
+    """
+    global _offer_index
+
+    now = timezone.now()
+    version = get_version(OFFER_INDEX_VERSION_KEY)
+
+    index = _offer_index
+    if index is not None and index.is_fresh(now, version):
+        return index
+
+    expired = None
+    with _offer_index_lock:
+        index = _offer_index
+        if index is None or not index.is_fresh(now, version):
+            if index is not None and index.version == version:
+                expired = index
+            index = build_offer_index(version)
+            _offer_index = index
+
+    if expired is not None:
+        _boundary_passed(expired, index)
+    return index
+
+
+def _changed_offers(old, new):
+    """
+    Keys of an index map (product or category ids) whose best offer differs.
+    """
+    return {
+        key for key in old.keys() | new.keys()
+        if getattr(old.get(key), 'pk', None) != getattr(new.get(key), 'pk', None)}
+
+
+def _boundary_passed(expired, index):
+    """
+    An offer started or ended on schedule, with no save to trigger the offer
+    signals: refresh the stored prices of the products whose best offer
+    changed, so the listing's price filter and sort match the cards. The
+    first process to notice a boundary does it for everyone.
+    """
+    from products.models import Product
+
+    lock_key = f"offers:boundary_refresh:{expired.expires_at.isoformat()}"
+    if not cache.add(lock_key, True, BOUNDARY_REFRESH_SECONDS):
+        return
+
+    product_ids = _changed_offers(expired.by_product, index.by_product)
+    category_ids = _changed_offers(expired.by_category, index.by_category)
+    if category_ids:
+        product_ids.update(
+            Product.objects.filter(category_id__in=category_ids)
+            .values_list('id', flat=True))
+    if product_ids:
+        refresh_effective_prices(product_ids)
+
+
+def invalidate_offer_index():
+    """
+    Drop the index here and tell other processes to rebuild theirs.
+    """
+    global _offer_index
+
+    _offer_index = None
+    bump_version(OFFER_INDEX_VERSION_KEY)
+
+
+def get_best_offer_for_product(product):
+    """
+    Return the best running offer (product or category) for a product,
+    served from the active offer index.
+    """
+
+    return get_offer_index().best_offer_for(product.pk, product.category_id)
 
 
 def get_discounted_price(product):
@@ -55,28 +208,163 @@ def get_discounted_price(product):
     return product.price
 
 
-def get_discount_info_for_variant(variant):
+# ----------------------------
+#   SQL PRICING EXPRESSIONS
+# ----------------------------
+
+PRICE_FIELD = DecimalField(max_digits=10, decimal_places=2)
+PERCENT_FIELD = DecimalField(max_digits=5, decimal_places=2)
+
+
+def price_after_discount(price, discount_percent):
     """
-    returns a dict with price info for a varian, including offers
+    Price after a percentage discount, rounded half up to paise.
+    Python twin of final_price_expression.
     """
-    from products.models import Product, ProductVariant
+    discounted_price = price * (100 - Decimal(discount_percent)) / 100
+    return discounted_price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
-    best_offer = get_best_offer_for_product(variant.product)
-    variant_price = variant.price
 
-    if best_offer and best_offer.active and (
-            best_offer.start_date <= timezone.now() and (
-            best_offer.end_date is None or best_offer.end_date >= timezone.now())):
+def _running_offers(product_ref, category_path_ref):
+    """
+    Running product offers of a product and running category offers on its
+    category or any ancestor (matched by materialized path prefix), open-ended
+    offers included. Best first, the newest winning a tie like the offer index.
+    """
+    from .models import Offer
+
+    now = timezone.now()
+    running_offers = Offer.objects.filter(
+        active=True,
+        discount_percent__isnull=False,
+        start_date__lte=now).filter(
+        Q(end_date__gte=now) | Q(end_date__isnull=True))
+
+    product_offers = running_offers.filter(
+        offer_type='product',
+        products=OuterRef(product_ref),
+    ).order_by('-discount_percent', '-created_at')
 
+    category_offers = running_offers.filter(
+        offer_type='category',
+    ).annotate(
+        product_category_path=ExpressionWrapper(
+            OuterRef(category_path_ref), output_field=CharField()),
+    ).filter(
+        product_category_path__startswith=F('categories__path'),
+    ).order_by('-discount_percent', '-created_at')
+
+    return product_offers, category_offers
+
+
+def best_discount_expression(product_ref='pk', category_path_ref='category__path'):
+    """
+    SQL expression for the best running discount percent of a product: the
+    larger of its best product offer and its best category offer. Same rule
+    as get_best_offer_for_product.
+    """
+    product_offers, category_offers = _running_offers(product_ref, category_path_ref)
+
+    return Greatest(
+        Coalesce(Subquery(product_offers.values('discount_percent')[:1]),
+                 Value(Decimal(0)), output_field=PERCENT_FIELD),
+        Coalesce(Subquery(category_offers.values('discount_percent')[:1]),
+                 Value(Decimal(0)), output_field=PERCENT_FIELD),
+        output_field=PERCENT_FIELD,
+    )
+
+
+def best_offer_name_expression(discount_ref, product_ref='pk', category_path_ref='category__path'):
+    """
+    SQL expression for the name of the offer that gave the discount in
+    discount_ref: a product offer wins a tie, as in ActiveOfferIndex.
+    """
+    product_offers, category_offers = _running_offers(product_ref, category_path_ref)
+
+    return Coalesce(
+        Subquery(product_offers.filter(
+            discount_percent=OuterRef(discount_ref)).values('name')[:1]),
+        Subquery(category_offers.filter(
+            discount_percent=OuterRef(discount_ref)).values('name')[:1]),
+        output_field=CharField(),
+    )
+
+
+def final_price_expression(price_ref, discount_ref):
+    """
+    SQL twin of price_after_discount.
+    """
+    # multiplied by 0.01 instead of divided by 100: SQLite casts whole
+    # numbers to integers and would truncate 55 * 50 / 100 to 27
+    return Round(
+        F(price_ref) * (Value(Decimal(100)) - F(discount_ref)) * Value(Decimal('0.01')),
+        2,
+        output_field=PRICE_FIELD,
+    )
+
+
+def variant_pricing_annotations():
+    """
+    Annotations used by ProductVariant.objects.with_pricing().
+    """
+    return {
+        'best_discount': best_discount_expression('product_id', 'product__category__path'),
+        'best_offer_name': best_offer_name_expression(
+            'best_discount', 'product_id', 'product__category__path'),
+        'final_price': final_price_expression('price', 'best_discount'),
+        'save_amount': ExpressionWrapper(F('price') - F('final_price'), output_field=PRICE_FIELD),
+    }
+
+
+# ----------------------------
+#   VARIANT PRICING
+# ----------------------------
+
+# variant price dicts already computed in the current request
+_pricing_memo = ContextVar('pricing_memo', default=None)
+
+
+@contextmanager
+def pricing_context():
+    """
+    Reuse variant price dicts for everything priced inside the block.
+    Wrapped around every request by PricingContextMiddleware.
+    """
+    token = _pricing_memo.set({})
+    try:
+        yield
+    finally:
+        _pricing_memo.reset(token)
+
+
+def _memo_key(variant):
+    # the price is part of the key so an edited variant is never served stale
+    return (variant.pk, variant.price)
+
+
+def _build_discount_info(variant, best_offer):
+    variant_price = variant.price
+    now = timezone.now()
+
+    discount_percent = Decimal(0)
+    if hasattr(variant, 'best_discount'):
+        # already priced in SQL by ProductVariant.objects.with_pricing()
+        discount_percent = Decimal(str(variant.best_discount))
+        discounted_price = Decimal(str(variant.final_price)).quantize(Decimal('0.01'))
+        offer_name = variant.best_offer_name
+    elif best_offer and best_offer.active and (
+            best_offer.start_date <= now and (
+            best_offer.end_date is None or best_offer.end_date >= now)):
         discount_percent = Decimal(best_offer.discount_percent)
-        discount_amount = (variant_price * discount_percent) / 100
-        discounted_price = variant_price - discount_amount
+        discounted_price = price_after_discount(variant_price, discount_percent)
+        offer_name = best_offer.name
 
+    if discount_percent > 0:
         return {
-            'price': round(discounted_price, 2),
+            'price': discounted_price,
             'original_price': round(variant_price, 2),
-            'save_price': round(discount_amount, 2),
-            'offer_name': best_offer.name.title(),
+            'save_price': variant_price - discounted_price,
+            'offer_name': offer_name.title() if offer_name else None,
             'discount_percent': discount_percent,
         }
 
@@ -88,3 +376,130 @@ def get_discount_info_for_variant(variant):
         'offer_name': None,
         'discount_percent': 0,
     }
+
+
+def get_discount_info_for_variant(variant):
+    """
+    returns a dict with price info for a varian, including offers
+    """
+
+    memo = _pricing_memo.get()
+    key = _memo_key(variant)
+    if memo is not None and key in memo:
+        return memo[key]
+
+    best_offer = None
+    if not hasattr(variant, 'best_discount'):
+        best_offer = get_best_offer_for_product(variant.product)
+    info = _build_discount_info(variant, best_offer)
+
+    if memo is not None:
+        memo[key] = info
+    return info
+
+
+def get_discount_info_for_variants(variants):
+    """
+    Price many variants at once and return {variant_id: price dict}.
+
+    Variants from ProductVariant.objects.with_pricing() are already priced.
+    The rest are priced from the active offer index, so the only query made
+    is one lookup of category ids for variants whose product is not loaded.
+    """
+    from products.models import Product, ProductVariant
+
+    variants = list(variants)
+    memo = _pricing_memo.get()
+    index = get_offer_index()
+
+    # category ids of the products we still have to look up
+    missing_product_ids = {
+        variant.product_id for variant in variants
+        if not hasattr(variant, 'best_discount')
+        and not ProductVariant.product.is_cached(variant)
+    }
+    category_ids = dict(
+        Product.objects.filter(id__in=missing_product_ids)
+        .values_list('id', 'category_id')
+    ) if missing_product_ids else {}
+
+    discount_infos = {}
+    for variant in variants:
+        key = _memo_key(variant)
+        if memo is not None and key in memo:
+            discount_infos[variant.pk] = memo[key]
+            continue
+
+        best_offer = None
+        if not hasattr(variant, 'best_discount'):
+            if ProductVariant.product.is_cached(variant):
+                category_id = variant.product.category_id
+            else:
+                category_id = category_ids.get(variant.product_id)
+            best_offer = index.best_offer_for(variant.product_id, category_id)
+        info = _build_discount_info(variant, best_offer)
+
+        if memo is not None:
+            memo[key] = info
+        discount_infos[variant.pk] = info
+
+    return discount_infos
+
+
+# ----------------------------
+#   STORED EFFECTIVE PRICES
+# ----------------------------
+
+def refresh_effective_prices(product_ids=None, batch_size=2000, variants_removed_from=()):
+    """
+    Recompute the stored ProductVariant.effective_price/discount_percent and
+    Product.min_effective_price used by the listing filters and sorts, priced
+    by ProductVariant.objects.with_pricing() like everything else.
+
+    Pass product_ids to limit the refresh to those products. Only variants
+    whose numbers actually changed are written back, and only their products'
+    minimums. Products that lost a variant (variants_removed_from) get their
+    minimum recomputed regardless.
+    """
+    from django.db.models import Min, OuterRef, Subquery
+    from products.facets import bump_catalog_version
+    from products.models import Product, ProductVariant
+
+    variants = ProductVariant.objects.with_pricing().only(
+        'product_id', 'price', 'effective_price', 'discount_percent')
+    if product_ids is not None:
+        product_ids = set(product_ids)
+        variants = variants.filter(product_id__in=product_ids)
+
+    changed_variants = []
+    changed_product_ids = set(variants_removed_from)
+
+    for variant in variants.iterator(chunk_size=batch_size):
+        info = _build_discount_info(variant, None)
+
+        if (variant.effective_price != info['price']
+                or variant.discount_percent != info['discount_percent']):
+            variant.effective_price = info['price']
+            variant.discount_percent = info['discount_percent']
+            changed_variants.append(variant)
+            changed_product_ids.add(variant.product_id)
+
+    ProductVariant.objects.bulk_update(
+        changed_variants, ['effective_price', 'discount_percent'],
+        batch_size=batch_size)
+
+    if changed_product_ids:
+        min_price = ProductVariant.objects.filter(
+            product=OuterRef('pk')).values('product').annotate(
+            min_price=Min('effective_price')).values('min_price')[:1]
+
+        changed_product_ids = list(changed_product_ids)
+        for start in range(0, len(changed_product_ids), batch_size):
+            Product.objects.filter(
+                id__in=changed_product_ids[start:start + batch_size]
+            ).update(min_effective_price=Subquery(min_price))
+
+        # price bands are counted on the stored prices
+        bump_catalog_version()
+
+    return len(changed_variants)
@@ -7,6 +7,7 @@ from .forms import OfferForm
 from django.utils import timezone
 from products.models import Product
 from category.models import Category
+from category.utils import get_category_tree
 from django.db.models import Q
 
 # Create your views here.
@@ -55,7 +56,7 @@ def admin_add_offer(request):
     to add new offers
     """
 
-    categories = Category.objects.filter(is_active=True)
+    categories = [category for category in get_category_tree().categories if category.is_active]
     products = Product.objects.filter(is_listed=True)
 
     if request.method == 'POST':
@@ -107,7 +108,7 @@ def admin_edit_offer(request, offer_id):
 
     offer = get_object_or_404(Offer, id=offer_id)
     products = Product.objects.filter(is_listed=True)
-    categories = Category.objects.filter(is_active=True)
+    categories = [category for category in get_category_tree().categories if category.is_active]
 
     if request.method == 'POST':
         form = OfferForm(request.POST, instance=offer)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from orders.utils import rebuild_sales_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the product and category sales statistics from the order items. "
+        "Schedule it daily (e.g. cron: 0 3 * * *): orders only add to the "
+        "last-30-days figures, this is what drops older sales from them."
+    )
+
+    def handle(self, *args, **options):
+        products, categories = rebuild_sales_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt sales stats for {products} product(s) and {categories} category(ies)."))
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_sales_stats(apps, schema_editor):
+    from orders.utils import rebuild_sales_stats
+
+    rebuild_sales_stats(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('category', '0008_category_promo_image'),
+        ('orders', '0038_remove_orderitem_product_image'),
+        ('products', '0016_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySalesStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_stats', serialize=False, to='category.category')),
+                ('units_sold', models.PositiveIntegerField(db_index=True, default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units_last_30_days', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductSalesStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_stats', serialize=False, to='products.product')),
+                ('units_sold', models.PositiveIntegerField(db_index=True, default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units_last_30_days', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_sales_stats, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,8 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
-from products.models import ProductVariant
+from products.models import Product, ProductVariant
+from category.models import Category
 import random
 import string
 # Create your models here.
@@ -315,4 +316,40 @@ class OrderItem(models.Model):
             "OrderItem.price no longer exists. Use `price_at_purchase` instead."
         )
 
-    
\ No newline at end of file
+    
+
+# Pre-aggregated sales figures, kept up to date by orders.signals and
+# rebuilt from scratch by the rebuild_sales_stats command.
+# Cancelled and returned items don't count.
+class ProductSalesStats(models.Model):
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sales_stats')
+
+    units_sold = models.PositiveIntegerField(default=0, db_index=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    units_last_30_days = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product} - {self.units_sold} sold"
+
+
+class CategorySalesStats(models.Model):
+    category = models.OneToOneField(
+        Category,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sales_stats')
+
+    units_sold = models.PositiveIntegerField(default=0, db_index=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    units_last_30_days = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.category} - {self.units_sold} sold"
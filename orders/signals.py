@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import OrderItem
+from .utils import item_counts_as_sale, sales_stats_changes, apply_sales_stats_changes
+
+
+def _schedule_stats_changes(item, sign):
+    changes = sales_stats_changes(item, sign)
+    if changes:
+        # the shared stats rows are only locked once the order is committed
+        transaction.on_commit(lambda: apply_sales_stats_changes(changes))
+
+
+@receiver(post_init, sender=OrderItem)
+def remember_sale_state(sender, instance, **kwargs):
+    # read the loaded values directly so deferred fields don't cost a query
+    values = instance.__dict__
+    instance._counted_as_sale = (
+        instance.pk is not None
+        and not values.get('is_cancelled', False)
+        and not values.get('is_returned', False)
+    )
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, created, **kwargs):
+    counted = item_counts_as_sale(instance)
+
+    # placed, cancelled, returned (or a cancellation undone)
+    if counted != instance._counted_as_sale:
+        _schedule_stats_changes(instance, 1 if counted else -1)
+        instance._counted_as_sale = counted
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, **kwargs):
+    if instance._counted_as_sale:
+        _schedule_stats_changes(instance, -1)
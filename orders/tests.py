@@ -1,3 +1,139 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
+from django.urls import reverse
+from accounts.models import CustomUser
+from category.models import Category
+from products.models import Product, ProductVariant
+from .models import Order, ProductSalesStats, CategorySalesStats
+from .utils import (
+    order_quantities, reserve_stock, create_order_items, InsufficientStock,
+    rebuild_sales_stats)
 
 # Create your tests here.
+
+
+class StockReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email='buyer@example.com', full_name='Buyer', password='pw', is_active=True)
+        cls.category = Category.objects.create(name='Protein')
+        cls.whey = Product.objects.create(name='Whey', description='desc', category=cls.category)
+        cls.bar = Product.objects.create(name='Bar', description='desc', category=cls.category)
+        cls.whey_1kg = ProductVariant.objects.create(product=cls.whey, price=Decimal('100'), stock=5)
+        cls.whey_2kg = ProductVariant.objects.create(product=cls.whey, price=Decimal('180'), stock=1)
+        cls.bar_box = ProductVariant.objects.create(product=cls.bar, price=Decimal('50'), stock=10)
+
+    def stock(self, variant):
+        variant.refresh_from_db()
+        return variant.stock
+
+    def test_order_quantities_adds_up_lines_of_a_variant(self):
+        self.assertEqual(order_quantities([(1, 2), (2, 1), (1, 3)]), {1: 5, 2: 1})
+
+    def test_reserve_stock_decrements_every_line(self):
+        with transaction.atomic():
+            variants = reserve_stock({self.whey_1kg.id: 2, self.bar_box.id: 3})
+
+        self.assertEqual(set(variants), {self.whey_1kg.id, self.bar_box.id})
+        self.assertEqual(self.stock(self.whey_1kg), 3)
+        self.assertEqual(self.stock(self.bar_box), 7)
+        self.whey.refresh_from_db()
+        self.assertEqual(self.whey.total_stock, 4)
+
+    def test_reserve_stock_reports_every_short_line(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            with transaction.atomic():
+                reserve_stock({self.whey_1kg.id: 6, self.whey_2kg.id: 2, self.bar_box.id: 1})
+
+        self.assertEqual(
+            [(variant.id, quantity) for variant, quantity in raised.exception.shortages],
+            [(self.whey_1kg.id, 6), (self.whey_2kg.id, 2)])
+        self.assertEqual(str(raised.exception), "Not enough stock for Whey. Only 5 left.")
+        self.assertEqual(self.stock(self.bar_box), 10)
+
+    def test_reserve_stock_nothing_to_reserve(self):
+        with transaction.atomic():
+            with self.assertNumQueries(0):
+                self.assertEqual(reserve_stock({}), {})
+        self.assertEqual(self.stock(self.whey_1kg), 5)
+
+    def test_reserve_stock_missing_variant(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            with transaction.atomic():
+                reserve_stock({0: 1})
+        self.assertEqual(raised.exception.shortages, [(None, 1)])
+
+    def test_short_line_rolls_back_the_whole_order(self):
+        with self.assertRaises(InsufficientStock):
+            with transaction.atomic():
+                order = Order.objects.create(user=self.user, total=Decimal('0'))
+                create_order_items(order, {self.bar_box.id: 1, self.whey_2kg.id: 2})
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(self.bar_box), 10)
+        self.assertEqual(self.stock(self.whey_2kg), 1)
+
+    def test_create_order_items(self):
+        with transaction.atomic():
+            order = Order.objects.create(user=self.user, total=Decimal('0'))
+            items = create_order_items(
+                order, {self.whey_1kg.id: 2, self.bar_box.id: 1},
+                {self.whey_1kg.id: Decimal('90'), self.bar_box.id: Decimal('50')},
+                status='confirmed')
+
+        self.assertEqual(len(items), 2)
+        self.assertEqual(
+            sorted(order.items.values_list('variant_id', 'quantity', 'price_at_purchase', 'status')),
+            sorted([(self.whey_1kg.id, 2, Decimal('180.00'), 'confirmed'),
+                    (self.bar_box.id, 1, Decimal('50.00'), 'confirmed')]))
+        self.assertEqual(self.stock(self.whey_1kg), 3)
+
+    def test_create_order_items_prices_at_current_offers(self):
+        with transaction.atomic():
+            order = Order.objects.create(user=self.user, total=Decimal('0'))
+            items = create_order_items(order, {self.bar_box.id: 2})
+
+        self.assertEqual(items[0].price_at_purchase, Decimal('100'))
+
+    def test_sales_stats_deltas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                order = Order.objects.create(user=self.user, total=Decimal('0'))
+                create_order_items(
+                    order, {self.whey_1kg.id: 2, self.whey_2kg.id: 1, self.bar_box.id: 3},
+                    {self.whey_1kg.id: Decimal('100'), self.whey_2kg.id: Decimal('180'),
+                     self.bar_box.id: Decimal('50')})
+
+        whey = ProductSalesStats.objects.get(product=self.whey)
+        self.assertEqual((whey.units_sold, whey.revenue, whey.order_count), (3, Decimal('380'), 1))
+        bar = ProductSalesStats.objects.get(product=self.bar)
+        self.assertEqual((bar.units_sold, bar.revenue, bar.order_count), (3, Decimal('150'), 1))
+        category = CategorySalesStats.objects.get(category=self.category)
+        self.assertEqual(
+            (category.units_sold, category.revenue, category.order_count, category.units_last_30_days),
+            (6, Decimal('530'), 1, 6))
+
+        # the same figures a full recount gives
+        live = sorted(ProductSalesStats.objects.values_list(
+            'product_id', 'units_sold', 'revenue', 'order_count', 'units_last_30_days'))
+        rebuild_sales_stats()
+        self.assertEqual(live, sorted(ProductSalesStats.objects.values_list(
+            'product_id', 'units_sold', 'revenue', 'order_count', 'units_last_30_days')))
+
+
+class OrderListTests(TestCase):
+
+    def test_count_includes_an_order_just_placed(self):
+        cache.clear()
+        user = CustomUser.objects.create_user(
+            email='buyer@example.com', full_name='Buyer', password='pw', is_active=True)
+        self.client.force_login(user)
+        Order.objects.create(user=user, total=Decimal('10'))
+        self.assertContains(self.client.get(reverse('order_list')), 'There are 1 order')
+
+        Order.objects.create(user=user, total=Decimal('10'))
+        self.assertContains(self.client.get(reverse('order_list')), 'There are 2 orders')
@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.db.models import F
 from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
 
@@ -20,6 +21,130 @@ def decrement_stock(variant, qty):
     variant.save(update_fields=['stock'])
 
 
+# ----------------------------
+#   STOCK RESERVATION
+# ----------------------------
+
+class InsufficientStock(Exception):
+    """
+    Some lines of an order can't be served. `shortages` holds
+    (variant or None, requested quantity) for each of them.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        variant, _ = shortages[0]
+        if variant is None:
+            message = "A product in your basket is no longer available."
+        else:
+            message = f"Not enough stock for {variant.product.name}. Only {variant.stock} left."
+        super().__init__(message)
+
+
+def order_quantities(lines):
+    """
+    {variant_id: quantity} of (variant_id, quantity) lines, adding up lines
+    of the same variant (a basket can hold more than one).
+    """
+    quantities = {}
+    for variant_id, quantity in lines:
+        quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+    return quantities
+
+
+def reserve_stock(quantities):
+    """
+    Take the stock for {variant_id: quantity} inside the caller's
+    transaction:
+
+      1. lock every variant in one SELECT ... FOR UPDATE, ordered by id so
+         concurrent checkouts always lock in the same order and can't
+         deadlock each other
+      2. check all of them, raising InsufficientStock for every short line
+      3. decrement all of them in one UPDATE ... WHERE stock >= quantity
+
+    Returns {variant_id: locked variant} with product, flavor and weight
+    loaded and stock as it was before the decrement.
+    """
+    from django.db.models import Case, When, Value, Q
+    from products.models import ProductVariant
+    from products.utils import stock_changed
+
+    # an empty Q() would match, and decrement, every variant
+    if not quantities:
+        return {}
+
+    variants = {
+        variant.id: variant for variant in
+        ProductVariant.objects.select_for_update(of=('self',))
+        .select_related('product', 'flavor', 'weight')
+        .filter(id__in=quantities).order_by('id')
+    }
+
+    shortages = [
+        (variants.get(variant_id), quantity) for variant_id, quantity in quantities.items()
+        if variant_id not in variants or variants[variant_id].stock < quantity]
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    enough = Q()
+    for variant_id, quantity in quantities.items():
+        enough |= Q(id=variant_id, stock__gte=quantity)
+
+    updated = ProductVariant.objects.filter(enough).update(stock=F('stock') - Case(
+        *[When(id=variant_id, then=Value(quantity)) for variant_id, quantity in quantities.items()],
+        default=Value(0)))
+
+    # can't happen with the rows locked, but never sell what isn't there
+    if updated != len(quantities):
+        raise InsufficientStock([(variants[variant_id], quantities[variant_id]) for variant_id in quantities])
+
+    stock_changed({variant.product_id for variant in variants.values()})
+    return variants
+
+
+def create_order_items(order, quantities, unit_prices=None, status='pending'):
+    """
+    Reserve the stock for {variant_id: quantity} and bulk create the order
+    items, priced from {variant_id: unit price} or else at the current
+    offer price of the locked variants (ProductVariant.objects.with_pricing()).
+    Raises InsufficientStock, so call it inside the order's transaction.
+    """
+    from offers.utils import get_discount_info_for_variants
+    from products.models import ProductVariant
+    from .models import OrderItem
+
+    variants = reserve_stock(quantities)
+
+    if unit_prices is None:
+        discount_infos = get_discount_info_for_variants(
+            ProductVariant.objects.with_pricing().filter(id__in=variants))
+        unit_prices = {variant_id: info['price'] for variant_id, info in discount_infos.items()}
+
+    items = OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            variant=variant,
+            quantity=quantities[variant_id],
+            # snapshot fields
+            product_name=variant.product.name,
+            flavor_name=variant.flavor.flavor if variant.flavor else None,
+            weight_label=variant.weight.weight if variant.weight else None,
+            price_at_purchase=Decimal(unit_prices[variant_id]) * quantities[variant_id],
+            status=status,
+        )
+        for variant_id, variant in variants.items()
+    ])
+
+    # bulk_create skips the item signals that keep the sales stats
+    for item in items:
+        item._counted_as_sale = True
+    changes = order_placed_stats_changes(items)
+    transaction.on_commit(lambda: apply_sales_stats_changes(changes))
+
+    return items
+
+
 def calculate_strict_voucher_refund(order, affected_items):
     """
     Strict voucher refund logic.
@@ -70,3 +195,171 @@ def calculate_strict_voucher_refund(order, affected_items):
                 order.amount_paid}, refund={refund_amount}, revoked={discount_revoked}")
 
     return refund_amount, discount_revoked, remaining_total
+
+
+# ----------------------------
+#   SALES STATISTICS
+# ----------------------------
+
+# window of the "recent units" column; order deltas only add to it, the
+# daily rebuild_sales_stats drops what falls out of the window
+RECENT_SALES_DAYS = 30
+
+
+def item_counts_as_sale(item):
+    return not item.is_cancelled and not item.is_returned
+
+
+def _bump_stats(model, key, deltas):
+    """
+    Add deltas to one stats row with a single UPDATE, creating the row the
+    first time something sells.
+    """
+    from django.db import IntegrityError, transaction
+
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(**changes):
+        return
+
+    # a missing row with negative deltas is left for rebuild_sales_stats
+    if any(value < 0 for value in deltas.values()):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        model.objects.filter(**key).update(**changes)
+
+
+def sales_stats_changes(item, sign):
+    """
+    Stats row updates that add (sign=1) or remove (sign=-1) one order item,
+    as (model, key, deltas). Worked out when the item changes, since the
+    order counts depend on the other items of the order at that moment.
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from products.models import ProductVariant
+    from .models import OrderItem, ProductSalesStats, CategorySalesStats
+
+    if item.variant_id is None:
+        return []
+
+    ids = ProductVariant.objects.filter(pk=item.variant_id).values_list(
+        'product_id', 'product__category_id').first()
+    if ids is None:
+        return []
+    product_id, category_id = ids
+
+    recent_since = timezone.now() - timedelta(days=RECENT_SALES_DAYS)
+    is_recent = item.order.created_at >= recent_since
+
+    # other counted items of this order already account for the order
+    counted_siblings = OrderItem.objects.filter(
+        order_id=item.order_id, is_cancelled=False, is_returned=False,
+    ).exclude(pk=item.pk)
+
+    deltas = {
+        'units_sold': sign * item.quantity,
+        'revenue': sign * item.price_at_purchase,
+        'units_last_30_days': sign * item.quantity if is_recent else 0,
+    }
+
+    changes = [(ProductSalesStats, {'product_id': product_id}, {
+        **deltas,
+        'order_count': 0 if counted_siblings.filter(
+            variant__product_id=product_id).exists() else sign,
+    })]
+
+    if category_id is not None:
+        changes.append((CategorySalesStats, {'category_id': category_id}, {
+            **deltas,
+            'order_count': 0 if counted_siblings.filter(
+                variant__product__category_id=category_id).exists() else sign,
+        }))
+
+    return changes
+
+
+def order_placed_stats_changes(items):
+    """
+    sales_stats_changes() for all items of a newly placed order at once,
+    from their loaded variants: one row update per product and category.
+    """
+    from .models import ProductSalesStats, CategorySalesStats
+
+    rows = {}
+    for item in items:
+        variant = item.variant
+        for model, key in ((ProductSalesStats, ('product_id', variant.product_id)),
+                           (CategorySalesStats, ('category_id', variant.product.category_id))):
+            if key[1] is None:
+                continue
+            deltas = rows.setdefault((model, key), {
+                'units_sold': 0, 'revenue': 0, 'units_last_30_days': 0, 'order_count': 1})
+            deltas['units_sold'] += item.quantity
+            deltas['revenue'] += item.price_at_purchase
+            deltas['units_last_30_days'] += item.quantity
+
+    return [(model, dict([key]), deltas) for (model, key), deltas in rows.items()]
+
+
+def apply_sales_stats_changes(changes):
+    for model, key, deltas in changes:
+        _bump_stats(model, key, deltas)
+
+
+def rebuild_sales_stats(apps=None):
+    """
+    Recompute every stats row from the order items. Also the only way the
+    last-30-days column ages out: order deltas only add to it, so the
+    rebuild_sales_stats command has to run daily (see README, Scheduled
+    jobs). Migrations pass their app registry in.
+    """
+    from datetime import timedelta
+    from django.apps import apps as global_apps
+    from django.db import transaction
+    from django.db.models import Sum, Count, Q
+    from django.db.models.functions import Coalesce
+    from django.utils import timezone
+
+    apps = apps or global_apps
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    ProductSalesStats = apps.get_model('orders', 'ProductSalesStats')
+    CategorySalesStats = apps.get_model('orders', 'CategorySalesStats')
+
+    recent_since = timezone.now() - timedelta(days=RECENT_SALES_DAYS)
+    counted = OrderItem.objects.filter(
+        is_cancelled=False, is_returned=False, variant__isnull=False)
+
+    def aggregate(group_by):
+        return counted.filter(**{f"{group_by}__isnull": False}).values(group_by).annotate(
+            units=Sum('quantity'),
+            total=Sum('price_at_purchase'),
+            orders=Count('order', distinct=True),
+            recent=Coalesce(Sum('quantity', filter=Q(order__created_at__gte=recent_since)), 0),
+        )
+
+    product_rows = [
+        ProductSalesStats(
+            product_id=row['variant__product'], units_sold=row['units'],
+            revenue=row['total'], order_count=row['orders'],
+            units_last_30_days=row['recent'])
+        for row in aggregate('variant__product')
+    ]
+    category_rows = [
+        CategorySalesStats(
+            category_id=row['variant__product__category'], units_sold=row['units'],
+            revenue=row['total'], order_count=row['orders'],
+            units_last_30_days=row['recent'])
+        for row in aggregate('variant__product__category')
+    ]
+
+    with transaction.atomic():
+        ProductSalesStats.objects.all().delete()
+        CategorySalesStats.objects.all().delete()
+        ProductSalesStats.objects.bulk_create(product_rows, batch_size=1000)
+        CategorySalesStats.objects.bulk_create(category_rows, batch_size=1000)
+
+    return len(product_rows), len(category_rows)
@@ -2,7 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.http import HttpResponse, Http404
-from django.db.models import Q, Sum, Count
+from django.db.models import Q, Sum, Count, Exists, OuterRef, Prefetch, prefetch_related_objects
 from django.utils import timezone
 from datetime import timedelta, date
 import io
@@ -12,7 +12,7 @@ from .models import Order, OrderItem
 from .forms import CancelItemForm, CancelOrderForm, ReturnItemForm, AdminOrderStatusForm
 from .utils import increment_stock, decrement_stock, calculate_strict_voucher_refund
 from django.urls import reverse
-from django.core.paginator import Paginator
+from utils.pagination import get_pagination
 from django.contrib.admin.views.decorators import staff_member_required
 from django.template.loader import render_to_string
 from weasyprint import HTML
@@ -57,6 +57,12 @@ def order_failure(request):
     return render(request, 'order_failure.html', context)
 
 
+def _items_matching(q):
+    # an EXISTS keeps the order rows unique without a DISTINCT over the join
+    return OrderItem.objects.filter(
+        order=OuterRef('pk'), variant__product__name__icontains=q)
+
+
 # order list with search and filter
 @login_required
 def order_list(request):
@@ -73,7 +79,7 @@ def order_list(request):
     q = request.GET.get('q')
     if q:
         orders = orders.filter(Q(order_id__icontains=q) | Q(
-            items__variant__product__name__icontains=q)).distinct()
+            Exists(_items_matching(q))))
 
     # filter by status
     status = request.GET.get('status')
@@ -82,9 +88,12 @@ def order_list(request):
 
     # pagination
 
-    paginator = Paginator(orders, 10)
-    page_no = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_no)
+    page_obj = get_pagination(request, orders, per_page=10, keyset=True)
+
+    # one query for the items (and their images) of the whole page
+    prefetch_related_objects(page_obj.object_list, Prefetch(
+        'items', queryset=OrderItem.objects.select_related(
+            'variant__product__primary_image')))
 
     context = {
         'orders': page_obj,
@@ -113,7 +122,7 @@ def order_details(request, order_id):
     progress_percent = progress_line_map.get(order.status, 0)
 
     order_items = order.items.select_related(
-        'variant', 'variant__product').prefetch_related('variant__product__images').all()
+        'variant', 'variant__product', 'variant__product__primary_image').all()
     estimated_delivery = order.created_at + timedelta(days=7)
 
     for item in order_items:
@@ -492,7 +501,7 @@ def admin_order_list(request):
 
     if q:
         orders = orders.filter(Q(order_id__icontains=q) | Q(user__email__icontains=q) | Q(
-            items__variant__product__name__icontains=q)).distinct()
+            Exists(_items_matching(q))))
 
     # filter based on status
     status = request.GET.get('status')
@@ -502,9 +511,7 @@ def admin_order_list(request):
 
     # pagination
 
-    paginator = Paginator(orders, 10)
-    page_no = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_no)
+    page_obj = get_pagination(request, orders, per_page=10, keyset=True, cached_count=True)
 
     context = {
         'orders': page_obj.object_list,
@@ -525,7 +532,7 @@ def admin_order_detail(request, id):
     order = get_object_or_404(Order, id=id)
 
     order_items = order.items.select_related(
-        'variant', 'variant__product').all()
+        'variant', 'variant__product', 'variant__product__primary_image').all()
 
     # to get subtotal for each items (if there are 2 * product)
     for item in order_items:
@@ -1,3 +1,59 @@
+from decimal import Decimal
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from accounts.models import CustomUser
+from basket.models import Basket, BasketItem
+from category.models import Category
+from orders.models import Order
+from products.models import Product, ProductVariant
+from user_profile.models import Address
 
 # Create your tests here.
+
+
+class CheckoutTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email='buyer@example.com', full_name='Buyer', password='pw', is_active=True)
+        Address.objects.create(
+            user=cls.user, full_name='Buyer', address='1 Street', city='City',
+            state='State', postal_code='123456', is_default=True)
+        category = Category.objects.create(name='Protein')
+        product = Product.objects.create(name='Whey', description='desc', category=category)
+        cls.variant = ProductVariant.objects.create(product=product, price=Decimal('100'), stock=5)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.basket = Basket.objects.create(user=self.user)
+
+    def test_cod_orders_every_line_of_a_variant(self):
+        BasketItem.objects.create(basket=self.basket, variant=self.variant, quantity=2)
+        BasketItem.objects.create(basket=self.basket, variant=self.variant, quantity=1)
+
+        response = self.client.post(reverse('checkout'), {'payment_method': 'cod'})
+
+        order = Order.objects.get()
+        self.assertRedirects(
+            response, reverse('order_success', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(order.subtotal, Decimal('300'))
+        self.assertEqual(
+            list(order.items.values_list('variant_id', 'quantity', 'price_at_purchase')),
+            [(self.variant.id, 3, Decimal('300'))])
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 2)
+        self.assertFalse(BasketItem.objects.exists())
+
+    def test_cod_checks_stock_of_all_lines_of_a_variant(self):
+        BasketItem.objects.create(basket=self.basket, variant=self.variant, quantity=4)
+        BasketItem.objects.create(basket=self.basket, variant=self.variant, quantity=2)
+
+        response = self.client.post(reverse('checkout'), {'payment_method': 'cod'})
+
+        self.assertRedirects(response, reverse('basket_view'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 5)
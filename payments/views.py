@@ -6,8 +6,8 @@ from django.db import transaction
 from django.contrib.auth.decorators import login_required
 from orders.models import Order
 from basket.models import Basket
-from orders.utils import decrement_stock
-from products.models import ProductVariant
+from basket.utils import load_basket_items, get_basket_snapshot, apply_basket_snapshot
+from orders.utils import order_quantities, create_order_items, InsufficientStock
 from django.core.exceptions import ValidationError
 from wallet.models import Wallet
 from admin_app.models import Coupon, UserCoupon
@@ -18,7 +18,6 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponseBadRequest
 from user_profile.forms import AddressForm
 import razorpay
-from offers.utils import get_discount_info_for_variant
 
 
 # authorize razorpay client with API Keys.
@@ -97,13 +96,17 @@ def checkout_view(request):
 
     # --- Basket ---
     basket = getattr(request.user, 'basket', None)
-    if not basket or not basket.items.exists():
+    basket_items = load_basket_items(request.user.id) if basket else []
+    if not basket_items:
         messages.error(request, "Your basket is empty!")
         return redirect('basket_view')
 
-    basket_items = basket.items.select_related('variant', 'variant__product').all()
-    subtotal = basket.total_price
-    total_items = basket.total_items
+    # priced once, shared with the basket page and the header
+    snapshot = get_basket_snapshot(request.user.id, basket_items)
+    apply_basket_snapshot(basket_items, snapshot)
+    discount_infos = {item.variant_id: item.variant.discount_info for item in basket_items}
+    subtotal = snapshot['subtotal']
+    total_items = snapshot['item_count']
 
     # --- Tax, shipping ---
     shipping = Decimal('0.00')
@@ -164,7 +167,7 @@ def checkout_view(request):
     if coupon_code:
         try:
             coupon = Coupon.objects.get(code__iexact=coupon_code, is_active=True)
-            if coupon.is_valid() and subtotal >= coupon.minimum_amount:
+            if coupon.code in snapshot['coupons']:
                 discount_amount = coupon.discount_amount
                 applied_coupon = coupon
             else:
@@ -240,13 +243,19 @@ def checkout_view(request):
 
         #     return redirect('order_success', order_id=order.id)
 
-    # Stock availability check for all items (no decrement here)
+    # units per variant, lines of the same variant added up
+    quantities = order_quantities((item.variant_id, item.quantity) for item in basket_items)
+
+    # Stock availability check for all items (no decrement here), the
+    # variants were loaded with the basket
     for item in basket_items:
-        variant = ProductVariant.objects.select_related('product').get(id=item.variant.id)
-        if variant.stock < item.quantity:
+        variant = item.variant
+        if variant.stock < quantities[variant.id]:
             messages.error(request, f"Not enough stock for {variant.product.name}. Only {variant.stock} left.")
             return redirect('basket_view')
 
+    unit_prices = {variant_id: info['price'] for variant_id, info in discount_infos.items()}
+
     
     if payment_method == 'cod':
         try:
@@ -281,34 +290,8 @@ def checkout_view(request):
                     request.session.pop("applied_coupon", None)
                     request.session.modified = True
 
-                # create order items and decrement stock (lock rows)
-                for item in basket_items:
-                    variant = ProductVariant.objects.select_for_update().get(id=item.variant.id)
-                    if variant.stock < item.quantity:
-                        # Shouldn't happen because we checked earlier, but guard anyway
-                        messages.error(request, f"Not enough stock for {variant.product.name}. Only {variant.stock} left.")
-                        transaction.set_rollback(True)
-                        return redirect('basket_view')
-
-                    # order.items.create(
-                    #     variant=item.variant,
-                    #     quantity=item.quantity,
-                    #     price=item.subtotal
-                    # )
-
-                    discount_info = get_discount_info_for_variant(item.variant)
-                    final_price =  discount_info['price']
-                    order.items.create(
-                        variant=item.variant,  
-                        quantity=item.quantity,
-
-                        # Snapshot fields
-                        product_name=item.variant.product.name,
-                        flavor_name=item.variant.flavor.flavor if item.variant.flavor else None,
-                        weight_label=item.variant.weight.weight if item.variant.weight else None,
-                        price_at_purchase=final_price * item.quantity,
-                    )
-                    decrement_stock(item.variant, item.quantity)
+                # create order items and decrement stock (rows locked in id order)
+                create_order_items(order, quantities, unit_prices)
 
                 # clear basket after successful order creation
                 basket.items.all().delete()
@@ -317,6 +300,10 @@ def checkout_view(request):
 
             return redirect('order_success', order_id=order.id)
 
+        except InsufficientStock as e:
+            # Shouldn't happen because we checked earlier, but guard anyway
+            messages.error(request, str(e))
+            return redirect('basket_view')
         except Exception as e:
             messages.error(request, f"Error creating COD order: {str(e)}")
             return redirect('checkout')
@@ -363,44 +350,14 @@ def checkout_view(request):
 
                 
 
-                # create items and decrement stock with select_for_update
-                for item in basket_items:
-                    variant = ProductVariant.objects.select_for_update().get(id=item.variant.id)
-                    if variant.stock < item.quantity:
-                        # rollback: impossible if earlier stock check passed, but just in case
-                        messages.error(request, f"Not enough stock for {variant.product.name}. Only {variant.stock} left.")
-                        transaction.set_rollback(True)
-                        # optionally refund wallet here (if debit succeeded) - your wallet.debit should be atomic / reversible
-                        return redirect('basket_view')
-                    
-                    
-
-                    # order.items.create(
-                    #     variant=item.variant,
-                    #     quantity=item.quantity,
-                    #     price=item.subtotal
-                    # )
-                    discount_info = get_discount_info_for_variant(item.variant)
-                    final_price = discount_info["price"]
-
-                    order.items.create(
-                        variant=item.variant,
-                        quantity=item.quantity,
-
-                        product_name=item.variant.product.name,
-                        flavor_name=item.variant.flavor.flavor if item.variant.flavor else None,
-                        weight_label=item.variant.weight.weight if item.variant.weight else None,
-
-                        price_at_purchase=final_price * item.quantity,
-                    )
+                # create items confirmed and decrement stock (rows locked in id order)
+                order_items = create_order_items(order, quantities, unit_prices, status='confirmed')
+
                 # After creating all order items
-                order.subtotal = sum(i.price_at_purchase for i in order.items.all())
+                order.subtotal = sum(i.price_at_purchase for i in order_items)
                 order.total = order.subtotal - order.discount_amount
                 order.save()
 
-                # mark order items confirmed
-                order.items.update(status='confirmed')
-
                 # clear basket
                 basket.items.all().delete()
                 basket.is_active = False
@@ -408,6 +365,10 @@ def checkout_view(request):
 
             return redirect('order_success', order_id=order.id)
 
+        except InsufficientStock as e:
+            # the whole transaction rolled back, wallet debit included
+            messages.error(request, str(e))
+            return redirect('basket_view')
         except Exception as e:
             
             messages.error(request, f"Wallet payment failed: {str(e)}")
@@ -431,15 +392,14 @@ def checkout_view(request):
             
 
             items_snapshot = []
-            for item in basket_items:
+            for variant_id, quantity in quantities.items():
 
-                discount_info = get_discount_info_for_variant(item.variant)
-                final_price = discount_info["price"]
+                final_price = unit_prices[variant_id]
 
                 items_snapshot.append({
-                    'variant_id': item.variant.id,
-                    'quantity': item.quantity,
-                    'price': str(final_price * item.quantity),
+                    'variant_id': variant_id,
+                    'quantity': quantity,
+                    'price': str(final_price * quantity),
                 })
 
             request.session['razorpay_checkout'] = {
@@ -534,14 +494,6 @@ def paymenthandler(request):
 
         # --- Step 4: Validate and Create Final Order ---
         with transaction.atomic():
-            # Check stock availability again
-            for item in items_snapshot:
-                variant = ProductVariant.objects.select_for_update().get(id=item['variant_id'])
-                if variant.stock < int(item['quantity']):
-                    messages.error(request, f"Not enough stock for {variant.product.name}.")
-                    transaction.set_rollback(True)
-                    return redirect('basket_view')
-
             # Create final order record
             # order = Order.objects.create(
             #     user=request.user,
@@ -578,45 +530,16 @@ def paymenthandler(request):
                 payment_status='paid',
             )
 
-            # Create order items & decrement stock
-            for item in items_snapshot:
-                variant = ProductVariant.objects.select_for_update().get(id=item['variant_id'])
-                qty = int(item['quantity'])
-                price = Decimal(item['price'])
-
-                # order.items.create(
-                #     variant=variant,
-                #     quantity=qty,
-                #     price=price
-                # )
-                # order.items.create(
-                #     variant=item.variant, 
-                #     quantity=item.quantity,
-
-                #     # Snapshot fields
-                #     product_name=item.variant.product.name,
-                #     flavor_name=item.variant.flavor.flavor if item.variant.flavor else None,
-                #     weight_label=item.variant.weight.weight if item.variant.weight else None,
-                #     price_at_purchase=item.variant.price,
-                # )
-                discount_info = get_discount_info_for_variant(variant)
-                unit_price = Decimal(discount_info["price"])
-                price_total = unit_price * qty
-
-                order.items.create(
-                    variant=variant,
-                    quantity=qty,
-                    product_name=variant.product.name,
-                    flavor_name=variant.flavor.flavor if variant.flavor else None,
-                    weight_label=variant.weight.weight if variant.weight else None,
-                    price_at_purchase=price_total,
-                )
-
-                
-                decrement_stock(variant, qty)
-
-            # Mark items confirmed
-            order.items.update(status='confirmed')
+            # Check stock again, create order items confirmed & decrement
+            # stock, priced at the current offers (rows locked in id order)
+            quantities = order_quantities(
+                (int(item['variant_id']), int(item['quantity'])) for item in items_snapshot)
+            try:
+                create_order_items(order, quantities, status='confirmed')
+            except InsufficientStock as e:
+                messages.error(request, str(e))
+                transaction.set_rollback(True)
+                return redirect('basket_view')
 
             # Clear basket
             try:
@@ -17,4 +17,19 @@ class DynamicLoginRedirectMiddleware:
         if request.path.startswith('/admin/'):
             request.login_url = '/admin/'
 
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+
+class PricingContextMiddleware:
+    """
+    Prices each variant at most once per request, however many times the
+    views and templates ask for it.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from offers.utils import pricing_context
+
+        with pricing_context():
+            return self.get_response(request)
@@ -0,0 +1,547 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models import Q, Prefetch
+from django.utils import timezone
+from django.utils.text import slugify
+
+
+# ----------------------------
+#   FORMAT
+# ----------------------------
+
+# one row per variant; product columns repeat, a product without variants
+# gets a single row with the variant columns left blank
+CATALOG_FIELDS = (
+    'product', 'slug', 'category', 'description', 'is_listed', 'max_quantity_per_order',
+    'flavor', 'weight', 'price', 'stock', 'variant_is_listed', 'variant_max_quantity_per_order',
+    'images',
+)
+
+# image paths (relative to MEDIA_ROOT) in one CSV cell, the first one is primary
+IMAGE_SEPARATOR = '|'
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 500
+
+FORMATS = ('csv', 'jsonl')
+
+
+def guess_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+
+# ----------------------------
+#   EXPORT
+# ----------------------------
+
+def export_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream the catalog as row dicts, a few queries per chunk of products.
+    Images are listed on the first row of each product only.
+    """
+    from .models import Product, ProductVariant, ProductImage
+
+    products = Product.objects.select_related('category').prefetch_related(
+        Prefetch('variants', queryset=ProductVariant.objects.select_related(
+            'flavor', 'weight').order_by('id')),
+        Prefetch('images', queryset=ProductImage.objects.order_by('-is_primary', 'id')),
+    ).order_by('id')
+
+    for product in products.iterator(chunk_size=chunk_size):
+        row = {
+            'product': product.name,
+            'slug': product.slug,
+            'category': product.category.name,
+            'description': product.description,
+            'is_listed': product.is_listed,
+            'max_quantity_per_order': product.max_quantity_per_order,
+            'images': [image.image.name for image in product.images.all()],
+        }
+
+        variants = product.variants.all()
+        if not variants:
+            yield dict(row, flavor='', weight='', price='', stock='',
+                       variant_is_listed='', variant_max_quantity_per_order='')
+            continue
+
+        for position, variant in enumerate(variants):
+            yield dict(
+                row,
+                flavor=variant.flavor.flavor if variant.flavor else '',
+                weight=variant.weight.weight if variant.weight else '',
+                price=str(variant.price),
+                stock=variant.stock,
+                variant_is_listed=variant.is_listed,
+                variant_max_quantity_per_order=variant.max_quantity_per_order,
+                images=row['images'] if position == 0 else [],
+            )
+
+
+def write_catalog(stream, fmt='csv'):
+    """
+    Write export_rows() to an open text stream, returns the row count.
+    """
+    written = 0
+
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=CATALOG_FIELDS)
+        writer.writeheader()
+        for row in export_rows():
+            row['images'] = IMAGE_SEPARATOR.join(row['images'])
+            for field in ('is_listed', 'variant_is_listed'):
+                if isinstance(row[field], bool):
+                    row[field] = 'true' if row[field] else 'false'
+            writer.writerow(row)
+            written += 1
+    else:
+        for row in export_rows():
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+            written += 1
+
+    return written
+
+
+# ----------------------------
+#   IMPORT
+# ----------------------------
+
+def read_rows(stream, fmt='csv'):
+    """
+    Yield (line number, raw row dict) from a CSV or JSON Lines stream.
+    """
+    if fmt == 'csv':
+        # the header is line 1
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, row
+        return
+
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as error:
+            row = {'__error__': f"invalid JSON ({error})"}
+        if not isinstance(row, dict):
+            row = {'__error__': "each line must be a JSON object"}
+        yield line, row
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return " ".join(str(value).strip().split())
+
+
+def _bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'y', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'n', 'off'):
+        return False
+    raise ValueError(f"'{value}' is not a yes/no value")
+
+
+def _whole_number(value, field, default=None):
+    if value is None or value == '':
+        return default
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{field} must be a whole number") from None
+    if number < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return number
+
+
+def _price(value):
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError("price must be a number") from None
+    if not price.is_finite() or price < 0:
+        raise ValueError("price must be a positive number")
+    return price.quantize(Decimal('0.01'))
+
+
+def _images(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(IMAGE_SEPARATOR)
+    return [str(name).strip() for name in value if str(name).strip()]
+
+
+class CatalogImporter:
+    """
+    Bulk upsert of products, variants, flavors, weights and image paths.
+
+    Everything needed to validate and to place rows (slugs, product names,
+    categories, flavors, weights) is loaded once up front, so a batch costs
+    a fixed handful of queries whatever its size. Rows are matched to
+    existing products by slug, else by name (case-insensitive), and to
+    existing variants by product + flavor + weight.
+
+    Writes go through bulk_create/bulk_update, which skip model save() and
+    signals, so every batch ends by refreshing what the signals would have
+    (primary images, effective prices, search vectors, cache versions).
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+        from category.utils import get_category_tree
+        from .models import Product, Flavor, Weight
+
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.tree = get_category_tree()
+
+        self.slugs = set()
+        self.product_by_slug = {}
+        # lowercased name -> product id and back, as the import leaves them
+        self.product_by_name = {}
+        self.name_by_product = {}
+        for product_id, slug, name in Product.objects.values_list('id', 'slug', 'name').iterator():
+            self.slugs.add(slug)
+            self.product_by_slug[slug] = product_id
+            self.product_by_name[name.lower()] = product_id
+            self.name_by_product[product_id] = name
+        # lowercased names of the products the import creates
+        self.new_names = set()
+
+        self.flavors = {name.lower(): pk for pk, name in Flavor.objects.values_list('id', 'flavor')}
+        self.weights = {name.lower(): pk for pk, name in Weight.objects.values_list('id', 'weight')}
+
+        self.stats = dict.fromkeys((
+            'rows', 'products_created', 'products_updated', 'variants_created',
+            'variants_updated', 'images_added', 'flavors_created', 'weights_created'), 0)
+        self.errors = []
+        self.touched_product_ids = set()
+
+    # -- parsing -----------------------------------------------------------
+
+    def _unique_slug(self, name):
+        # same scheme as Product.save(), against the preloaded slugs
+        base_slug = slugify(name)[:190] or 'product'
+        slug = base_slug
+        counter = 1
+        while slug in self.slugs:
+            slug = f"{base_slug}-{counter}"
+            counter += 1
+        self.slugs.add(slug)
+        return slug
+
+    def _category_id(self, value):
+        value = _text(value)
+        if not value:
+            return None
+        category = self.tree.get(int(value)) if value.isdigit() else self.tree.find(value)
+        if category is None:
+            raise ValueError(f"unknown category '{value}'")
+        return category.id
+
+    def parse(self, raw):
+        """
+        Validate one raw row into a clean dict, raises ValueError.
+        """
+        if '__error__' in raw:
+            raise ValueError(raw['__error__'])
+
+        name = _text(raw.get('product'))
+        if not name:
+            raise ValueError("product name is required")
+        if self.tree.find(name) is not None:
+            raise ValueError("Product name cannot be the same as an existing category name.")
+
+        slug = _text(raw.get('slug'))
+        product_id = self.product_by_slug.get(slug) if slug else None
+        named_id = self.product_by_name.get(name.lower())
+        if product_id is None:
+            product_id = named_id
+        elif (named_id is not None and named_id != product_id) or (
+                named_id is None and name.lower() in self.new_names):
+            raise ValueError("A product with this name already exists.")
+
+        row = {
+            'name': name,
+            'slug': slug,
+            'product_id': product_id,
+            'category_id': self._category_id(raw.get('category')),
+            'description': str(raw.get('description') or '').strip(),
+            'is_listed': _bool(raw.get('is_listed'), None),
+            'max_quantity_per_order': _whole_number(
+                raw.get('max_quantity_per_order'), 'max_quantity_per_order'),
+            'images': _images(raw.get('images')),
+            'variant': None,
+        }
+
+        if product_id is None:
+            if row['category_id'] is None:
+                raise ValueError("category is required for a new product")
+            if not row['description']:
+                raise ValueError("description is required for a new product")
+
+        flavor = _text(raw.get('flavor'))
+        weight = _text(raw.get('weight'))
+        price = raw.get('price')
+        if flavor or weight or (price is not None and str(price).strip()):
+            if price is None or not str(price).strip():
+                raise ValueError("price is required for a variant")
+            row['variant'] = {
+                'flavor': flavor,
+                'weight': weight,
+                'price': _price(price),
+                'stock': _whole_number(raw.get('stock'), 'stock'),
+                'is_listed': _bool(raw.get('variant_is_listed'), None),
+                'max_quantity_per_order': _whole_number(
+                    raw.get('variant_max_quantity_per_order'), 'variant_max_quantity_per_order'),
+            }
+
+        self._claim_name(row)
+        return row
+
+    def _claim_name(self, row):
+        """
+        Reserve a valid row's product name, so later rows of the import are
+        checked against it. A rename frees the product's old name.
+        """
+        key = row['name'].lower()
+        product_id = row['product_id']
+        if product_id is None:
+            self.new_names.add(key)
+            return
+
+        old_key = self.name_by_product[product_id].lower()
+        if old_key != key and self.product_by_name.get(old_key) == product_id:
+            del self.product_by_name[old_key]
+        self.product_by_name[key] = product_id
+        self.name_by_product[product_id] = row['name']
+
+    # -- writing -----------------------------------------------------------
+
+    def _write_products(self, rows):
+        from .models import Product
+
+        now = timezone.now()
+        new_products = {}
+        updates = {}
+
+        for row in rows:
+            if row['product_id'] is not None:
+                # the first row of a product in the batch carries its fields
+                updates.setdefault(row['product_id'], row)
+                continue
+
+            key = row['name'].lower()
+            if key in new_products:
+                continue
+            new_products[key] = Product(
+                name=row['name'],
+                slug=self._unique_slug(row['slug'] or row['name']),
+                category_id=row['category_id'],
+                description=row['description'],
+                is_listed=True if row['is_listed'] is None else row['is_listed'],
+                max_quantity_per_order=row['max_quantity_per_order'] or 5,
+            )
+
+        created = Product.objects.bulk_create(new_products.values(), batch_size=self.batch_size)
+        for product in created:
+            self.product_by_slug[product.slug] = product.id
+            self.product_by_name[product.name.lower()] = product.id
+            self.name_by_product[product.id] = product.name
+        self.stats['products_created'] += len(created)
+
+        for row in rows:
+            if row['product_id'] is None:
+                row['product_id'] = self.product_by_name[row['name'].lower()]
+
+        products = Product.objects.in_bulk(list(updates))
+        for product_id, row in updates.items():
+            product = products[product_id]
+            # the name the last row of the product claimed
+            product.name = self.name_by_product[product_id]
+            product.updated_at = now
+            if row['category_id'] is not None:
+                product.category_id = row['category_id']
+            if row['description']:
+                product.description = row['description']
+            if row['is_listed'] is not None:
+                product.is_listed = row['is_listed']
+            if row['max_quantity_per_order'] is not None:
+                product.max_quantity_per_order = row['max_quantity_per_order']
+
+        Product.objects.bulk_update(
+            products.values(),
+            ['name', 'category', 'description', 'is_listed', 'max_quantity_per_order', 'updated_at'],
+            batch_size=self.batch_size)
+        self.stats['products_updated'] += len(products)
+
+    def _option_ids(self, model, field, known, names, stat):
+        missing = {name.lower(): name for name in names if name and name.lower() not in known}
+        if missing:
+            model.objects.bulk_create(
+                [model(**{field: name}) for name in missing.values()], ignore_conflicts=True)
+            self.stats[stat] += len(missing)
+            # ids again, also picks up rows that differed only in case
+            for pk, name in model.objects.filter(
+                    **{f"{field}__in": list(missing.values())}).values_list('id', field):
+                known[name.lower()] = pk
+
+    def _write_variants(self, rows):
+        from .models import ProductVariant, Flavor, Weight
+
+        variant_rows = [row for row in rows if row['variant']]
+        if not variant_rows:
+            return
+
+        self._option_ids(Flavor, 'flavor', self.flavors,
+                         {row['variant']['flavor'] for row in variant_rows}, 'flavors_created')
+        self._option_ids(Weight, 'weight', self.weights,
+                         {row['variant']['weight'] for row in variant_rows}, 'weights_created')
+
+        existing = {
+            (variant.product_id, variant.flavor_id, variant.weight_id): variant
+            for variant in ProductVariant.objects.filter(
+                product_id__in={row['product_id'] for row in variant_rows})
+        }
+
+        new_variants = {}
+        changed = {}
+        for row in variant_rows:
+            data = row['variant']
+            key = (
+                row['product_id'],
+                self.flavors.get(data['flavor'].lower()) if data['flavor'] else None,
+                self.weights.get(data['weight'].lower()) if data['weight'] else None,
+            )
+
+            variant = existing.get(key) or new_variants.get(key)
+            if variant is None:
+                variant = new_variants[key] = ProductVariant(
+                    product_id=key[0], flavor_id=key[1], weight_id=key[2], stock=0)
+            elif variant.pk:
+                changed[variant.pk] = variant
+
+            # last row for a variant wins
+            variant.price = data['price']
+            if data['stock'] is not None:
+                variant.stock = data['stock']
+            if data['is_listed'] is not None:
+                variant.is_listed = data['is_listed']
+            if data['max_quantity_per_order'] is not None:
+                variant.max_quantity_per_order = data['max_quantity_per_order']
+
+        ProductVariant.objects.bulk_create(new_variants.values(), batch_size=self.batch_size)
+        ProductVariant.objects.bulk_update(
+            changed.values(), ['price', 'stock', 'is_listed', 'max_quantity_per_order'],
+            batch_size=self.batch_size)
+        self.stats['variants_created'] += len(new_variants)
+        self.stats['variants_updated'] += len(changed)
+
+    def _write_images(self, rows):
+        from .models import ProductImage
+
+        images = {}
+        for row in rows:
+            if row['images']:
+                images.setdefault(row['product_id'], row['images'])
+        if not images:
+            return
+
+        existing = set(ProductImage.objects.filter(
+            product_id__in=list(images)).values_list('product_id', 'image'))
+
+        new_images = [
+            ProductImage(product_id=product_id, image=name)
+            for product_id, names in images.items()
+            for name in dict.fromkeys(names)
+            if (product_id, name) not in existing
+        ]
+        ProductImage.objects.bulk_create(new_images, batch_size=self.batch_size)
+        self.stats['images_added'] += len(new_images)
+
+        # the first listed image becomes the primary one
+        primary = Q()
+        for product_id, names in images.items():
+            primary |= Q(product_id=product_id, image=names[0])
+        ProductImage.objects.filter(product_id__in=list(images)).update(is_primary=False)
+        ProductImage.objects.filter(primary).update(is_primary=True)
+
+    def _refresh_derived(self, product_ids):
+        from offers.utils import refresh_effective_prices
+        from .search import update_search_vectors
+        from .utils import refresh_primary_images, refresh_stock_summaries, bump_product_version
+
+        product_ids = list(product_ids)
+        refresh_primary_images(product_ids)
+        refresh_stock_summaries(product_ids)
+        refresh_effective_prices(product_ids)
+        update_search_vectors(product_ids)
+        for product_id in product_ids:
+            bump_product_version(product_id)
+
+    def _finish(self):
+        from .facets import bump_catalog_version
+        from .search import invalidate_suggestion_index
+        from .utils import invalidate_featured_pool
+
+        invalidate_suggestion_index()
+        invalidate_featured_pool()
+        bump_catalog_version()
+
+    def write_batch(self, rows):
+        if self.dry_run:
+            # the batch is rolled back, so are the lookups it extends
+            saved = [dict(lookup) for lookup in (
+                self.product_by_slug, self.product_by_name, self.name_by_product,
+                self.flavors, self.weights)]
+            saved_slugs = set(self.slugs)
+
+        with transaction.atomic():
+            self._write_products(rows)
+            self._write_variants(rows)
+            self._write_images(rows)
+            product_ids = {row['product_id'] for row in rows}
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+        if self.dry_run:
+            for lookup, snapshot in zip((
+                    self.product_by_slug, self.product_by_name, self.name_by_product,
+                    self.flavors, self.weights), saved):
+                lookup.clear()
+                lookup.update(snapshot)
+            self.slugs = saved_slugs
+            return
+
+        self._refresh_derived(product_ids)
+        self.touched_product_ids |= product_ids
+
+    def run(self, rows):
+        """
+        Import (line, raw row) pairs batch by batch. Rows that fail
+        validation are skipped and reported in self.errors.
+        """
+        batch = []
+        for line, raw in rows:
+            self.stats['rows'] += 1
+            try:
+                batch.append(self.parse(raw))
+            except ValueError as error:
+                self.errors.append((line, str(error)))
+                continue
+
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+
+        if batch:
+            self.write_batch(batch)
+        if self.touched_product_ids:
+            self._finish()
+        return self.stats
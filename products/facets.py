@@ -0,0 +1,241 @@
+from decimal import Decimal
+from hashlib import md5
+from django.core.cache import cache
+from django.db.models import Q, Count, Exists, OuterRef
+from utils.cache import get_version, bump_version
+
+
+# ----------------------------
+#   CATALOG VERSION
+# ----------------------------
+
+# bumped whenever products, variants, categories, flavors or weights change
+CATALOG_VERSION_KEY = 'products:catalog_version'
+
+
+def catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+# ----------------------------
+#   FACETS
+# ----------------------------
+
+FACET_CACHE_SECONDS = 10 * 60
+
+# stock moves with every order without bumping the catalog version, so
+# counts that depend on it are only kept this long
+STOCK_FACET_CACHE_SECONDS = 60
+
+# key, label, lower bound (inclusive), upper bound (exclusive), on min_effective_price
+PRICE_BANDS = (
+    ('under-1000', 'Under ₹1000', None, Decimal('1000')),
+    ('1000-2000', '₹1000 - ₹2000', Decimal('1000'), Decimal('2000')),
+    ('2000-3500', '₹2000 - ₹3500', Decimal('2000'), Decimal('3500')),
+    ('3500-5000', '₹3500 - ₹5000', Decimal('3500'), Decimal('5000')),
+    ('5000-plus', '₹5000 & above', Decimal('5000'), None),
+)
+
+
+def _int_list(values):
+    return sorted({int(value) for value in values if value.isdigit()})
+
+
+def parse_facet_filters(params):
+    """
+    Facet selections from the query string:
+    ?category=<id>&flavor=<id>&flavor=<id>&weight=<id>&price_band=<key>&in_stock=1
+    Unknown or malformed values are dropped.
+    """
+    category = params.get('category', '')
+    price_band = params.get('price_band', '')
+
+    return {
+        'category': int(category) if category.isdigit() else None,
+        'flavor': _int_list(params.getlist('flavor')),
+        'weight': _int_list(params.getlist('weight')),
+        'price_band': price_band if price_band in {band[0] for band in PRICE_BANDS} else None,
+        'in_stock': params.get('in_stock') in ('1', 'on', 'true'),
+    }
+
+
+def _band_q(key, field='min_effective_price'):
+    for band_key, _, low, high in PRICE_BANDS:
+        if band_key == key:
+            condition = Q()
+            if low is not None:
+                condition &= Q(**{f"{field}__gte": low})
+            if high is not None:
+                condition &= Q(**{f"{field}__lt": high})
+            return condition
+    return Q()
+
+
+def _product_q(filters, skip=None):
+    from category.utils import get_category_tree
+
+    condition = Q()
+    if filters['category'] is not None and skip != 'category':
+        # subcategories included
+        condition &= Q(category_id__in=get_category_tree().subtree_ids(filters['category']))
+    if filters['price_band'] and skip != 'price_band':
+        condition &= _band_q(filters['price_band'])
+    return condition
+
+
+def _variant_conditions(filters, skip=None):
+    """
+    Variant level selections as lookups relative to the variant, all of
+    which have to hold for one and the same variant.
+    """
+    conditions = {}
+    if filters['flavor'] and skip != 'flavor':
+        conditions['flavor_id__in'] = filters['flavor']
+    if filters['weight'] and skip != 'weight':
+        conditions['weight_id__in'] = filters['weight']
+    if filters['in_stock'] and skip != 'in_stock':
+        conditions['stock__gt'] = 0
+    if conditions:
+        conditions['is_listed'] = True
+    return conditions
+
+
+def _joined_variant_q(conditions):
+    return Q(**{f"variants__{lookup}": value for lookup, value in conditions.items()})
+
+
+def apply_facet_filters(queryset, filters):
+    """
+    Narrow a product queryset to the selected facets. Variant selections
+    must be met by a single listed variant (a 2kg chocolate one, not any
+    chocolate variant plus any 2kg variant).
+    """
+    from .models import ProductVariant
+
+    queryset = queryset.filter(_product_q(filters))
+
+    conditions = _variant_conditions(filters)
+    if conditions:
+        queryset = queryset.filter(Exists(
+            ProductVariant.objects.filter(product=OuterRef('pk'), **conditions)))
+    return queryset
+
+
+def _facet_options():
+    from category.utils import get_category_tree
+    from .models import Flavor, Weight
+
+    return {
+        'category': [(category.id, category.name) for category in get_category_tree().categories],
+        'flavor': list(Flavor.objects.order_by('flavor').values_list('id', 'flavor')),
+        'weight': list(Weight.objects.order_by('id').values_list('id', 'weight')),
+        'price_band': [(key, label) for key, label, _, _ in PRICE_BANDS],
+    }
+
+
+def _in_stock_count(filters):
+    conditions = _variant_conditions(filters, skip='in_stock')
+    conditions.update({'stock__gt': 0, 'is_listed': True})
+    return Count('pk', distinct=True, filter=_product_q(filters) & _joined_variant_q(conditions))
+
+
+def compute_in_stock_count(queryset, filters):
+    """
+    Just the in-stock facet count of compute_facets().
+    """
+    from .models import Product
+
+    return Product.objects.filter(pk__in=queryset.values('pk')).aggregate(
+        in_stock=_in_stock_count(filters))['in_stock']
+
+
+def compute_facets(queryset, filters):
+    """
+    Product counts for every facet option, over `queryset` (the results
+    before any facet is applied), in one aggregate query joined once to
+    the variants.
+
+    Each facet is counted with every other selection applied but its own,
+    so shoppers see how many results picking another option would give.
+    """
+    from category.utils import get_category_tree
+    from .models import Product
+
+    options = _facet_options()
+    tree = get_category_tree()
+    aggregates = {}
+
+    def count(name, product_q, variant_conditions):
+        aggregates[name] = Count('pk', distinct=True, filter=product_q & _joined_variant_q(variant_conditions))
+
+    count('total', _product_q(filters), _variant_conditions(filters))
+
+    for category_id, _ in options['category']:
+        count(f"category_{category_id}",
+              _product_q(filters, skip='category') & Q(category_id__in=tree.subtree_ids(category_id)),
+              _variant_conditions(filters))
+
+    for key, _ in options['price_band']:
+        count(f"price_band_{key}",
+              _product_q(filters, skip='price_band') & _band_q(key),
+              _variant_conditions(filters))
+
+    for facet in ('flavor', 'weight'):
+        for option_id, _ in options[facet]:
+            conditions = _variant_conditions(filters, skip=facet)
+            conditions.update({f"{facet}_id": option_id, 'is_listed': True})
+            count(f"{facet}_{option_id}", _product_q(filters), conditions)
+
+    aggregates['in_stock'] = _in_stock_count(filters)
+
+    # a plain id subquery keeps search annotations out of the aggregate
+    counts = Product.objects.filter(pk__in=queryset.values('pk')).aggregate(**aggregates)
+
+    facets = {'total': counts['total'], 'in_stock': counts['in_stock']}
+    for facet, choices in options.items():
+        facets[facet] = [
+            {'value': value, 'label': label, 'count': counts[f"{facet}_{value}"]}
+            for value, label in choices
+        ]
+    return facets
+
+
+def get_facets(queryset, filters):
+    """
+    compute_facets(), cached per result set and selection until the
+    catalog or the running offers change.
+
+    Stock doesn't move the catalog version: the in-stock count is kept
+    under its own key for STOCK_FACET_CACHE_SECONDS, and so is everything
+    when "in stock only" is selected, since every count then depends on it.
+    """
+    from .utils import pricing_version
+
+    sql, params = queryset.query.sql_with_params()
+    signature = md5(f"{sql}{params!r}{sorted(filters.items())!r}".encode()).hexdigest()
+    key = f"products:facets:{catalog_version()}:{pricing_version()}:{signature}"
+    in_stock_key = f"{key}:in_stock"
+
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset, filters)
+        cache.set(key, facets, STOCK_FACET_CACHE_SECONDS if filters['in_stock'] else FACET_CACHE_SECONDS)
+        cache.set(in_stock_key, facets['in_stock'], STOCK_FACET_CACHE_SECONDS)
+    elif not filters['in_stock']:
+        in_stock = cache.get(in_stock_key)
+        if in_stock is None:
+            in_stock = compute_in_stock_count(queryset, filters)
+            cache.set(in_stock_key, in_stock, STOCK_FACET_CACHE_SECONDS)
+        facets['in_stock'] = in_stock
+
+    # mark the current selection for the template
+    for facet in ('category', 'flavor', 'weight', 'price_band'):
+        selected = filters[facet]
+        selected = selected if isinstance(selected, list) else [selected]
+        for option in facets[facet]:
+            option['selected'] = option['value'] in selected
+    return facets
@@ -64,3 +64,60 @@ class WeightForm(forms.ModelForm):
         model = Weight
         fields = ["weight"]
 
+
+
+class IdListField(forms.Field):
+    """
+    Any number of ids posted under one name (checkboxes).
+    """
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return sorted({int(item) for item in value})
+        except (TypeError, ValueError):
+            raise forms.ValidationError("Invalid selection.")
+
+
+class BulkEditForm(forms.Form):
+    PRICE_ACTIONS = (
+        ('', 'Keep prices'),
+        ('set', 'Set price to (₹)'),
+        ('percent', 'Change price by (%)'),
+        ('amount', 'Change price by (₹)'),
+    )
+    LISTING_ACTIONS = (
+        ('', 'Keep listing'),
+        ('list', 'List'),
+        ('unlist', 'Unlist'),
+    )
+
+    variant_ids = IdListField(required=False)
+    product_ids = IdListField(required=False)
+    price_action = forms.ChoiceField(choices=PRICE_ACTIONS, required=False)
+    price_value = forms.DecimalField(max_digits=10, decimal_places=2, required=False)
+    stock_delta = forms.IntegerField(required=False, help_text="Added to stock, negative to remove")
+    listing = forms.ChoiceField(choices=LISTING_ACTIONS, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        price_action = cleaned_data.get("price_action")
+        price_value = cleaned_data.get("price_value")
+
+        if not cleaned_data.get("variant_ids") and not cleaned_data.get("product_ids"):
+            raise forms.ValidationError("Select at least one product or variant.")
+
+        if price_action:
+            if price_value is None:
+                self.add_error("price_value", "Enter a value for the price change.")
+            elif price_action == 'set' and price_value < 0:
+                self.add_error("price_value", "Price cannot be negative.")
+            elif price_action == 'percent' and price_value <= -100:
+                self.add_error("price_value", "A price can't drop by 100% or more.")
+
+        if not price_action and not cleaned_data.get("stock_delta") and not cleaned_data.get("listing"):
+            raise forms.ValidationError("Choose a price, stock or listing change.")
+
+        return cleaned_data
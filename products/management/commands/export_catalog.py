@@ -0,0 +1,28 @@
+import sys
+from django.core.management.base import BaseCommand
+from products.catalog import FORMATS, guess_format, write_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Export products, variants, flavors, weights and image paths as CSV or "
+        "JSON Lines, one row per variant. The output can be fed to import_catalog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write, or - for stdout.")
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help="Defaults to jsonl for .jsonl/.json paths, csv otherwise.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+
+        if path == '-':
+            written = write_catalog(sys.stdout, fmt)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                written = write_catalog(stream, fmt)
+
+        self.stderr.write(self.style.SUCCESS(f"Exported {written} row(s)."))
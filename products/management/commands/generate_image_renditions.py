@@ -0,0 +1,40 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from utils.images import generate_renditions, renditions_ready, tracked_fields
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the WebP/AVIF renditions of uploaded images "
+        "(products, categories, banners, profile pictures) that don't have them yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate renditions that already exist.')
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+
+        for (label, field_name), sizes in tracked_fields().items():
+            model = apps.get_model(label)
+            names = (
+                model.objects.exclude(**{field_name: ''})
+                .exclude(**{f"{field_name}__isnull": True})
+                .values_list(field_name, flat=True)
+                .iterator()
+            )
+
+            for name in names:
+                if not options['force'] and renditions_ready(name, sizes):
+                    continue
+                try:
+                    generate_renditions(name, sizes)
+                    generated += 1
+                except (OSError, ValueError) as error:
+                    failed += 1
+                    self.stderr.write(f"{label}.{field_name} {name}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated renditions for {generated} image(s), {failed} failed."))
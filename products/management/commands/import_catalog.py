@@ -0,0 +1,52 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from products.catalog import FORMATS, IMPORT_BATCH_SIZE, CatalogImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update products, variants, flavors, weights and image paths "
+        "from a CSV or JSON Lines file (see export_catalog for the columns). "
+        "Products are matched by slug, else by name; variants by flavor + weight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for stdin.")
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help="Defaults to jsonl for .jsonl/.json paths, csv otherwise.")
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help="Rows written per transaction.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Validate and write every batch, then roll it back.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        importer = CatalogImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+        try:
+            if path == '-':
+                stats = importer.run(read_rows(sys.stdin, fmt))
+            else:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    stats = importer.run(read_rows(stream, fmt))
+        except OSError as error:
+            raise CommandError(error) from error
+
+        for line, message in importer.errors:
+            self.stderr.write(f"line {line}: {message}")
+
+        summary = ", ".join(f"{key.replace('_', ' ')}: {value}" for key, value in stats.items())
+        prefix = "Dry run, nothing saved. " if options['dry_run'] else ""
+        style = self.style.WARNING if importer.errors else self.style.SUCCESS
+        self.stdout.write(style(f"{prefix}{summary}, rejected rows: {len(importer.errors)}."))
+
+        if stats['images_added'] and not options['dry_run']:
+            self.stdout.write("Run generate_image_renditions to build renditions for the new images.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products.search import update_search_vectors, uses_postgres_search
+
+
+class Command(BaseCommand):
+    help = "Recompute the full-text search vector of every product."
+
+    def handle(self, *args, **options):
+        if not uses_postgres_search():
+            self.stdout.write(self.style.WARNING(
+                "Full-text search needs PostgreSQL, nothing to rebuild."))
+            return
+
+        update_search_vectors()
+        self.stdout.write(self.style.SUCCESS("Search vectors rebuilt."))
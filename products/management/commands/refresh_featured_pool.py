@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.utils import refresh_featured_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Reshuffle the pool of products featured on the home page. "
+        "Run it from cron to rotate the selection more often than the pool expires."
+    )
+
+    def handle(self, *args, **options):
+        pool = refresh_featured_pool()
+        self.stdout.write(self.style.SUCCESS(
+            f"Featured pool reshuffled with {len(pool)} product(s)."))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:27
+
+from django.db import migrations, models
+from django.db.models import F, Min, OuterRef, Subquery
+
+
+def seed_effective_prices(apps, schema_editor):
+    """
+    Start every variant at its list price. Offers are applied afterwards by
+    `python manage.py refresh_effective_prices`.
+    """
+    Product = apps.get_model("products", "Product")
+    ProductVariant = apps.get_model("products", "ProductVariant")
+
+    ProductVariant.objects.update(effective_price=F("price"))
+    Product.objects.update(
+        min_effective_price=Subquery(
+            ProductVariant.objects.filter(product=OuterRef("pk"))
+            .values("product")
+            .annotate(min_price=Min("effective_price"))
+            .values("min_price")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0014_alter_productvariant_max_quantity_per_order"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="min_effective_price",
+            field=models.DecimalField(
+                blank=True, db_index=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="discount_percent",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name="productvariant",
+            name="effective_price",
+            field=models.DecimalField(
+                blank=True, db_index=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.RunPython(seed_effective_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:05
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS products_search_vector_gin "
+    "ON products USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS products_name_trgm_gin "
+    "ON products USING gin (name gin_trgm_ops)",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    # GIN indexes only exist on PostgreSQL; other databases search without them
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for statement in SEARCH_INDEXES:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS products_search_vector_gin")
+    schema_editor.execute("DROP INDEX IF EXISTS products_name_trgm_gin")
+
+
+def populate_search_vectors(apps, schema_editor):
+    from products.search import search_vector_expression
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Category = apps.get_model("category", "Category")
+    Product = apps.get_model("products", "Product")
+    ProductVariant = apps.get_model("products", "ProductVariant")
+
+    Product.objects.update(
+        search_vector=search_vector_expression(Category, ProductVariant)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("category", "0008_category_promo_image"),
+        ("products", "0015_product_effective_price"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
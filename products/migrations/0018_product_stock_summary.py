@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_stock_summaries(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductVariant = apps.get_model("products", "ProductVariant")
+
+    variants = ProductVariant.objects.filter(
+        product=OuterRef("pk")).order_by().values("product")
+    Product.objects.update(
+        total_stock=Coalesce(Subquery(variants.annotate(total=Sum("stock")).values("total")), 0),
+        variant_count=Coalesce(Subquery(variants.annotate(total=Count("id")).values("total")), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='variant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_stock_summaries, migrations.RunPython.noop),
+    ]
@@ -4,12 +4,37 @@ from utils.file_uploads import product_image_upload_path
 from django.utils.text import slugify
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.db.models import F, Value
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import F, Value, OuterRef, Subquery
 from django.urls import reverse
 from django.core.exceptions import ValidationError
-from offers.utils import get_discount_info_for_variant
+from offers.utils import get_discount_info_for_variant, variant_pricing_annotations
 # Create your models here.
 
+class ProductQuerySet(models.QuerySet):
+
+    def with_first_variant(self):
+        """
+        Annotate first_variant_id (lowest id), what the card wishlist buttons
+        point at, without loading the variants.
+        """
+        first_variant = ProductVariant.objects.filter(
+            product=OuterRef('pk')).order_by('id').values('id')[:1]
+
+        return self.annotate(first_variant_id=Subquery(first_variant))
+
+
+class ProductVariantQuerySet(models.QuerySet):
+
+    def with_pricing(self):
+        """
+        Annotate best_discount, best_offer_name, final_price and save_amount,
+        computed in SQL. offers.utils picks these up instead of pricing the
+        variant again; listing, detail, basket and checkout all price this way.
+        """
+        return self.annotate(**variant_pricing_annotations())
+
+
 class Product(models.Model):
     name = models.CharField(max_length=500)
     description = models.TextField()
@@ -20,6 +45,22 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_listed = models.BooleanField(default=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    # lowest variant effective_price, kept current by offers.utils.refresh_effective_prices
+    min_effective_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, db_index=True)
+
+    # weighted full-text vector, kept current by products.search.update_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # primary image (or the first one uploaded), kept current by products.utils.refresh_primary_images
+    primary_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, null=True, blank=True,
+        editable=False, related_name='+')
+
+    # sum of variant stock and number of variants, kept current by products.utils.refresh_stock_summaries
+    total_stock = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    variant_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -116,28 +157,35 @@ class ProductVariant(models.Model):
     stock = models.PositiveIntegerField(default=0)
     is_listed = models.BooleanField(default=True)
     max_quantity_per_order = models.PositiveIntegerField(default=10)
+
+    # price after the best running offer, kept current by offers.utils.refresh_effective_prices
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, db_index=True)
+    discount_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+
+    objects = ProductVariantQuerySet.as_manager()
     
     from offers.models import Offer
 
 
     @property
     def active_offer(self):
+        # memoized per request by offers.utils.pricing_context
         return get_discount_info_for_variant(self)
 
 
     @property
     def discounted_price(self):
         offer = self.active_offer
-        if offer and 'final_price' in offer:
-            return offer['final_price']
+        if offer and 'price' in offer:
+            return offer['price']
         return self.price
 
 
     @property
     def savings(self):
         offer = self.active_offer
-        if offer and 'savings' in offer:
-            return offer['savings']
+        if offer and 'save_price' in offer:
+            return offer['save_price']
         return 0
 
     @property
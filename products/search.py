@@ -0,0 +1,288 @@
+import bisect
+import threading
+from django.db import connection
+from django.urls import reverse
+from django.db.models import Q, F, Case, When, Value, IntegerField, Exists, OuterRef, Subquery
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchVector, SearchQuery, SearchRank, TrigramSimilarity)
+from utils.cache import get_version, bump_version
+
+# text search configuration used for both the stored vectors and the queries
+SEARCH_CONFIG = 'english'
+
+
+def uses_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector_expression(category_model, variant_model):
+    """
+    Weighted vector of a product: name (A) > category (B) > flavors (C) >
+    description (D). The models are passed in so migrations can reuse it.
+    """
+    category_name = category_model.objects.filter(
+        pk=OuterRef('category_id')).values('name')[:1]
+
+    flavor_names = variant_model.objects.filter(
+        product=OuterRef('pk'), flavor__isnull=False).values('product').annotate(
+        names=StringAgg('flavor__flavor', ' ', distinct=True)).values('names')[:1]
+
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(category_name), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(flavor_names), weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(product_ids=None, batch_size=1000):
+    """
+    Recompute Product.search_vector with set-based UPDATEs. Pass product_ids
+    to limit the refresh; a no-op on databases without full-text search.
+    """
+    from category.models import Category
+    from .models import Product, ProductVariant
+
+    if not uses_postgres_search():
+        return
+
+    expression = search_vector_expression(Category, ProductVariant)
+
+    if product_ids is None:
+        Product.objects.update(search_vector=expression)
+        return
+
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        Product.objects.filter(
+            id__in=product_ids[start:start + batch_size]
+        ).update(search_vector=expression)
+
+
+def search_products(queryset, query):
+    """
+    Filter a product queryset by a shopper's search text, best matches first.
+
+    On PostgreSQL this is a ranked full-text match on the GIN-indexed
+    search_vector, widened with trigram similarity on the name so typos
+    still find the product. Other databases (tests) get an icontains match
+    over the same fields, ranked by which field matched.
+    """
+    from .models import ProductVariant
+
+    query = query.strip()
+    if not query:
+        return queryset
+
+    if uses_postgres_search():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+            similarity=TrigramSimilarity('name', query),
+        ).filter(
+            # `%` operator (pg_trgm threshold), served by the trigram index on name
+            Q(search_vector=search_query) | Q(name__trigram_similar=query)
+        ).order_by('-rank', '-similarity', 'name')
+
+    flavor_match = ProductVariant.objects.filter(
+        product=OuterRef('pk'), flavor__flavor__icontains=query)
+
+    return queryset.annotate(
+        rank=Case(
+            When(name__icontains=query, then=Value(4)),
+            When(category__name__icontains=query, then=Value(3)),
+            When(Exists(flavor_match), then=Value(2)),
+            When(description__icontains=query, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    ).filter(rank__gt=0).order_by('-rank', 'name')
+
+
+# ----------------------------
+#   AUTOCOMPLETE SUGGESTIONS
+# ----------------------------
+
+# bumped whenever the catalog changes
+SUGGESTION_INDEX_VERSION_KEY = 'products:suggestion_index_version'
+
+_suggestion_index = None
+_suggestion_index_lock = threading.Lock()
+
+# match quality, lower is better
+NAME_PREFIX, NAME_WORD, NAME_SUBSTRING, CATEGORY_WORD, FLAVOR_WORD, TYPO = range(6)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _inner_trigrams(text):
+    """
+    Trigrams of the text itself, without padding: every one of them is also
+    in the trigrams of any name that contains the text, wherever it starts.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SuggestionIndex:
+    """
+    In-memory prefix/trigram index over listed product names, their
+    category and their flavors, answering live-search lookups without
+    touching the database.
+    """
+
+    def __init__(self, entries, version):
+        self.entries = entries
+        self.version = version
+
+        # sorted (word, field rank, entry position) for prefix lookups
+        words = []
+        # trigram -> entry positions, over product names
+        self.name_trigrams = {}
+
+        for position, entry in enumerate(entries):
+            for word in entry['name_lower'].split():
+                words.append((word, NAME_WORD, position))
+            for word in entry['category_lower'].split():
+                words.append((word, CATEGORY_WORD, position))
+            for flavor in entry['flavors_lower']:
+                for word in flavor.split():
+                    words.append((word, FLAVOR_WORD, position))
+            for gram in _trigrams(entry['name_lower']):
+                self.name_trigrams.setdefault(gram, set()).add(position)
+
+        words.sort()
+        self.words = words
+        self.word_keys = [word for word, _, _ in words]
+
+    def suggest(self, query, limit=5):
+        query = " ".join(query.lower().split())
+        if not query:
+            return []
+
+        ranks = {}
+
+        def hit(position, rank):
+            if rank < ranks.get(position, TYPO + 1):
+                ranks[position] = rank
+
+        # words starting with the first word typed
+        first_word = query.split()[0]
+        start = bisect.bisect_left(self.word_keys, first_word)
+        for word, field_rank, position in self.words[start:]:
+            if not word.startswith(first_word):
+                break
+            if query in self.entries[position][self._field(field_rank)]:
+                hit(position, field_rank)
+
+        # names containing the text anywhere, narrowed down by trigram
+        # (queries under 3 characters have none and check every name)
+        grams = _inner_trigrams(query)
+        if grams:
+            candidates = set.intersection(
+                *(self.name_trigrams.get(gram, set()) for gram in grams))
+        else:
+            candidates = range(len(self.entries))
+        for position in candidates:
+            if query in self.entries[position]['name_lower']:
+                hit(position, NAME_SUBSTRING)
+
+        for position in ranks:
+            if self.entries[position]['name_lower'].startswith(query):
+                ranks[position] = NAME_PREFIX
+
+        # typo tolerance once exact matches run out
+        if len(ranks) < limit:
+            query_grams = _trigrams(query)
+            shared = {}
+            for gram in query_grams:
+                for position in self.name_trigrams.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            for position, count in shared.items():
+                name_grams = self.entries[position]['name_trigram_count']
+                similarity = count / (len(query_grams) + name_grams - count)
+                if similarity >= 0.3:
+                    hit(position, TYPO)
+
+        best = sorted(
+            ranks, key=lambda p: (ranks[p], self.entries[p]['name_lower']))[:limit]
+        return [
+            {
+                'id': self.entries[p]['id'],
+                'name': self.entries[p]['name'],
+                'url': self.entries[p]['url'],
+            }
+            for p in best
+        ]
+
+    @staticmethod
+    def _field(field_rank):
+        return {
+            NAME_WORD: 'name_lower',
+            CATEGORY_WORD: 'category_lower',
+            FLAVOR_WORD: 'flavors_text',
+        }[field_rank]
+
+
+def build_suggestion_index(version=None):
+    """
+    Load listed products with their category and flavor names (two queries).
+    """
+    from .models import Product, ProductVariant
+
+    products = Product.objects.filter(is_listed=True).values_list(
+        'id', 'name', 'category__name')
+
+    flavors = {}
+    for product_id, flavor in ProductVariant.objects.filter(
+            product__is_listed=True, flavor__isnull=False).values_list(
+            'product_id', 'flavor__flavor').distinct():
+        flavors.setdefault(product_id, set()).add(flavor.lower())
+
+    entries = []
+    for product_id, name, category_name in products:
+        name_lower = " ".join(name.lower().split())
+        product_flavors = sorted(flavors.get(product_id, ()))
+        entries.append({
+            'id': product_id,
+            'name': name,
+            'url': reverse('detail_product', kwargs={'id': product_id}),
+            'name_lower': name_lower,
+            'name_trigram_count': len(_trigrams(name_lower)),
+            'category_lower': (category_name or '').lower(),
+            'flavors_lower': product_flavors,
+            'flavors_text': " | ".join(product_flavors),
+        })
+
+    return SuggestionIndex(entries, version)
+
+
+def get_suggestion_index():
+    """
+    Return the suggestion index, rebuilding it after a catalog change in
+    this or another process.
+    """
+    global _suggestion_index
+
+    version = get_version(SUGGESTION_INDEX_VERSION_KEY)
+
+    index = _suggestion_index
+    if index is not None and index.version == version:
+        return index
+
+    with _suggestion_index_lock:
+        index = _suggestion_index
+        if index is None or index.version != version:
+            index = build_suggestion_index(version)
+            _suggestion_index = index
+    return index
+
+
+def invalidate_suggestion_index():
+    global _suggestion_index
+
+    _suggestion_index = None
+    bump_version(SUGGESTION_INDEX_VERSION_KEY)
@@ -0,0 +1,156 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from category.models import Category
+from .models import Product, ProductVariant, ProductImage, Flavor, Weight
+from .search import update_search_vectors, invalidate_suggestion_index
+from .facets import bump_catalog_version
+from .utils import (
+    invalidate_featured_pool, bump_product_versions, refresh_primary_images,
+    refresh_stock_summaries)
+from utils.images import track_renditions
+
+
+def _schedule_price_refresh(product_id, variant_removed=False):
+    from offers.utils import refresh_effective_prices
+
+    removed_from = [product_id] if variant_removed else []
+    transaction.on_commit(lambda: refresh_effective_prices(
+        [product_id], variants_removed_from=removed_from))
+
+
+def _schedule_search_refresh(product_ids):
+    transaction.on_commit(lambda: update_search_vectors(product_ids))
+
+
+def _schedule_suggestion_refresh():
+    transaction.on_commit(invalidate_suggestion_index)
+
+
+def _schedule_version_bump(product_ids):
+    # also retires the cached card fragments
+    transaction.on_commit(lambda: bump_product_versions(product_ids))
+
+
+def _schedule_catalog_bump():
+    # retires every cached facet count
+    transaction.on_commit(bump_catalog_version)
+
+
+# variant fields the cached facet counts depend on; stock is counted apart
+CATALOG_VARIANT_FIELDS = {'product', 'price', 'flavor', 'weight', 'is_listed'}
+
+
+@receiver(post_save, sender=ProductVariant)
+def variant_saved(sender, instance, created, update_fields, **kwargs):
+    # any change, stock included, reaches the cached variant matrix and cards
+    _schedule_version_bump([instance.product_id])
+
+    # checkouts save stock only, they must not flush every facet count
+    if created or update_fields is None or CATALOG_VARIANT_FIELDS & set(update_fields):
+        _schedule_catalog_bump()
+
+    # in the same transaction, so the admin grid never shows a stale total
+    if created or update_fields is None or {'stock', 'product'} & set(update_fields):
+        refresh_stock_summaries([instance.product_id])
+
+    # stock-only saves (checkout, cancellations) leave the price alone
+    if created or update_fields is None or 'price' in update_fields:
+        _schedule_price_refresh(instance.product_id)
+    if created or update_fields is None or 'flavor' in update_fields:
+        _schedule_search_refresh([instance.product_id])
+        _schedule_suggestion_refresh()
+
+
+@receiver(post_delete, sender=ProductVariant)
+def variant_deleted(sender, instance, **kwargs):
+    refresh_stock_summaries([instance.product_id])
+    _schedule_version_bump([instance.product_id])
+    _schedule_catalog_bump()
+    _schedule_price_refresh(instance.product_id, variant_removed=True)
+    _schedule_search_refresh([instance.product_id])
+    _schedule_suggestion_refresh()
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, update_fields, **kwargs):
+    _schedule_version_bump([instance.id])
+    _schedule_catalog_bump()
+
+    # a new category means a different category offer
+    if not created and (update_fields is None or 'category' in update_fields):
+        _schedule_price_refresh(instance.id)
+
+    if update_fields is None or {'name', 'description', 'category'} & set(update_fields):
+        _schedule_search_refresh([instance.id])
+
+    # listing toggles and renames change what live search offers
+    if update_fields is None or {'name', 'category', 'is_listed'} & set(update_fields):
+        _schedule_suggestion_refresh()
+
+    # new and relisted products join the featured rotation straight away
+    if created or update_fields is None or 'is_listed' in update_fields:
+        transaction.on_commit(invalidate_featured_pool)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    _schedule_suggestion_refresh()
+    _schedule_catalog_bump()
+    transaction.on_commit(invalidate_featured_pool)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def image_changed(sender, instance, **kwargs):
+    # re-picked in the same transaction, pages never see a dangling image
+    refresh_primary_images([instance.product_id])
+    _schedule_version_bump([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    _schedule_catalog_bump()
+    if not created:
+        product_ids = list(instance.products.values_list('id', flat=True))
+        _schedule_search_refresh(product_ids)
+        _schedule_suggestion_refresh()
+        # bestseller cards show the category promo image
+        _schedule_version_bump(product_ids)
+
+
+@receiver(post_save, sender=Flavor)
+def flavor_saved(sender, instance, created, **kwargs):
+    _schedule_catalog_bump()
+    if not created:
+        product_ids = list(
+            ProductVariant.objects.filter(flavor=instance)
+            .values_list('product_id', flat=True).distinct())
+        _schedule_search_refresh(product_ids)
+        _schedule_suggestion_refresh()
+        _schedule_version_bump(product_ids)
+
+
+@receiver(post_save, sender=Weight)
+def weight_saved(sender, instance, created, **kwargs):
+    _schedule_catalog_bump()
+    if not created:
+        _schedule_version_bump(list(
+            ProductVariant.objects.filter(weight=instance)
+            .values_list('product_id', flat=True).distinct()))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Flavor)
+@receiver(post_delete, sender=Weight)
+def facet_option_deleted(sender, instance, **kwargs):
+    _schedule_catalog_bump()
+
+
+def _image_renditions_ready(image_id):
+    # cached cards were rendered without the renditions
+    bump_product_versions(ProductImage.objects.filter(pk=image_id).values_list('product_id', flat=True))
+
+
+track_renditions(ProductImage, 'image', ('thumb', 'card', 'zoom'),
+                 on_ready=_image_renditions_ready)
@@ -0,0 +1,49 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from utils.images import (
+    RENDITION_WIDTHS, available_formats, rendition_name, rendition_sizes, renditions_ready)
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, alt='', css_class='', sizes='100vw', loading='lazy', **attrs):
+    """
+    <picture> for an uploaded image: AVIF/WebP renditions through srcset,
+    with the original upload as the <img> fallback.
+
+    {% picture product.card_image.image alt=product.name css_class="img-fluid" sizes="(min-width: 992px) 25vw, 50vw" %}
+    """
+    if not image:
+        return ''
+
+    renditions = rendition_sizes(image)
+    sources = []
+    if renditions and renditions_ready(image.name, renditions):
+        for fmt in available_formats():
+            srcset = ", ".join(
+                f"{default_storage.url(rendition_name(image.name, size, fmt))} {RENDITION_WIDTHS[size]}w"
+                for size in renditions)
+            sources.append((fmt, srcset, sizes))
+
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}" loading="{}"{}></picture>',
+        format_html_join('', '<source type="image/{}" srcset="{}" sizes="{}">', sources),
+        image.url, alt, css_class, loading, extra)
+
+
+@register.filter
+def rendition(image, size):
+    """
+    URL of one WebP rendition, for places srcset can't reach (CSS
+    backgrounds). Falls back to the original until it's generated.
+    """
+    if not image:
+        return ''
+
+    renditions = rendition_sizes(image)
+    if size in renditions and 'webp' in available_formats() and renditions_ready(image.name, renditions):
+        return default_storage.url(rendition_name(image.name, size, 'webp'))
+    return image.url
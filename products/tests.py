@@ -1,3 +1,280 @@
+from decimal import Decimal
+from django.core.cache import cache
+from unittest.mock import patch
+from urllib.parse import urlencode
+from django.db import connection, transaction
+from django.http import QueryDict
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import CustomUser
+from category.models import Category
+from orders.utils import reserve_stock
+from .catalog import CatalogImporter
+from .facets import catalog_version, parse_facet_filters, get_facets
+from .models import Product, ProductVariant
+from .search import build_suggestion_index
+from .utils import render_product_cards
 
 # Create your tests here.
+
+
+class SuggestionIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Protein')
+        cls.whey = Product.objects.create(
+            name='Whey Protein', description='desc', category=category)
+        cls.isolate = Product.objects.create(
+            name='Isolate Chocolate', description='desc', category=category)
+
+    def suggest(self, query):
+        return [s['name'] for s in build_suggestion_index().suggest(query)]
+
+    def test_prefix(self):
+        self.assertEqual(self.suggest('whe'), ['Whey Protein'])
+        self.assertEqual(self.suggest('is'), ['Isolate Chocolate'])
+
+    def test_mid_word(self):
+        self.assertEqual(self.suggest('hey'), ['Whey Protein'])
+        self.assertEqual(self.suggest('olate'), ['Isolate Chocolate'])
+        self.assertEqual(self.suggest('rotein'), ['Whey Protein'])
+
+    def test_short_mid_word(self):
+        self.assertEqual(self.suggest('ey'), ['Whey Protein'])
+
+    def test_multi_word(self):
+        self.assertEqual(self.suggest('late choc'), ['Isolate Chocolate'])
+        self.assertEqual(self.suggest('whey prot'), ['Whey Protein'])
+
+    def test_prefix_ranks_before_mid_word(self):
+        Product.objects.create(
+            name='Heyday Bar', description='desc', category=self.whey.category)
+        self.assertEqual(self.suggest('hey'), ['Heyday Bar', 'Whey Protein'])
+
+    def test_typo(self):
+        self.assertEqual(self.suggest('whey protien'), ['Whey Protein'])
+        self.assertEqual(self.suggest('isolat chocolate'), ['Isolate Chocolate'])
+
+    def test_no_match(self):
+        self.assertEqual(self.suggest('creatine'), [])
+
+
+class CatalogImportNameTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Protein')
+        cls.first = Product.objects.create(name='First', description='desc', category=cls.category)
+        cls.second = Product.objects.create(name='Second', description='desc', category=cls.category)
+
+    def run_import(self, *rows, dry_run=False):
+        importer = CatalogImporter(dry_run=dry_run)
+        importer.run(enumerate(rows, start=2))
+        return importer
+
+    def names(self):
+        return sorted(Product.objects.values_list('name', flat=True))
+
+    def test_two_products_renamed_to_the_same_name(self):
+        importer = self.run_import(
+            {'product': 'Same Name', 'slug': self.first.slug},
+            {'product': 'Same Name', 'slug': self.second.slug})
+
+        self.assertEqual(importer.errors, [(3, "A product with this name already exists.")])
+        self.assertEqual(self.names(), ['Same Name', 'Second'])
+
+    def test_rename_to_the_name_of_a_new_product(self):
+        importer = self.run_import(
+            {'product': 'Fresh', 'category': 'Protein', 'description': 'desc'},
+            {'product': 'fresh', 'slug': self.first.slug})
+
+        self.assertEqual(importer.errors, [(3, "A product with this name already exists.")])
+        self.assertEqual(self.names(), ['First', 'Fresh', 'Second'])
+
+    def test_renamed_product_frees_its_old_name(self):
+        importer = self.run_import(
+            {'product': 'Renamed', 'slug': self.first.slug},
+            {'product': 'First', 'slug': self.second.slug})
+
+        self.assertEqual(importer.errors, [])
+        self.assertEqual(self.names(), ['First', 'Renamed'])
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.name, 'First')
+
+    def test_dry_run_reports_the_conflict(self):
+        importer = self.run_import(
+            {'product': 'Same Name', 'slug': self.first.slug},
+            {'product': 'Same Name', 'slug': self.second.slug}, dry_run=True)
+
+        self.assertEqual(importer.errors, [(3, "A product with this name already exists.")])
+        self.assertEqual(self.names(), ['First', 'Second'])
+
+
+class ProductCardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Protein')
+        self.product = Product.objects.create(name='Whey', description='desc', category=category)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant = ProductVariant.objects.create(
+                product=self.product, price=Decimal('100'), stock=5)
+
+    def card(self, template_name='includes/bestseller_card_detail.html'):
+        product = Product.objects.get(pk=self.product.pk)
+        return render_product_cards([product], template_name)[0].card_html
+
+    def test_fragments_close_their_markup(self):
+        for name in ('bestseller_card_detail', 'bestseller_card_home',
+                     'product_card_home', 'product_card_listing'):
+            html = self.card(f'includes/{name}.html')
+            self.assertEqual(html.count('<div'), html.count('</div>'), name)
+
+    def test_stock_change_leaves_the_product_row_alone(self):
+        updated_at = Product.objects.get(pk=self.product.pk).updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.stock = 4
+            self.variant.save(update_fields=['stock'])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).updated_at, updated_at)
+
+    def test_product_change_renders_the_card_again(self):
+        self.assertIn('Whey', self.card())
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name='Whey Isolate')
+        # cached until the product's version moves
+        self.assertNotIn('Whey Isolate', self.card())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=self.product.pk)
+            product.save()
+        self.assertIn('Whey Isolate', self.card())
+
+
+class AdminProductGridTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(
+            email='admin@example.com', full_name='Admin', password='pw')
+        cls.category = Category.objects.create(name='Protein')
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', description='desc', category=cls.category)
+            for i in range(7)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def grid(self, **params):
+        return self.client.get(reverse('admin_products'), params)
+
+    def test_cursor_from_another_sort_restarts_the_list(self):
+        cursor = self.grid(sort='name').context['page_obj'].next_cursor()
+
+        page = self.grid(sort='-stock', cursor=cursor).context['page_obj']
+
+        self.assertEqual(page.offset, 0)
+        self.assertEqual(len(page), 5)
+
+    def test_edit_returns_to_the_same_page(self):
+        cursor = self.grid(sort='-name').context['page_obj'].next_cursor()
+        response = self.grid(sort='-name', cursor=cursor)
+        grid_params = response.context['grid_params']
+        product = response.context['page_obj'][0]
+
+        response = self.client.post(
+            f"{reverse('edit_product', args=[product.id])}?{grid_params}",
+            {'name': 'Renamed', 'category': self.category.id, 'description': 'desc',
+             'is_listed': 'on'})
+
+        self.assertRedirects(
+            response, f"{reverse('admin_products')}?{urlencode({'cursor': cursor, 'sort': '-name'})}",
+            fetch_redirect_response=False)
+
+
+class ProductSaveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(
+            email='admin@example.com', full_name='Admin', password='pw')
+        cls.category = Category.objects.create(name='Protein')
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Whey', description='desc', category=self.category)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.create(product=self.product, price=Decimal('100'), stock=5)
+
+    def test_edit_writes_only_the_form_fields(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('edit_product', args=[self.product.id]), {
+                'name': 'Whey', 'category': self.category.id, 'description': 'edited',
+                'is_listed': 'on'})
+
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "products" SET "name"')]
+        self.assertEqual(len(updates), 1)
+        for field in ('total_stock', 'variant_count', 'min_effective_price', 'primary_image'):
+            self.assertNotIn(field, updates[0])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.description, 'edited')
+        self.assertEqual((self.product.total_stock, self.product.min_effective_price), (5, Decimal('100')))
+
+    def test_full_save_writes_every_field(self):
+        self.product.total_stock = 7
+        self.product.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 7)
+
+
+class FacetCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Protein')
+        self.product = Product.objects.create(name='Whey', description='desc', category=category)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant = ProductVariant.objects.create(
+                product=self.product, price=Decimal('100'), stock=5)
+
+    def facets(self, **params):
+        filters = parse_facet_filters(QueryDict(urlencode(params)))
+        return get_facets(Product.objects.filter(is_listed=True), filters)
+
+    def save_variant(self, **changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            for field, value in changes.items():
+                setattr(self.variant, field, value)
+            self.variant.save(update_fields=list(changes))
+
+    def test_stock_change_keeps_the_catalog_version(self):
+        version = catalog_version()
+        self.save_variant(stock=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                reserve_stock({self.variant.id: 1})
+        self.assertEqual(catalog_version(), version)
+
+        self.save_variant(price=Decimal('90'))
+        self.assertGreater(catalog_version(), version)
+
+    def test_stock_change_keeps_the_cached_counts(self):
+        self.assertEqual(self.facets()['in_stock'], 1)
+        self.save_variant(stock=0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets()['in_stock'], 1)
+
+    @patch('products.facets.STOCK_FACET_CACHE_SECONDS', 0)
+    def test_in_stock_count_is_counted_apart(self):
+        self.facets()
+        self.save_variant(stock=0)
+
+        # only the in-stock count, not yet kept, is counted again
+        with self.assertNumQueries(1):
+            facets = self.facets()
+        self.assertEqual((facets['total'], facets['in_stock']), (1, 0))
@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path("", views.admin_products, name='admin_products'),
     path("add/", views.add_product, name='add_product'),
+    path("bulk-edit/", views.bulk_edit_products, name='bulk_edit_products'),
     path("<int:product_id>/edit-product/", views.edit_product, name='edit_product'),
     path("<int:product_id>/delete-product/", views.delete_product, name='delete_product'),
     path("toggle/<int:product_id>/", views.toggle_product_listing, name='toggle_product_listing'),
@@ -0,0 +1,438 @@
+import random
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Prefetch, Exists, OuterRef, Subquery, F, Q, Value, Sum, Count, prefetch_related_objects)
+from django.db.models.functions import Coalesce, Greatest, Round
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from utils.cache import get_version, get_versions, bump_version
+from offers.utils import (
+    PRICE_FIELD, get_best_offer_for_product, get_discount_info_for_variants, get_offer_index)
+
+
+def load_product_cards(products):
+    """
+    Evaluate a product queryset (or list) into ready-to-render product cards.
+
+    Every product gets:
+      card_image      - the denormalized primary_image, or None
+      first_variant   - lowest id variant, used by the wishlist heart
+      display_variant - price dict of the cheapest in-stock variant, or None
+      best_offer      - best running offer, for the discount badge
+    and each card variant carries its price dict as `discount_info`.
+
+    The query count is fixed (products, variants, plus primary images unless
+    already select_related) whatever the page size; offers come from the
+    active offer index.
+    """
+    from .models import ProductVariant
+
+    products = list(products)
+    prefetch_related_objects(
+        products,
+        Prefetch(
+            'variants',
+            queryset=ProductVariant.objects.with_pricing().order_by('id'),
+            to_attr='card_variants',
+        ),
+        'primary_image',
+    )
+
+    discount_infos = get_discount_info_for_variants(
+        variant for product in products for variant in product.card_variants)
+
+    for product in products:
+        for variant in product.card_variants:
+            variant.discount_info = discount_infos[variant.id]
+
+        in_stock_variants = [v for v in product.card_variants if v.stock > 0]
+        cheapest_variant = min(
+            in_stock_variants, key=lambda v: v.price, default=None)
+
+        product.card_image = product.primary_image
+        product.first_variant = product.card_variants[0] if product.card_variants else None
+        product.display_variant = cheapest_variant.discount_info if cheapest_variant else None
+        product.best_offer = get_best_offer_for_product(product)
+
+    return products
+
+
+# ----------------------------
+#   FEATURED ROTATION
+# ----------------------------
+
+FEATURED_POOL_KEY = 'products:featured_pool'
+
+# how many listed products take part in one rotation, and for how long
+FEATURED_POOL_SIZE = 100
+FEATURED_POOL_SECONDS = 15 * 60
+
+
+def refresh_featured_pool():
+    """
+    Reshuffle the listed product ids and store a fresh pool in the cache.
+    """
+    from .models import Product
+
+    product_ids = list(
+        Product.objects.filter(is_listed=True).values_list('id', flat=True))
+    random.shuffle(product_ids)
+
+    pool = product_ids[:FEATURED_POOL_SIZE]
+    cache.set(FEATURED_POOL_KEY, pool, FEATURED_POOL_SECONDS)
+    return pool
+
+
+def invalidate_featured_pool():
+    cache.delete(FEATURED_POOL_KEY)
+
+
+def get_featured_products(count=4):
+    """
+    Random listed products for the home page, sampled from the cached pool
+    instead of sorting the catalog with ORDER BY RANDOM(). Cards are left to
+    render_product_cards().
+    """
+    from .models import Product
+
+    pool = cache.get(FEATURED_POOL_KEY)
+    if pool is None:
+        pool = refresh_featured_pool()
+
+    sample = random.sample(pool, min(count, len(pool)))
+    position = {product_id: i for i, product_id in enumerate(sample)}
+
+    # products unlisted since the pool was built simply drop out
+    products = Product.objects.filter(
+        id__in=sample, is_listed=True).with_first_variant().select_related('primary_image')
+    return sorted(products, key=lambda product: position[product.id])
+
+
+def get_best_selling_products(limit=4):
+    """
+    Best selling listed products that still have something in stock, read
+    from the pre-aggregated sales stats. Each carries `total_sold`.
+    """
+    from .models import Product, ProductVariant
+
+    in_stock = ProductVariant.objects.filter(product=OuterRef('pk'), stock__gt=0)
+
+    return (
+        Product.objects.filter(is_listed=True, sales_stats__units_sold__gt=0)
+        .filter(Exists(in_stock))
+        .annotate(total_sold=F('sales_stats__units_sold'))
+        .select_related('category', 'primary_image')
+        .order_by('-total_sold', 'id')[:limit]
+    )
+
+
+# ----------------------------
+#   VARIANT MATRIX
+# ----------------------------
+
+VARIANT_MATRIX_SECONDS = 10 * 60
+
+
+def _product_version_key(product_id):
+    return f'products:version:{product_id}'
+
+
+def bump_product_version(product_id):
+    """
+    Mark everything cached for a product (variants, prices, stock, cards)
+    as stale.
+    """
+    bump_version(_product_version_key(product_id))
+
+
+def bump_product_versions(product_ids):
+    for product_id in product_ids:
+        bump_product_version(product_id)
+
+
+def product_versions(product_ids):
+    """
+    {product_id: version} for many products in one cache round trip.
+    """
+    keys = {_product_version_key(product_id): product_id for product_id in product_ids}
+    return {keys[key]: version for key, version in get_versions(keys).items()}
+
+
+def variant_lookup_key(flavor, weight):
+    return f"{(flavor or '').lower()}|{(weight or '').lower()}"
+
+
+def build_variant_matrix(product_id):
+    """
+    JSON-ready description of a product's variants:
+      is_listed - False also for a product that doesn't exist
+      variants - one entry per variant with prices after offers and stock
+      flavors  - flavor name -> in stock in any size
+      weights  - weight name -> in stock in any flavor
+      lookup   - "flavor|weight" (lowercased) -> position in variants
+    """
+    from .models import Product, ProductVariant
+
+    is_listed = Product.objects.filter(pk=product_id).values_list(
+        'is_listed', flat=True).first()
+
+    variants = list(
+        ProductVariant.objects.with_pricing()
+        .filter(product_id=product_id)
+        .select_related('flavor', 'weight')
+        .order_by('weight', 'id'))
+    discount_infos = get_discount_info_for_variants(variants)
+
+    matrix = {
+        'product_id': product_id,
+        'is_listed': bool(is_listed),
+        'variants': [],
+        'flavors': {},
+        'weights': {},
+        'lookup': {},
+    }
+
+    for variant in variants:
+        info = discount_infos[variant.id]
+        flavor = variant.flavor.flavor if variant.flavor else ''
+        weight = variant.weight.weight if variant.weight else ''
+        available = variant.stock > 0
+
+        matrix['lookup'].setdefault(
+            variant_lookup_key(flavor, weight), len(matrix['variants']))
+        matrix['variants'].append({
+            'id': variant.id,
+            'flavor': flavor,
+            'weight': weight,
+            'stock': variant.stock,
+            'available': available,
+            'price': str(info['price']),
+            'original_price': str(info['original_price']),
+            'save_amount': str(info['save_price']),
+            'discount_percent': str(info['discount_percent']),
+            'offer_name': info['offer_name'],
+        })
+
+        if flavor:
+            matrix['flavors'][flavor] = matrix['flavors'].get(flavor, False) or available
+        if weight:
+            matrix['weights'][weight] = matrix['weights'].get(weight, False) or available
+
+    return matrix
+
+
+def get_variant_matrix(product_id):
+    """
+    Cached variant matrix, keyed by the product version and the offer index
+    version so stock, price and offer changes all show up.
+    """
+    offer_index = get_offer_index()
+    version = get_version(_product_version_key(product_id))
+    cache_key = f'products:variant_matrix:{product_id}:{version}:{offer_index.version}'
+
+    matrix = cache.get(cache_key)
+    if matrix is None:
+        matrix = build_variant_matrix(product_id)
+
+        # scheduled offer starts/ends change prices without a version bump
+        timeout = VARIANT_MATRIX_SECONDS
+        if offer_index.expires_at:
+            remaining = (offer_index.expires_at - timezone.now()).total_seconds()
+            timeout = max(min(timeout, int(remaining)), 1)
+        cache.set(cache_key, matrix, timeout)
+    return matrix
+
+
+def select_variant(matrix, flavor=None, weight=None):
+    """
+    Matrix entry for the requested flavor and/or weight, falling back to the
+    first variant. Returns None for a product without variants.
+    """
+    if flavor and weight:
+        position = matrix['lookup'].get(variant_lookup_key(flavor, weight))
+        if position is not None:
+            return matrix['variants'][position]
+
+    for entry in matrix['variants']:
+        if ((not flavor or entry['flavor'].lower() == flavor.lower())
+                and (not weight or entry['weight'].lower() == weight.lower())):
+            return entry
+
+    return matrix['variants'][0] if matrix['variants'] else None
+
+
+# ----------------------------
+#   CARD FRAGMENTS
+# ----------------------------
+
+CARD_FRAGMENT_SECONDS = 60 * 60
+
+
+def pricing_version():
+    """
+    Changes whenever card prices may have: an offer was edited (index
+    version) or a scheduled offer started/ended (index expiry).
+    """
+    offer_index = get_offer_index()
+    expires = int(offer_index.expires_at.timestamp()) if offer_index.expires_at else 0
+    return f"{offer_index.version}.{expires}"
+
+
+def refresh_primary_images(product_ids):
+    """
+    Point primary_image at the flagged image (else the first uploaded one).
+    Callers bump the product versions so cached cards follow.
+    """
+    from .models import Product, ProductImage
+
+    first_image = ProductImage.objects.filter(
+        product=OuterRef('pk')).order_by('-is_primary', 'id').values('id')[:1]
+
+    Product.objects.filter(pk__in=product_ids).update(primary_image=Subquery(first_image))
+
+
+def refresh_stock_summaries(product_ids):
+    """
+    Recompute total_stock and variant_count of these products from their
+    variants, in one UPDATE.
+    """
+    from .models import Product, ProductVariant
+
+    variants = ProductVariant.objects.filter(
+        product=OuterRef('pk')).order_by().values('product')
+
+    Product.objects.filter(pk__in=product_ids).update(
+        total_stock=Coalesce(Subquery(variants.annotate(total=Sum('stock')).values('total')), 0),
+        variant_count=Coalesce(Subquery(variants.annotate(total=Count('id')).values('total')), 0))
+
+
+def render_product_cards(products, template_name):
+    """
+    Attach `card_html` to each product, the card markup rendered with
+    `template_name`. Fragments are cached per product id + product version +
+    pricing version, so only the cards that changed are loaded (through
+    load_product_cards) and rendered again.
+
+    Cards hold nothing user specific; wishlist buttons and the like stay
+    in the page template.
+    """
+    products = list(products)
+    version = pricing_version()
+    versions = product_versions([product.id for product in products])
+
+    keys = {
+        product.id: (
+            f"products:card:{template_name}:{product.id}:"
+            f"{versions[product.id]}:{version}"
+        )
+        for product in products
+    }
+    fragments = cache.get_many(list(keys.values()))
+
+    missing = [product for product in products if keys[product.id] not in fragments]
+    if missing:
+        fresh = {}
+        for product in load_product_cards(missing):
+            fresh[keys[product.id]] = render_to_string(template_name, {'product': product})
+        cache.set_many(fresh, CARD_FRAGMENT_SECONDS)
+        fragments.update(fresh)
+
+    for product in products:
+        product.card_html = mark_safe(fragments[keys[product.id]])
+    return products
+
+
+# ----------------------------
+#   BULK EDITS
+# ----------------------------
+
+def _after_bulk_edit(product_ids, prices_changed, listing_changed, products_relisted):
+    """
+    What the model signals would have done for every touched product, run
+    once for the whole edit.
+    """
+    from offers.utils import refresh_effective_prices
+    from .facets import bump_catalog_version
+    from .search import invalidate_suggestion_index
+
+    product_ids = list(product_ids)
+    if prices_changed:
+        # bumps the catalog version itself when a stored price moved
+        refresh_effective_prices(product_ids)
+    bump_product_versions(product_ids)
+    if listing_changed:
+        bump_catalog_version()
+
+    if products_relisted:
+        invalidate_featured_pool()
+        invalidate_suggestion_index()
+
+
+def stock_changed(product_ids):
+    """
+    Bookkeeping for stock written with .update(), which skips the variant
+    signals: stored totals right away, the products' caches once the
+    transaction commits. The catalog version is left alone, see
+    products.facets.get_facets for how in-stock counts are kept.
+    """
+    product_ids = set(product_ids)
+    refresh_stock_summaries(product_ids)
+    transaction.on_commit(lambda: bump_product_versions(product_ids))
+
+
+def bulk_edit_catalog(variant_ids=(), product_ids=(), price_action=None, price_value=None,
+                      stock_delta=None, listing=None):
+    """
+    Apply one admin edit to many variants at once with set-based UPDATEs in a
+    single transaction:
+
+      price_action  'set' (price_value), 'percent' or 'amount' (price_value
+                    added, may be negative; prices never go below zero)
+      stock_delta   added to stock, floored at zero
+      listing       'list' or 'unlist'
+
+    Prices and stock apply to the selected variants plus every variant of
+    the selected products; listing applies to exactly what was selected.
+    Pricing caches are invalidated once, after commit. Returns the number of
+    products touched.
+    """
+    from .models import Product, ProductVariant
+
+    variant_ids, product_ids = list(variant_ids), list(product_ids)
+    variants = ProductVariant.objects.filter(Q(id__in=variant_ids) | Q(product_id__in=product_ids))
+
+    changes = {}
+    zero = Value(Decimal(0))
+    if price_action == 'set':
+        changes['price'] = Value(price_value, output_field=PRICE_FIELD)
+    elif price_action == 'percent':
+        # multiplied by 0.01, see offers.utils.final_price_expression
+        changes['price'] = Greatest(Round(
+            F('price') * (Value(Decimal(100)) + Value(price_value)) * Value(Decimal('0.01')), 2,
+            output_field=PRICE_FIELD), zero, output_field=PRICE_FIELD)
+    elif price_action == 'amount':
+        changes['price'] = Greatest(
+            F('price') + Value(price_value), zero, output_field=PRICE_FIELD)
+    if stock_delta:
+        changes['stock'] = Greatest(F('stock') + Value(stock_delta), Value(0))
+
+    with transaction.atomic():
+        touched = set(variants.values_list('product_id', flat=True)) | set(product_ids)
+
+        if changes:
+            variants.update(**changes)
+        if 'stock' in changes:
+            refresh_stock_summaries(touched)
+        if listing in ('list', 'unlist'):
+            ProductVariant.objects.filter(id__in=variant_ids).update(is_listed=listing == 'list')
+            Product.objects.filter(id__in=product_ids).update(
+                is_listed=listing == 'list', updated_at=timezone.now())
+
+        transaction.on_commit(lambda: _after_bulk_edit(
+            touched, 'price' in changes, listing in ('list', 'unlist'),
+            bool(listing and product_ids)))
+
+    return len(touched)
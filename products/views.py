@@ -1,12 +1,15 @@
 from django.shortcuts import render, redirect,get_object_or_404, HttpResponse
 from .models import Product, ProductImage, Flavor, Weight, ProductVariant
 from category.models import Category
+from category.utils import get_category_tree
 from utils.pagination import get_pagination
 from django.contrib import messages
-from .forms import ProductForm,  ProductVariantForm, FlavorForm, WeightForm
+from .forms import ProductForm,  ProductVariantForm, FlavorForm, WeightForm, BulkEditForm
+from .utils import bulk_edit_catalog
 from django.urls import reverse
-from django.db.models import Sum
+from urllib.parse import urlencode
 from django.views.decorators.http import require_POST
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import ValidationError
 from offers.utils import get_best_offer_for_product,get_discount_info_for_variant
 
@@ -14,9 +17,40 @@ from offers.utils import get_best_offer_for_product,get_discount_info_for_varian
 
 # Create your views here.
 
+# sort key -> keyset ordering, always ending in id so the cursor is unique
+ADMIN_PRODUCT_SORTS = {
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'created': ('created_at', 'id'),
+    '-created': ('-created_at', '-id'),
+    'stock': ('total_stock', 'id'),
+    '-stock': ('-total_stock', '-id'),
+    'variants': ('variant_count', 'id'),
+    '-variants': ('-variant_count', '-id'),
+}
+
+
+# grid state kept through the edit/add/toggle round trips
+ADMIN_PRODUCT_GRID_PARAMS = ('cursor', 'sort', 'search', 'filter')
+
+
+def _grid_params(params):
+    return urlencode({key: params[key] for key in ADMIN_PRODUCT_GRID_PARAMS if params.get(key)})
+
+
+def admin_products_url(params):
+    """
+    The product grid on the page, sort and filters found in `params`.
+    """
+    query = _grid_params(params)
+    return f"{reverse('admin_products')}?{query}" if query else reverse('admin_products')
+
+
 def admin_products(request):
     """       
     Fetch all products from the db and rendder them in the product management page.
+    Stock and variant counts come from the stored per-product summary, pages
+    are keyset paginated in the chosen sort order.
     """
 
 
@@ -24,10 +58,7 @@ def admin_products(request):
     if 'clear' in request.GET:
         return redirect('admin_products')
             
-    # products = Product.objects.filter(is_listed=True, category__is_active=True).order_by('name')
-    products = Product.objects.all().order_by('name')
-
-    products = products.annotate(total_stock=Sum('variants__stock'))
+    products = Product.objects.select_related('category', 'primary_image').defer('search_vector')
 
     #to get query parameters
     search_query = request.GET.get("search", "").strip()
@@ -47,15 +78,29 @@ def admin_products(request):
     elif filter_status == 'low-stock':
         products = products.filter(total_stock__lte=5)
 
-    
+    sort = request.GET.get("sort", "name")
+    if sort not in ADMIN_PRODUCT_SORTS:
+        sort = "name"
+
     #for pagination 
-    page_obj= get_pagination(request, products, per_page=5)
-    products = Product.objects.all().order_by('name')
-    
+    page_obj = get_pagination(
+        request, products, per_page=5, keyset=True, ordering=ADMIN_PRODUCT_SORTS[sort],
+        cached_count=True)
+
+    # kept on the sort and page links
+    query_params = urlencode({
+        key: value for key, value in
+        (("search", search_query), ("filter", filter_status)) if value})
+
     context = {
-        "product" : products,
         "active_page": "admin_products",
         "page_obj":page_obj,
+        "search_query": search_query,
+        "filter_status": filter_status,
+        "sort": sort,
+        "query_params": query_params,
+        # this very page, for the edit/add/toggle links to come back to
+        "grid_params": _grid_params(request.GET),
     }
 
     return render(request, 'product_management.html', context)
@@ -404,7 +449,7 @@ def add_product(request):
     """
     Handle both GET and POST requests for adding a new product
     """
-    current_page = request.GET.get('page', '1')
+    grid_params = _grid_params(request.GET)
     
     if request.method == 'POST':
         name = request.POST.get('name')
@@ -415,7 +460,7 @@ def add_product(request):
         
         if not name or not description or not category:
             messages.error(request, "Field inputs are missing!")
-            categories = Category.objects.all()
+            categories = get_category_tree().categories
             context = {
                 'form': {
                     'name': {'value': name},
@@ -424,12 +469,13 @@ def add_product(request):
                     'is_listed': {'value': is_listed},
                 },
                 'categories': categories,
+                'grid_params': grid_params,
             }
             return render(request, 'add_product.html', context)
         
         if not uploaded_images or len(uploaded_images) < 3:
             messages.error(request, "Please upload at least 3 product images.")
-            categories = Category.objects.all()
+            categories = get_category_tree().categories
             context = {
                 'form': {
                     'name': {'value': name},
@@ -438,6 +484,7 @@ def add_product(request):
                     'is_listed': {'value': is_listed},
                 },
                 'categories': categories,
+                'grid_params': grid_params,
             }
             return render(request, 'add_product.html', context)
             
@@ -454,11 +501,11 @@ def add_product(request):
                 ProductImage.objects.create(product=product, image=img)
             
             messages.success(request, f"Product '{name}' added successfully!")
-            return redirect(f"{reverse('admin_products')}?page={current_page}")
+            return redirect(admin_products_url(request.GET))
         
         except Exception as e:
             messages.error(request, f"An error occurred: {e}")
-            categories = Category.objects.all()
+            categories = get_category_tree().categories
             context = {
                 'form': {
                     'name': {'value': name},
@@ -467,14 +514,16 @@ def add_product(request):
                     'is_listed': {'value': is_listed},
                 },
                 'categories': categories,
+                'grid_params': grid_params,
             }
             return render(request, 'add_product.html', context)
     
     else:
-        categories = Category.objects.all()
+        categories = get_category_tree().categories
         context = {
             "form": {},
             "categories": categories,
+            "grid_params": grid_params,
         }
         return render(request, 'add_product.html', context)
 
@@ -484,14 +533,17 @@ def edit_product(request, product_id):
     Handle both GET and POST requests for editing an existing product.
     """
     product = get_object_or_404(Product, id=product_id)
-    current_page = request.GET.get('page', '1')
+    grid_params = _grid_params(request.GET)
 
     if request.method == 'POST':
         form = ProductForm(request.POST, instance=product)
         uploaded_images = request.FILES.getlist('images')
 
         if form.is_valid():
-            product = form.save()
+            product = form.save(commit=False)
+            # only what the form edits, the stock and price summaries on the
+            # row may be newer than the ones loaded with this product
+            product.save(update_fields=[*ProductForm.Meta.fields, 'slug', 'updated_at'])
 
             # Handle new image uploads
             if uploaded_images:
@@ -499,24 +551,26 @@ def edit_product(request, product_id):
                     ProductImage.objects.create(product=product, image=img)
 
             messages.success(request, f"Product '{product.name}' updated successfully!")
-            return redirect(f"{reverse('admin_products')}?page={current_page}")
+            return redirect(admin_products_url(request.GET))
         else:
             messages.error(request, "Please fix the errors below.")
-            categories = Category.objects.all()
+            categories = get_category_tree().categories
             context = {
                 "form": form,
                 "product": product,
                 "categories": categories,
+                "grid_params": grid_params,
             }
             return render(request, 'edit_product.html', context)
 
     else:
         form = ProductForm(instance=product)
-        categories = Category.objects.all()
+        categories = get_category_tree().categories
         context = {
             "form": form,
             "product": product,
             "categories": categories,
+            "grid_params": grid_params,
         }
         return render(request, 'edit_product.html', context)
 
@@ -597,12 +651,13 @@ def manage_attributes(request, product_id):
 def toggle_product_listing(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     product.is_listed = not product.is_listed
-    product.save()
+    # a plain UPDATE, no full_clean() queries for a flag
+    bulk_edit_catalog(product_ids=[product.id], listing='list' if product.is_listed else 'unlist')
 
     status = "listed" if product.is_listed else "unlisted"
     messages.success(request, f"Product '{product.name}' is now {status}.")
 
-    return redirect('admin_products')
+    return redirect(admin_products_url(request.GET))
 
 @require_POST
 def toggle_variant_listing(request, variant_id):
@@ -610,7 +665,7 @@ def toggle_variant_listing(request, variant_id):
     product = variant.product
 
     variant.is_listed = not variant.is_listed
-    variant.save()
+    bulk_edit_catalog(variant_ids=[variant.id], listing='list' if variant.is_listed else 'unlist')
 
     status = "listed" if variant.is_listed else "unlisted"
     messages.success(request, f"Variant '{variant.flavor}'-'{variant.weight}' is now {status}.")
@@ -619,6 +674,56 @@ def toggle_variant_listing(request, variant_id):
 
 
 
+@staff_member_required
+def bulk_edit_products(request):
+    """
+    Select many variants (or whole products) and change their prices, stock
+    or listing in one go. POST is the endpoint, answering JSON to AJAX calls.
+    """
+    is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+    if request.method == 'POST':
+        form = BulkEditForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            touched = bulk_edit_catalog(
+                variant_ids=data['variant_ids'],
+                product_ids=data['product_ids'],
+                price_action=data['price_action'] or None,
+                price_value=data['price_value'],
+                stock_delta=data['stock_delta'],
+                listing=data['listing'] or None,
+            )
+            if is_ajax:
+                return JsonResponse({"success": True, "products": touched})
+            messages.success(request, f"Updated {touched} product(s).")
+            return redirect(request.get_full_path())
+
+        if is_ajax:
+            return JsonResponse({"success": False, "errors": form.errors}, status=400)
+        for error in form.non_field_errors():
+            messages.error(request, error)
+    else:
+        form = BulkEditForm()
+
+    variants = ProductVariant.objects.select_related(
+        'product', 'flavor', 'weight').order_by('product__name', 'product_id', 'id')
+
+    search_query = request.GET.get("search", "").strip()
+    if search_query:
+        variants = variants.filter(product__name__icontains=search_query)
+
+    page_obj = get_pagination(request, variants, per_page=50, cached_count=True)
+
+    context = {
+        "form": form,
+        "page_obj": page_obj,
+        "search_query": search_query,
+        "active_page": "admin_products",
+    }
+    return render(request, "bulk_edit.html", context)
+
+
 def upload_product_images(request):
     if request.method == 'POST':
         product_id = request.POST.get('product')
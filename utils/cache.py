@@ -0,0 +1,28 @@
+from django.core.cache import cache
+
+
+def get_version(key):
+    """
+    Current value of a version counter shared by every worker process
+    through the cache, 0 until it is first bumped.
+    """
+    return cache.get(key, 0)
+
+
+def get_versions(keys):
+    """
+    {key: version} for many counters in one cache round trip.
+    """
+    found = cache.get_many(list(keys))
+    return {key: found.get(key, 0) for key in keys}
+
+
+def bump_version(key):
+    """
+    Move a version counter on, retiring everything cached under the old
+    value in every process. Counters never expire.
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image, ImageOps, features
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models.signals import post_init, post_save, post_delete
+
+logger = logging.getLogger(__name__)
+
+# rendition name -> width in pixels (never upscaled)
+RENDITION_WIDTHS = {
+    'thumb': 160,
+    'card': 480,
+    'zoom': 1400,
+}
+
+# tried in this order by browsers, skipped when Pillow can't encode them
+RENDITION_FORMATS = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 80, 'method': 4},
+}
+
+IMAGE_WORKERS = 2
+
+# (model label, field name) -> renditions generated for that field
+_tracked_fields = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available_formats():
+    return [fmt for fmt in RENDITION_FORMATS if features.check(fmt)]
+
+
+def rendition_name(name, size, fmt):
+    root, _ = os.path.splitext(name)
+    return f"renditions/{root}.{size}.{fmt}"
+
+
+def _ready_key(name):
+    return f"images:renditions_ready:{name}"
+
+
+def renditions_ready(name, sizes):
+    """
+    Whether the renditions of a stored file exist, remembered in the cache so
+    templates don't hit the storage on every render.
+    """
+    ready = cache.get(_ready_key(name))
+    if ready is None:
+        formats = available_formats()
+        ready = bool(sizes and formats) and default_storage.exists(
+            rendition_name(name, sizes[-1], formats[-1]))
+        # check again soon while the worker may still be busy
+        cache.set(_ready_key(name), ready, None if ready else 60)
+    return ready
+
+
+def generate_renditions(name, sizes):
+    """
+    Write every size/format rendition of a stored image.
+    """
+    with default_storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in ('LA', 'P', 'PA') else 'RGB')
+
+    for size in sizes:
+        width = RENDITION_WIDTHS[size]
+        resized = image
+        if image.width > width:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        for fmt in available_formats():
+            buffer = BytesIO()
+            resized.save(buffer, format=fmt.upper(), **RENDITION_FORMATS[fmt])
+
+            target = rendition_name(name, size, fmt)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+
+    cache.set(_ready_key(name), True, None)
+
+
+def delete_renditions(name, sizes):
+    for size in sizes:
+        for fmt in RENDITION_FORMATS:
+            target = rendition_name(name, size, fmt)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+    cache.delete(_ready_key(name))
+
+
+def _run(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception("Image rendition task %s%r failed", task.__name__, args)
+    finally:
+        # callbacks may have used the database from this worker thread
+        connections.close_all()
+
+
+def submit(task, *args):
+    """
+    Run an image task on the shared worker pool, off the request thread.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_WORKERS, thread_name_prefix='image-renditions')
+    return _executor.submit(_run, task, *args)
+
+
+def rendition_sizes(fieldfile):
+    """
+    Renditions generated for the field a FieldFile belongs to, or ().
+    """
+    instance = getattr(fieldfile, 'instance', None)
+    if instance is None:
+        return ()
+    return _tracked_fields.get((instance._meta.label_lower, fieldfile.field.name), ())
+
+
+def track_renditions(model, field_name, sizes, on_ready=None):
+    """
+    Generate renditions for an image field whenever a new file is saved, and
+    drop them with the file. `on_ready(pk)` runs in the worker afterwards,
+    e.g. to retire cached markup that still points at the original.
+    """
+    _tracked_fields[(model._meta.label_lower, field_name)] = tuple(sizes)
+    uid = f"renditions:{model._meta.label_lower}:{field_name}"
+
+    def stored_name(instance):
+        value = instance.__dict__.get(field_name)
+        return getattr(value, 'name', value) or ''
+
+    def generate(name, pk):
+        generate_renditions(name, sizes)
+        if on_ready:
+            on_ready(pk)
+
+    def remember(sender, instance, **kwargs):
+        instance.__dict__.setdefault('_rendition_sources', {})[field_name] = stored_name(instance)
+
+    def saved(sender, instance, **kwargs):
+        sources = instance.__dict__.setdefault('_rendition_sources', {})
+        previous = sources.get(field_name, '')
+        current = getattr(instance, field_name).name or ''
+
+        if current != previous:
+            if current:
+                transaction.on_commit(lambda: submit(generate, current, instance.pk))
+            if previous:
+                transaction.on_commit(lambda: submit(delete_renditions, previous, sizes))
+            sources[field_name] = current
+
+    def deleted(sender, instance, **kwargs):
+        name = getattr(instance, field_name).name
+        if name:
+            transaction.on_commit(lambda: submit(delete_renditions, name, sizes))
+
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+def tracked_fields():
+    return dict(_tracked_fields)
@@ -1,22 +1,257 @@
+from hashlib import md5
+from math import ceil
+from django.core import signing
+from django.core.cache import cache
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-def get_pagination(request, queryset, per_page=10):
+# how long a COUNT(*) for one filter signature is reused
+COUNT_CACHE_SECONDS = 60
+
+# below this many rows the planner estimate is not trusted, count exactly
+ESTIMATE_THRESHOLD = 10000
+
+CURSOR_SALT = 'utils.pagination.cursor'
+
+
+def _estimated_count(queryset):
+    """
+    Planner row estimate from pg_class, only for unfiltered querysets on
+    PostgreSQL. Returns None when an estimate can't be used.
+    """
+
+    query = queryset.query
+    connection = connections[queryset.db]
+
+    if connection.vendor != 'postgresql' or query.where or query.distinct:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+
+    if not row or row[0] < ESTIMATE_THRESHOLD:
+        return None
+    return row[0]
+
+
+def cached_count(queryset, timeout=COUNT_CACHE_SECONDS):
+    """
+    Count rows of a queryset, reusing the result for identical filters for
+    a short while, or the planner estimate for big unfiltered tables.
+    """
+
+    estimate = _estimated_count(queryset)
+    if estimate is not None:
+        return estimate
+
+    sql, params = queryset.query.sql_with_params()
+    key = "pagination:count:" + md5(f"{sql}{params!r}".encode()).hexdigest()
+
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose total comes from cached_count() instead of a fresh
+    COUNT(*) on every request.
+    """
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            return cached_count(self.object_list)
+        return len(self.object_list)
+
+    def page(self, number):
+        # slice by page size only, a slightly stale count must not cut rows
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+class KeysetPaginator:
+    """
+    Cursor based pagination over a fixed ordering, (-created_at, -id) by
+    default. Pages are fetched with a WHERE on the last row seen instead of
+    an OFFSET, so deep pages cost the same as the first one. The total is
+    exact unless use_cached_count asks for cached_count().
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), use_cached_count=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.use_cached_count = use_cached_count
+
+    @cached_property
+    def count(self):
+        if self.use_cached_count:
+            return cached_count(self.queryset)
+        return self.queryset.count()
+
+    @cached_property
+    def num_pages(self):
+        return max(ceil(self.count / self.per_page), 1)
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def _key(self, obj):
+        values = []
+        for field, _ in self._fields():
+            value = getattr(obj, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def _seek(self, key, forward):
+        """
+        Rows strictly after (or before) the key in the paginator's ordering.
+        """
+
+        condition = Q()
+        equal = {}
+        for (field, descending), value in zip(self._fields(), key):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f"{field}__{lookup}": value})
+            equal[field] = value
+        return self.queryset.filter(condition)
+
+    def encode_cursor(self, key, offset, forward):
+        # the ordering is signed in, a key is only comparable under its own
+        return signing.dumps(
+            {'k': key, 'o': offset, 'd': 'n' if forward else 'p', 's': list(self.ordering)},
+            salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """
+        (key, offset, forward) of a cursor, None for a bad one or one made
+        under another ordering (a ?sort= changed), which restarts the list.
+        """
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            key, offset, forward = data['k'], int(data['o']), data['d'] == 'n'
+            ordering = data['s']
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+        if ordering != list(self.ordering) or len(key) != len(self.ordering) or offset < 0:
+            return None
+        return key, offset, forward
+
+    def page(self, cursor=None):
+        decoded = self.decode_cursor(cursor) if cursor else None
+
+        if decoded is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            return KeysetPage(self, rows[:self.per_page], 0, False, has_next)
+
+        key, offset, forward = decoded
+
+        if forward:
+            rows = list(self._seek(key, True).order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            return KeysetPage(self, rows[:self.per_page], offset, True, has_next)
+
+        reverse_ordering = [
+            name[1:] if name.startswith('-') else f"-{name}" for name in self.ordering]
+        rows = list(self._seek(key, False).order_by(*reverse_ordering)[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        # the offset may have drifted if rows were added meanwhile
+        offset = max(offset - self.per_page, 0) if has_previous else 0
+        return KeysetPage(self, rows, offset, has_previous, True)
+
+
+class KeysetPage:
+    """
+    One page of a KeysetPaginator, exposing the parts of Django's Page the
+    templates use plus next/previous cursors.
+    """
+
+    def __init__(self, paginator, object_list, offset, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.offset = offset
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def number(self):
+        return self.offset // self.paginator.per_page + 1
+
+    def start_index(self):
+        return self.offset + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.offset + len(self.object_list)
+
+    def next_cursor(self):
+        if not self.has_next():
+            return ''
+        return self.paginator.encode_cursor(
+            self.paginator._key(self.object_list[-1]), self.end_index(), True)
+
+    def previous_cursor(self):
+        if not self.has_previous():
+            return ''
+        return self.paginator.encode_cursor(
+            self.paginator._key(self.object_list[0]), self.offset, False)
+
+
+def get_pagination(request, queryset, per_page=10, keyset=False, ordering=None, cached_count=False):
     """
     Resubale pagination function
     :param request: Django request object
     :param queryset: The queryset to paginate
     :param per_page: Number of items per page (default=10)
+    :param keyset: page with ?cursor= over (-created_at, -id) instead of ?page=
+    :param ordering: keyset ordering to use instead, ending in a unique field
+    :param cached_count: total from a short-lived cache or planner estimate
+        instead of COUNT(*), for big admin lists that can show a stale total
     :return: paginated queryset (page_obj)
     """
 
-    paginator = Paginator(queryset, per_page)
+    if keyset:
+        paginator = KeysetPaginator(
+            queryset, per_page, ordering or ('-created_at', '-id'), use_cached_count=cached_count)
+        return paginator.page(request.GET.get("cursor"))
+
+    paginator = (CachedCountPaginator if cached_count else Paginator)(queryset, per_page)
     page = request.GET.get("page",1)
-    
+
     try:
         page_obj = paginator.page(page)
     except PageNotAnInteger:
         page_obj = paginator.page(1)
     except EmptyPage:
         page_obj = paginator.page(paginator.num_pages)
-    
-    return page_obj
\ No newline at end of file
+
+    return page_obj
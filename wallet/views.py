@@ -3,7 +3,7 @@ from django.contrib import messages
 from decimal import Decimal
 from django.db.models import Sum
 from .models import Wallet, WalletTransaction
-from django.core.paginator import Paginator
+from utils.pagination import get_pagination
 from django.contrib.auth.decorators import login_required
 # Create your views here.
 
@@ -14,7 +14,7 @@ def wallet_detail(request):
     to get the wallet details of user and if not create one
     """
     wallet, _ = Wallet.objects.get_or_create(user=request.user)
-    transactions = wallet.transactions.order_by('-created_at')
+    transactions = wallet.transactions.order_by('-created_at', '-id')
 
     total_credits = wallet.transactions.filter(
         transaction_type='credit',
@@ -28,9 +28,7 @@ def wallet_detail(request):
 
     pending_counts = wallet.transactions.filter(status='pending').count()
 
-    paginator = Paginator(transactions, 10)
-    page_no = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_no)
+    page_obj = get_pagination(request, transactions, per_page=10, keyset=True)
 
     context = {
         'wallet': wallet,
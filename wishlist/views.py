@@ -88,7 +88,8 @@ class WishlistDetailView(LoginRequiredMixin, View):
             return render(request, "wishlist.html", {"items": []})
 
         wishlist, _ = Wishlist.objects.get_or_create(user=request.user)
-        items = wishlist.items.select_related("variant", "variant__product")
+        items = wishlist.items.select_related(
+            "variant", "variant__product", "variant__product__primary_image")
         context = {
             "wishlist": wishlist,
             "items": items